@@ -1,14 +1,31 @@
 import streamlit as st
 import cv2
 import time
-import json
-import requests
 import numpy as np
-import paho.mqtt.client as mqtt
-from ultralytics import YOLO
 import google.generativeai as genai  
 import datetime 
-import socket 
+import atexit
+import copy
+from esp32_stream import format_esp32_url
+from cameras import PRIMARY_CAMERA_ID, camera_id_from_name
+from inference_pool import InferencePool
+from backends import load_backend
+from model_cache import MODEL_CACHE
+from preview import PreviewEncoder
+from pipeline import CameraPipeline
+from telemetry import TelemetryDispatcher, format_values
+from outbox import TelemetryJournal
+from mqtt_link import MqttLink
+from sensors import SensorCache, variable_topic
+from scheduler import ScheduleEngine
+from autocontrol import AutoAcSettings
+from devices import DEFAULT_ROOM, DeviceRegistry
+from eventlog import EventLog
+from timeseries import TimeSeriesStore
+from rollups import RollupEngine
+from digest import ActivityDigest
+from assistant import AssistantClient
+from intents import INTENT_TRIGGERS, TEMPERATURE_RANGE, is_actionable, parse_command
 
 # === Konfigurasi Ubidots ===
 UBIDOTS_TOKEN = st.secrets["UBIDOTS_TOKEN"]
@@ -20,358 +37,664 @@ VARIABLE_AC = st.secrets["VARIABLE_AC"]
 VARIABLE_TEMPERATURE = st.secrets["VARIABLE_TEMPERATURE"]
 VARIABLE_DHT11 = st.secrets["VARIABLE_DHT11"]
 
+# Perangkat yang dikontrol; default satu lampu dan satu AC dari variabel di atas.
+# Perangkat lain (ruangan lain, lebih banyak lampu/AC) didaftarkan lewat [[DEVICES]] di secrets.
+PRIMARY_ROOM = st.secrets.get("PRIMARY_ROOM", DEFAULT_ROOM)  # Ruangan yang dipantau kamera utama
+DEVICE_CONFIG = [dict(device) for device in st.secrets.get("DEVICES", [])] or [
+    {"id": "light", "kind": "light", "name": "Lampu", "variable": VARIABLE_LIGHT, "room": PRIMARY_ROOM},
+    {"id": "ac", "kind": "ac", "name": "AC", "variable": VARIABLE_AC, "room": PRIMARY_ROOM,
+     "setpoint_variable": VARIABLE_TEMPERATURE, "setpoint": 25},
+]
+
 BROKER = st.secrets["BROKER"]
 PORT = int(st.secrets["PORT"])
+# Nilai numerik yang berubah <= dead-band tidak dikirim ulang, kecuali sebagai heartbeat
+TELEMETRY_DEADBAND = float(st.secrets.get("TELEMETRY_DEADBAND", 0.0))
+TELEMETRY_HEARTBEAT = float(st.secrets.get("TELEMETRY_HEARTBEAT", 300))
+# Telemetry yang gagal terkirim disimpan di sini dan dikirim ulang setelah koneksi kembali
+TELEMETRY_JOURNAL = st.secrets.get("TELEMETRY_JOURNAL", "data/telemetry-outbox.db")
+# Riwayat jumlah orang, suhu dan state perangkat (file harian, dihapus setelah masa retensi)
+TIMESERIES_DIR = st.secrets.get("TIMESERIES_DIR", "data/timeseries")
+TIMESERIES_RETENTION_DAYS = int(st.secrets.get("TIMESERIES_RETENTION_DAYS", 90))
+# Jadwal perangkat disimpan di sini dan dimuat ulang setelah restart
+SCHEDULES_FILE = st.secrets.get("SCHEDULES_FILE", "data/schedules.json")
+# Pengaturan kontrol otomatis AC (bersama semua session)
+AUTO_AC_FILE = st.secrets.get("AUTO_AC_FILE", "data/auto-ac.json")
+# Rentang grafik riwayat dan resolusi bucket rollup yang dipakai
+HISTORY_RANGES = {"24 Jam": ("minute", 86400), "7 Hari": ("hour", 7 * 86400), "30 Hari": ("day", 30 * 86400)}
 
 # === Gemini API Configuration ===
 GEMINI_API_KEY = st.secrets["GEMINI_API_KEY"]
 genai.configure(api_key=GEMINI_API_KEY)
+# Jawaban untuk pertanyaan dan state yang sama dipakai ulang selama TTL (detik)
+AI_RESPONSE_TTL = float(st.secrets.get("AI_RESPONSE_TTL", 300))
+AI_TIMEOUT = float(st.secrets.get("AI_TIMEOUT", 20))
+# Batas token ringkasan aktivitas di konteks AI
+AI_DIGEST_TOKENS = int(st.secrets.get("AI_DIGEST_TOKENS", 300))
+
+# === Pesan Log dan Riwayat Aktivitas ===
+# Log disimpan sebagai record (kode + field) di ring buffer; teks dibentuk
+# dari template ini hanya saat log atau riwayat aktivitas dibaca
+def _on_off(on):
+    return "dinyalakan" if on else "dimatikan"
+
+
+MESSAGES = {
+    # Log sistem
+    "inference_pool_failed": "❌ Worker inferensi gagal, memakai model lokal: {error}",
+    "backend_failed": "⚠️ Backend {backend} gagal dimuat: {error}",
+    "mqtt_error": "Error MQTT: {error}",
+    "gemini_setup_failed": "❌ Error saat menyiapkan Gemini: {error}",
+    "ai_error": "❌ Error AI: {error}",
+    "telemetry_queued": lambda values: f"📤 Antri ke Ubidots: {format_values(values)}",
+    "auto_ac_check": "🤖 Auto AC: Suhu={temperature}°C, Orang={people}",
+    "room_empty": "🤖 Ruangan kosong, mulai penghitung waktu",
+    "dht11_reading": "🌡️ Suhu DHT11: {temperature}°C ({source_name})",
+    "schedule_fired": lambda name, on, clock, late: f"🕒 Jadwal: {name} {_on_off(on)} ({clock}{', susulan' if late else ''})",
+    "camera_view_stopped": "⛔ Berhenti menampilkan ESP32-CAM",
+    "camera_url": "📡 URL ESP32 final: {url}",
+    "fps": "📈 FPS: {fps:.1f}",
+    "loop_error": "❌ Error: {error}",
+    "camera_error": "❌ Error pada sistem kamera: {error}",
+    # Riwayat aktivitas (konteks AI)
+    "telemetry_sent": lambda values: f"Kirim {format_values(values)} ke Ubidots",
+    "dht11_read": "Suhu DHT11 dibaca: {temperature}°C",
+    "schedule_activity": lambda name, on: f"{name} {_on_off(on)} otomatis sesuai jadwal",
+    "esp32_url_set": "URL ESP32-CAM diatur ke {url}",
+    "ac_auto_on": "🤖 AC dinyalakan otomatis (Suhu: {temperature}°C, Orang: {people})",
+    "ac_auto_off_empty": "🤖 AC dimatikan otomatis (ruangan kosong selama {minutes:.1f} menit)",
+    "ac_auto_off_cool": "🤖 AC dimatikan otomatis (suhu sudah dingin: {temperature}°C)",
+    "ac_auto_setpoint": "🤖 Suhu AC disesuaikan: {setpoint}°C (Orang: {people})",
+    "camera_added": "Kamera {name} ditambahkan",
+    "device_manual": lambda name, on: f"{name} {_on_off(on)} manual",
+    "setpoint_manual": "Suhu {name} diubah ke {setpoint}°C",
+    "room_bulk": lambda room, on: f"Semua perangkat {room} {_on_off(on)}",
+    "camera_started": "Kamera diaktifkan",
+    "camera_stopped": "Kamera dan lampu dimatikan",
+    "people_count": "Terdeteksi {count} orang",
+}
 
 # === Init State ===
-st.session_state.setdefault("log", [])
+st.session_state.setdefault("log", EventLog(MESSAGES, capacity=500))
 st.session_state.setdefault("camera_on", False)
-st.session_state.setdefault("lamp", 0)
 st.session_state.setdefault("count", 0)
 st.session_state.setdefault("last_sent", 0)
 st.session_state.setdefault("camera_option", "ESP32-CAM")  # Ubah default ke ESP32-CAM
 st.session_state.setdefault("esp32_url", "")
 st.session_state.setdefault("stop_clicks", 0)
-st.session_state.setdefault("activity_history", [])
+st.session_state.setdefault("activity_history", EventLog(MESSAGES, capacity=200, timestamps=True))
 st.session_state.setdefault("chat_history", [])
 st.session_state.setdefault("ai_enabled", False)
-st.session_state.setdefault("ac_power", 0)
-st.session_state.setdefault("ac_temperature", 25)
+st.session_state.setdefault("ai_last_input", "")   # Input terakhir yang sudah dikirim (rerun tidak mengirim ulang)
+st.session_state.setdefault("ai_pending", None)    # (Reply, input pengguna) yang sedang di-stream
 st.session_state.setdefault("current_temperature", 25.60)
-st.session_state.setdefault("schedules", {
-    "ac": {"enabled": False, "on_time": "07:00", "off_time": "22:00", "days": ["Sen", "Sel", "Rab", "Kam", "Jum"], "date_specific": False, "specific_date": None},
-    "light": {"enabled": False, "on_time": "18:00", "off_time": "06:00", "days": ["Sen", "Sel", "Rab", "Kam", "Jum", "Sab", "Min"], "date_specific": False, "specific_date": None}
-})
-st.session_state.setdefault("last_dht11_read", 0)
-st.session_state.setdefault("auto_ac_enabled", False)
-st.session_state.setdefault("auto_ac_temp_threshold", 27.0)  # Suhu ambang batas untuk menyalakan AC
-st.session_state.setdefault("auto_ac_people_threshold", 1)   # Minimal jumlah orang untuk menyalakan AC
-st.session_state.setdefault("auto_ac_empty_delay", 5)        # Tunda mematikan AC (menit) saat ruangan kosong
-st.session_state.setdefault("auto_ac_last_empty_time", None) # Waktu terakhir ruangan kosong
+st.session_state.setdefault("dht11_timestamp", 0)
+st.session_state.setdefault("extra_cameras", [])              # Kamera tambahan: {"name", "url", "variable"}
+st.session_state.setdefault("motion_gate_enabled", True)      # YOLO hanya jalan saat ada gerakan
+st.session_state.setdefault("motion_sensitivity", 5)          # 1 (kurang peka) - 10 (sangat peka)
+st.session_state.setdefault("motion_keepalive", 30)           # Deteksi keep-alive (detik) walau tanpa gerakan
+st.session_state.setdefault("motion_roi_x", (0, 100))         # ROI horizontal (%)
+st.session_state.setdefault("motion_roi_y", (0, 100))         # ROI vertikal (%)
+
+# === Layanan Inferensi YOLOv8 (proses terpisah) ===
+# INFERENCE_WORKERS = 0 menjalankan YOLO langsung di thread script seperti sebelumnya
+INFERENCE_WORKERS = int(st.secrets.get("INFERENCE_WORKERS", 1))
+INFERENCE_THREADS = int(st.secrets.get("INFERENCE_THREADS", 0)) or None  # Default: CPU dibagi rata
+# Backend: pytorch | onnxruntime | openvino (model ONNX/OpenVINO dibuat dengan model_export.py)
+INFERENCE_BACKEND = st.secrets.get("INFERENCE_BACKEND", "pytorch")
+INFERENCE_INT8 = bool(st.secrets.get("INFERENCE_INT8", False))
+INFERENCE_MODEL = st.secrets.get("INFERENCE_MODEL", None)  # Override path model
+# Budget bandwidth preview kamera per browser (KB/detik); kualitas JPEG menyesuaikan
+PREVIEW_BUDGET_KBPS = int(st.secrets.get("PREVIEW_BUDGET_KBPS", 250))
+
+
+@st.cache_resource(show_spinner="Menyiapkan worker inferensi YOLOv8...")
+def get_inference_pool(backend, model_path, int8, workers, threads):
+    # Satu pool per proses server, dipakai bersama oleh semua session
+    try:
+        pool = InferencePool(backend, model_path, int8=int8, workers=workers, threads_per_worker=threads).start()
+    except Exception as e:
+        return None, str(e)
+    atexit.register(pool.shutdown)
+    return pool, None
+
 
-# === Load YOLOv8 Model ===
-if "model" not in st.session_state:
-    st.session_state.model = YOLO("yolov8n.pt")
-model = st.session_state.model
+inference_pool = None
+if INFERENCE_WORKERS > 0:
+    inference_pool, pool_error = get_inference_pool(
+        INFERENCE_BACKEND, INFERENCE_MODEL, INFERENCE_INT8, INFERENCE_WORKERS, INFERENCE_THREADS
+    )
+    if pool_error and "inference_pool_error" not in st.session_state:
+        st.session_state.inference_pool_error = pool_error
+        st.session_state.log.add("inference_pool_failed", level="error", error=pool_error)
+
+# === Load YOLOv8 Model (fallback tanpa worker inferensi) ===
+# Model dipinjam dari cache proses: semua session berbagi satu instance yang
+# sudah di-warm-up oleh load_backend, bukan satu salinan per tab browser
+def acquire_detection_model():
+    key = ("yolo", INFERENCE_BACKEND, INFERENCE_MODEL, INFERENCE_INT8)
+    try:
+        return MODEL_CACHE.acquire(key, lambda: load_backend(INFERENCE_BACKEND, INFERENCE_MODEL, int8=INFERENCE_INT8))
+    except Exception as e:
+        # Backend pilihan tidak tersedia, kembali ke PyTorch
+        st.session_state.log.add("backend_failed", level="warning", backend=INFERENCE_BACKEND, error=str(e))
+        return MODEL_CACHE.acquire(("yolo", "pytorch", None, False), lambda: load_backend("pytorch"))
 
 
-# === MQTT Setup ===
-def on_connect(client, userdata, flags, rc):
-    if rc == 0:
-        st.session_state.log.append("✅ Terhubung ke Ubidots")
-    else:
-        st.session_state.log.append(f"❌ Gagal terhubung, kode: {rc}")
+# === Pipeline Kamera Bersama ===
+# Capture, motion gate, YOLO dan tracker berjalan sekali per proses server;
+# setiap session hanya berlangganan snapshot terbaru
+@st.cache_resource(show_spinner="Memuat model YOLOv8...")
+def get_camera_pipeline():
+    if inference_pool is not None:
+        return CameraPipeline(inference_pool=inference_pool)
+    return CameraPipeline(model_lease=acquire_detection_model())
 
 
-def on_message(client, userdata, msg):
-    try:
-        payload = json.loads(msg.payload)
-        val = payload.get("value", 0)
-        st.session_state.camera_on = bool(val)
-    except Exception as e:
-        st.session_state.log.append(f"Error MQTT: {e}")
+camera_pipeline = get_camera_pipeline()
 
 
-# === MQTT Setup with improved error handling ===
-def setup_mqtt():
-    try:
-        client = mqtt.Client()
-        client.username_pw_set(UBIDOTS_TOKEN, "")
-        client.on_connect = on_connect
-        client.on_message = on_message
-        
-        # Try to connect with timeout
+# === MQTT Setup ===
+# Satu koneksi MQTT per proses server (mqtt_link.py): status koneksi
+# diperbarui dari callback paho, menyambung ulang otomatis dengan backoff,
+# dan subscribe ulang setiap kali tersambung kembali.
+CAMERA_COMMAND_TOPIC = variable_topic(DEVICE_LABEL, VARIABLE_CAMERA)
+# Variabel sensor dari ESP32 yang diterima lewat MQTT (fallback poll HTTP)
+SENSOR_VARIABLES = [VARIABLE_DHT11]
+
+
+@st.cache_resource
+def get_mqtt_link():
+    topics = [CAMERA_COMMAND_TOPIC] + [variable_topic(DEVICE_LABEL, var) for var in SENSOR_VARIABLES]
+    link = MqttLink(BROKER, PORT, UBIDOTS_TOKEN, topics=topics).start()
+    atexit.register(link.stop)
+    return link
+
+
+@st.cache_resource
+def get_sensor_cache():
+    cache = SensorCache(get_mqtt_link(), DEVICE_LABEL, UBIDOTS_TOKEN, SENSOR_VARIABLES).start()
+    atexit.register(cache.stop)
+    return cache
+
+
+mqtt_link = get_mqtt_link()
+sensor_cache = get_sensor_cache()
+st.session_state.client = mqtt_link.client
+st.session_state.mqtt_connected = mqtt_link.is_connected()
+# Perintah kamera yang diterima sebelum session ini dibuka tidak diterapkan ulang
+st.session_state.setdefault("mqtt_camera_seq", mqtt_link.latest(CAMERA_COMMAND_TOPIC)[0])
+st.session_state.setdefault("mqtt_log_seq", 0)  # Session baru ikut melihat log koneksi yang masih disimpan
+
+
+def apply_mqtt_commands():
+    st.session_state.mqtt_log_seq, lines = mqtt_link.log_since(st.session_state.mqtt_log_seq)
+    st.session_state.log.extend(lines, source="mqtt")
+    st.session_state.mqtt_connected = mqtt_link.is_connected()
+    seq, payload, _ = mqtt_link.latest(CAMERA_COMMAND_TOPIC)
+    if seq > st.session_state.mqtt_camera_seq:
+        st.session_state.mqtt_camera_seq = seq
         try:
-            # Log the broker address for debugging
-            st.session_state.log.append(f"🔌 Mencoba terhubung ke broker: {BROKER}:{PORT}")
-            client.connect(BROKER, PORT, 10)  # Reduced timeout (10 seconds)
-            client.subscribe(f"/v2.0/devices/{DEVICE_LABEL}/{VARIABLE_CAMERA}")
-            client.loop_start()
-            return client
-        except socket.gaierror:
-            st.session_state.log.append("❌ Error: Tidak dapat menyelesaikan nama host broker MQTT")
-            st.error("Tidak dapat terhubung ke broker MQTT - periksa koneksi internet Anda")
-            return None
-        except socket.timeout:
-            st.session_state.log.append("❌ Error: Koneksi MQTT timeout")
-            st.error("Koneksi ke broker MQTT timeout - server mungkin tidak tersedia")
-            return None
+            st.session_state.camera_on = bool(payload.get("value", 0))
         except Exception as e:
-            st.session_state.log.append(f"❌ Error MQTT: {str(e)}")
-            st.error(f"Gagal terhubung ke broker MQTT: {str(e)}")
-            return None
-            
-    except Exception as e:
-        st.session_state.log.append(f"❌ Error saat inisialisasi MQTT: {str(e)}")
-        return None
+            st.session_state.log.add("mqtt_error", level="error", source="mqtt", error=str(e))
+
+
+apply_mqtt_commands()
+
+
+# === Riwayat Time-Series ===
+# Sampel ditulis ke disk dalam batch oleh thread penyimpanan, bukan oleh loop kamera
+@st.cache_resource
+def get_timeseries_store():
+    store = TimeSeriesStore(TIMESERIES_DIR, retention_days=TIMESERIES_RETENTION_DAYS)
+    atexit.register(store.stop)
+    return store
+
 
-# Update the session state initialization to handle failed MQTT connections
-if "client" not in st.session_state:
-    mqtt_client = setup_mqtt()
-    st.session_state.mqtt_connected = (mqtt_client is not None)
-    st.session_state.client = mqtt_client
-else:
-    st.session_state.mqtt_connected = (st.session_state.client is not None)
+timeseries_store = get_timeseries_store()
 
 
-st.session_state.setdefault("client", setup_mqtt())
+# Agregat menit/jam/hari diperbarui setiap sampel masuk; grafik riwayat hanya membaca bucket
+@st.cache_resource(show_spinner="Menyiapkan ringkasan riwayat...")
+def get_rollup_engine():
+    store = get_timeseries_store()
+    # Jeda tanpa sampel lebih dari beberapa keepalive berarti server mati, bukan nilai yang bertahan
+    engine = RollupEngine(max_hold=3 * store.keepalive)
+    engine.attach(store)
+    return engine
+
+
+rollup_engine = get_rollup_engine()
+
+
+# Ringkasan aktivitas per hari untuk konteks AI, dilipat dari setiap sampel, jadwal dan error
+@st.cache_resource
+def get_activity_digest():
+    store = get_timeseries_store()
+    # Interval yang terbuka saat server mati ditutup di sampel terakhirnya; state awal registry
+    # (dicatat saat start, lihat get_device_registry) menutup/membuka interval sesuai kenyataan
+    digest = ActivityDigest(max_hold=3 * store.keepalive)
+    digest.attach(store)
+    return digest
+
+
+activity_digest = get_activity_digest()
+if "activity_digest_attached" not in st.session_state:
+    st.session_state.log.add_listener(activity_digest.log_record)
+    st.session_state.activity_digest_attached = True
+
+
+# === Registry Perangkat ===
+# State perangkat disimpan per proses server (bukan per session), sehingga
+# semua browser, jadwal dan kontrol otomatis melihat state yang sama.
+@st.cache_resource
+def get_device_registry():
+    registry = DeviceRegistry.from_config(DEVICE_CONFIG)
+    # Setiap perubahan (manual, AI, jadwal, kontrol otomatis) tercatat di riwayat
+    store = get_timeseries_store()
+    registry.add_listener(lambda device, field, value: store.record(f"{field}/{device.device_id}", value))
+    # State awal saat start ikut dicatat (menutup nilai sebelum restart) lalu dicatat ulang berkala
+    state = {f"power/{device.device_id}": registry.power[device.index] for device in registry.devices()}
+    state.update({
+        f"setpoint/{device.device_id}": registry.setpoint[device.index]
+        for device in registry.devices() if device.setpoint_variable
+    })
+    for series in state:
+        store.keep(series)
+    store.record_many(state)
+    return registry
+
+
+device_registry = get_device_registry()
+# Lampu ruangan utama mengikuti jumlah orang dari kamera utama
+primary_lights = device_registry.devices(kind="light", room=PRIMARY_ROOM)
 
 
 # === Fungsi Kirim ke Ubidots ===
-def send_ubidots(var, val):
-    try:
-        # Check if MQTT client exists and is connected
-        if not st.session_state.mqtt_connected or st.session_state.client is None:
-            st.session_state.log.append(f"⚠️ MQTT tidak terhubung, mencoba mengirim dengan HTTP: {var}={val}")
-            
-            # Fallback to HTTP API if MQTT is not available
-            url = f"https://industrial.api.ubidots.com/api/v1.6/devices/{DEVICE_LABEL}/{var}/values"
-            payload = {"value": val}
-            headers = {"X-Auth-Token": UBIDOTS_TOKEN, "Content-Type": "application/json"}
-            
-            response = requests.post(url, json=payload, headers=headers)
-            if response.status_code == 201:
-                st.session_state.log.append(f"📤 HTTP: {var} = {val} berhasil")
-            else:
-                st.session_state.log.append(f"❌ HTTP error ({response.status_code}): {response.text}")
-        else:
-            # Use MQTT if connected
-            topic = f"/v2.0/devices/{DEVICE_LABEL}/{var}"
-            payload = json.dumps({"value": val})
-            st.session_state.client.publish(topic, payload)
-            st.session_state.log.append(f"📤 MQTT: {var} = {val}")
-
-        # Log activity for AI summary regardless of method
-        timestamp = time.strftime("%H:%M:%S", time.localtime())
-        activity = f"[{timestamp}] Kirim {var}={val} ke Ubidots"
-        st.session_state.activity_history.append(activity)
-        
-        # Store last sent time
-        st.session_state.last_sent = time.time()
-        
-    except Exception as e:
-        st.session_state.log.append(f"❌ Gagal kirim ke Ubidots: {e}")
+# Pengiriman dilakukan thread dispatcher bersama; fungsi ini hanya memasukkan
+# nilai ke antrian sehingga loop kamera tidak pernah menunggu jaringan
+@st.cache_resource
+def get_telemetry_dispatcher():
+    dispatcher = TelemetryDispatcher(
+        DEVICE_LABEL, UBIDOTS_TOKEN,
+        deadband=TELEMETRY_DEADBAND,
+        heartbeat=TELEMETRY_HEARTBEAT,
+        link=mqtt_link,
+        journal=TelemetryJournal(TELEMETRY_JOURNAL),
+    )
+    atexit.register(dispatcher.flush)
+    return dispatcher
+
+
+telemetry_dispatcher = get_telemetry_dispatcher()
+
+
+def send_ubidots_batch(values, force=False):
+    # values: {variabel: nilai}; digabung dengan update lain dan dikirim sebagai satu batch.
+    # force=True untuk perintah (kamera, perangkat) yang tidak boleh terfilter dead-band.
+    if not values:
+        return
+    accepted = telemetry_dispatcher.submit(values, force=force)
+    if not accepted:
+        return  # Semua nilai tidak berubah (di dalam dead-band)
+
+    # Pengiriman beruntun digabung menjadi satu record dengan hitungan pengulangan
+    st.session_state.log.add("telemetry_queued", source="telemetry", coalesce=True, values=accepted)
+
+    # Log activity for AI summary regardless of method
+    st.session_state.activity_history.add("telemetry_sent", source="telemetry", coalesce=True, values=accepted)
+    
+    # Store last sent time
+    st.session_state.last_sent = time.time()
+
+
+def send_ubidots(var, val, force=False):
+    send_ubidots_batch({var: val}, force=force)
+
+
+def control_devices(devices, on=None, setpoint=None, only_on=False):
+    # Jalur kontrol bersama (UI, perintah AI, kontrol otomatis): ubah state lalu
+    # kirim variabel yang berubah dalam satu batch
+    values = {}
+    if setpoint is not None:
+        values.update(device_registry.set_setpoint(devices, setpoint, only_on=only_on))
+    if on is not None:
+        values.update(device_registry.set_power(devices, on))
+    send_ubidots_batch(values, force=True)
+    return values
+
+
+def device_label(device):
+    # Nama ruangan ditampilkan untuk perangkat di luar ruangan utama
+    return device.name if device.room == PRIMARY_ROOM else f"{device.name} ({device.room})"
+
+
+# === Mesin Jadwal ===
+# Jadwal dijalankan thread scheduler bersama (scheduler.py) tepat pada waktu
+# transisinya, juga saat kamera mati atau tidak ada browser yang terbuka.
+# Nilai perangkat langsung dikirim ke dispatcher telemetry; session hanya
+# menyamakan log dan riwayat aktivitas dari event scheduler. Setiap session
+# hanya mengirim jadwal yang diubah di editornya, dan menyegarkan salinannya
+# saat jadwal diubah session lain.
+DEFAULT_SCHEDULES = {
+    "ac": {"enabled": False, "on_time": "07:00", "off_time": "22:00", "days": ["Sen", "Sel", "Rab", "Kam", "Jum"], "date_specific": False, "specific_date": None},
+    "light": {"enabled": False, "on_time": "18:00", "off_time": "06:00", "days": ["Sen", "Sel", "Rab", "Kam", "Jum", "Sab", "Min"], "date_specific": False, "specific_date": None}
+}
+
+
+@st.cache_resource
+def get_schedule_engine():
+    dispatcher = get_telemetry_dispatcher()
+    registry = get_device_registry()
+
+    def fire(device_id, action, values, fire_time):
+        dispatcher.submit(registry.set_power([registry.get(device_id)], action == "on"), force=True)
+        get_activity_digest().schedule(device_id, action, fire_time)
+
+    engine = ScheduleEngine(fire, path=SCHEDULES_FILE)
+    # Jadwal tersimpan dimuat sebelum session apa pun, transisi yang terlewat selama restart ikut dijalankan
+    engine.restore({device.device_id for device in registry.devices(capability="schedule")})
+    atexit.register(engine.stop)
+    return engine
+
+
+def load_schedules():
+    # Jadwal yang sedang berjalan di server, default untuk perangkat lain
+    revision = schedule_engine.revision()
+    schedules = {
+        device.device_id: copy.deepcopy(DEFAULT_SCHEDULES[device.kind])
+        for device in device_registry.devices(capability="schedule")
+    }
+    schedules.update(schedule_engine.schedules())
+    st.session_state.schedules = schedules
+    st.session_state.schedule_snapshot = copy.deepcopy(schedules)  # Jadwal sebelum diubah editor
+    st.session_state.schedule_revision = revision
+    # Key widget editor ikut berganti supaya widget menampilkan jadwal terbaru, bukan nilai lamanya
+    st.session_state.schedule_generation = st.session_state.get("schedule_generation", 0) + 1
+
+
+schedule_engine = get_schedule_engine()
+if "schedule_seq" not in st.session_state:
+    st.session_state.schedule_seq = schedule_engine.current_seq()
+if st.session_state.get("schedule_revision") != schedule_engine.revision():
+    load_schedules()
+
+
+def sync_schedules():
+    # Hanya jadwal yang diubah editor pada rerun ini yang dikirim, salinan lama session lain tidak menimpa
+    snapshot = st.session_state.schedule_snapshot
+    for device_id, schedule in st.session_state.schedules.items():
+        if device_id not in device_registry or schedule == snapshot.get(device_id):
+            continue
+        revision = schedule_engine.set(device_id, schedule)
+        snapshot[device_id] = copy.deepcopy(schedule)
+        if revision == st.session_state.schedule_revision + 1:
+            # Tidak ada perubahan lain di antaranya; session tidak perlu menyegarkan jadwal
+            st.session_state.schedule_revision = revision
 
 
 # === Setup Gemini Model ===
+GEMINI_MODEL_NAME = 'gemini-2.0-flash'
+
+
 def setup_gemini_model():
     # Create a Gemini model instance
     # Choose the model based on your needs (gemini-pro is text-only)
-    model = genai.GenerativeModel('gemini-2.0-flash')
+    model = genai.GenerativeModel(GEMINI_MODEL_NAME)
     return model
 
 
-if "gemini_model" not in st.session_state:
+if "gemini_lease" not in st.session_state:
     try:
-        st.session_state.gemini_model = setup_gemini_model()
+        st.session_state.gemini_lease = MODEL_CACHE.acquire(("gemini", GEMINI_MODEL_NAME), setup_gemini_model)
     except Exception as e:
-        st.session_state.log.append(f"❌ Error saat menyiapkan Gemini: {str(e)}")
-
-
-# === Extract IP from user input ===
-def extract_ip_address(text):
-    import re
-    # Pattern for IPv4 address with optional port (e.g., 192.168.1.1:81)
-    ip_pattern = r'\b(?:\d{1,3}\.){3}\d{1,3}(?::\d+)?\b'
-    matches = re.findall(ip_pattern, text)
-    if matches:
-        return matches[0]
-    return None
-
-
-# === Validate IP address ===
-def is_valid_ip_address(ip):
-    import re
-    # Basic validation for IPv4 address format
-    pattern = r'^(?:\d{1,3}\.){3}\d{1,3}(?::\d+)?$'
-    if not re.match(pattern, ip):
-        return False
-
-    # Check each octet is in valid range (0-255)
-    parts = ip.split(':')[0].split('.')
-    return all(0 <= int(part) <= 255 for part in parts)
+        st.session_state.log.add("gemini_setup_failed", level="error", source="ai", error=str(e))
 
 
 # === Fungsi AI Assistant dengan Gemini ===
-def generate_ai_response(prompt):
-    try:
-        # Create context with the activity history
-        context = """
-        Kamu adalah asisten AI untuk sistem IoT. Kamu dapat membantu:
-        1. Memberikan ringkasan aktivitas sistem
-        2. Mengontrol perangkat IoT seperti kamera dan lampu
-        3. Memberikan informasi tentang jumlah orang terdeteksi
-        4. Memberikan saran untuk pengaturan sistem
-        
-        Perangkat yang tersedia:
-        - Kamera (camera): on/off
-        - Lampu (lamp): on/off
-        - Sensor jumlah orang (people)
-        """
-
-        # Add activity history to context
-        if st.session_state.activity_history:
-            context += "\n\nRiwayat aktivitas terbaru:\n"
-            for activity in st.session_state.activity_history[-10:]:
-                context += f"- {activity}\n"
-
-        # Setup chat history for context
-        chat_history = []
-        if st.session_state.chat_history:
-            for msg in st.session_state.chat_history[-5:]:  # Last 5 messages for context
-                # Create content properly according to Gemini's requirements
-                content = [{"text": msg["content"]}]
-                role = "user" if msg["role"] == "user" else "model"
-                chat_history.append({"role": role, "parts": content})
-
-        # Add the latest context and prompt
-        messages = [
-            {"role": "user", "parts": [{"text": context}]},
-            {"role": "model", "parts": [{"text": "Saya mengerti konteks sistem IoT dan siap membantu."}]},
-        ]
-
-        # Add chat history if available
-        if chat_history:
-            messages.extend(chat_history)
-
-        # Add the current prompt
-        messages.append({"role": "user", "parts": [{"text": prompt}]})
-
-        # Generate response
-        response = st.session_state.gemini_model.generate_content(messages)
-
-        return response.text
-    except Exception as e:
-        return f"❌ Error AI: {str(e)}"
+# Cache jawaban dan panggilan yang sedang berjalan dipakai bersama semua session
+@st.cache_resource
+def get_assistant():
+    return AssistantClient(ttl=AI_RESPONSE_TTL, timeout=AI_TIMEOUT)
+
+
+assistant = get_assistant()
+
+
+# Kode riwayat aktivitas yang sudah terwakili di ringkasan aktivitas
+DIGEST_ACTIVITY_CODES = {"telemetry_sent", "people_count", "dht11_read", "schedule_activity"}
+
+
+def activity_digest_text():
+    labels = {device.device_id: device_label(device) for device in device_registry.devices()}
+    return activity_digest.render(labels, max_tokens=AI_DIGEST_TOKENS)
+
+
+def session_context():
+    # Bagian konteks milik session ini: aktivitas terbaru yang tidak tercakup ringkasan
+    # (telemetry, jumlah orang dan suhu sudah ada di ringkasan) dan 5 pesan chat terakhir
+    recent = [
+        st.session_state.activity_history.format(record)
+        for record in st.session_state.activity_history.records()
+        if record.code not in DIGEST_ACTIVITY_CODES
+    ][-5:]
+    turns = [(msg["role"], msg["content"]) for msg in st.session_state.chat_history[-5:]]
+    return recent, turns
+
+
+def build_ai_messages(prompt, history=True):
+    # Create context with the activity history
+    context = """
+    Kamu adalah asisten AI untuk sistem IoT. Kamu dapat membantu:
+    1. Memberikan ringkasan aktivitas sistem
+    2. Mengontrol perangkat IoT seperti kamera dan lampu
+    3. Memberikan informasi tentang jumlah orang terdeteksi
+    4. Memberikan saran untuk pengaturan sistem
+    
+    Perangkat yang tersedia:
+    - Kamera (camera): on/off
+    - Lampu (lamp): on/off
+    - AC: on/off dan suhu
+    - Sensor jumlah orang (people)
+    """
+
+    # State perangkat per ruangan dari registry
+    context += "\nState perangkat:\n" + "\n".join(f"- {line}" for line in device_registry.summary()) + "\n"
+
+    # Ringkasan hari ini dan kemarin (interval, suhu, jadwal, error) dengan batas token
+    context += "\n\nRingkasan aktivitas:\n" + activity_digest_text() + "\n"
+
+    # Tanpa history hanya state bersama yang dipakai, jadi jawabannya boleh dibagi antar session
+    recent, turns = session_context() if history else ([], [])
+    if recent:
+        context += "\nAktivitas terbaru:\n" + "".join(f"- {activity}\n" for activity in recent)
+
+    # Setup chat history for context
+    chat_history = []
+    for role, text in turns:
+        # Create content properly according to Gemini's requirements
+        content = [{"text": text}]
+        chat_history.append({"role": "user" if role == "user" else "model", "parts": content})
+
+    # Add the latest context and prompt
+    messages = [
+        {"role": "user", "parts": [{"text": context}]},
+        {"role": "model", "parts": [{"text": "Saya mengerti konteks sistem IoT dan siap membantu."}]},
+    ]
+
+    # Add chat history if available
+    if chat_history:
+        messages.extend(chat_history)
+
+    # Add the current prompt
+    messages.append({"role": "user", "parts": [{"text": prompt}]})
+    return messages
+
+
+def generate_ai_response(prompt, *state, history=True):
+    # Reply yang di-stream thread klien; kunci cache: prompt + state perangkat, orang, suhu (+ state tambahan).
+    # Dengan history, percakapan session ikut menjadi kunci supaya jawaban tidak terbawa ke session lain.
+    key = assistant.key(
+        prompt, device_registry.summary(), st.session_state.count,
+        st.session_state.current_temperature, st.session_state.camera_on, *state,
+        *(session_context() if history else ()),
+    )
+    lease = st.session_state.get("gemini_lease")
+    return assistant.ask(lease.model if lease else None, key, lambda: build_ai_messages(prompt, history))
 
 
 # === Generate Activity Summary ===
 def generate_activity_summary():
-    # This function generates a summary of recent system activities
-    try:
-        prompt = "Berikan ringkasan aktivitas sistem berdasarkan riwayat aktivitas terbaru."
-        return generate_ai_response(prompt)
-    except Exception as e:
-        return f"❌ Error saat menghasilkan ringkasan: {str(e)}"
+    # Ringkasan bergantung pada aktivitas hari ini, jadi teks ringkasan ikut menjadi bagian kunci cache;
+    # tanpa percakapan session sehingga satu jawaban dipakai bersama semua session
+    prompt = "Berikan ringkasan aktivitas sistem berdasarkan ringkasan aktivitas hari ini dan kemarin."
+    return generate_ai_response(prompt, activity_digest_text(), history=False)
+
+
+def poll_ai_reply(placeholder, wait=0.0):
+    # Tampilkan potongan jawaban yang sudah masuk; saat lengkap jalankan perintah dan
+    # simpan ke riwayat chat. Mengembalikan True selama jawaban masih di-stream.
+    pending = st.session_state.ai_pending
+    if pending is None:
+        return False
+    reply, user_input = pending
+    reply.wait(wait)
+    expired = assistant.expired(reply)
+    if not reply.done and not expired:
+        placeholder.markdown(f"**🤖 AI Assistant:** {reply.text()}▌")
+        return True
+
+    st.session_state.ai_pending = None
+    if reply.error is not None or expired:
+        error = reply.error if reply.error is not None else f"tidak ada jawaban dalam {assistant.timeout:.0f} detik"
+        st.session_state.log.add("ai_error", level="error", source="ai", error=str(error))
+        ai_response = f"❌ Error AI: {error}"
+    else:
+        ai_response = reply.text()
+
+    if user_input:
+        # Process any commands in the response, passing both user input and AI response
+        executed_cmds = process_ai_command(ai_response, user_input)
+        if executed_cmds:
+            ai_response += "\n\n*Tindakan yang dilakukan:*\n" + "\n".join([f"- {cmd}" for cmd in executed_cmds])
+
+    st.session_state.chat_history.append({"role": "assistant", "content": ai_response})
+    placeholder.markdown(f"**🤖 AI Assistant:** {ai_response}")
+    return False
 
 
 # === Process AI Commands ===
-def process_ai_command(response, user_input):
-    # Check for commands in the user input and AI response
-    commands = {
-        "camera_on": ["nyalakan kamera", "hidupkan kamera", "aktifkan kamera"],
-        "camera_off": ["matikan kamera", "nonaktifkan kamera"],
-        "lamp_on": ["nyalakan lampu", "hidupkan lampu"],
-        "lamp_off": ["matikan lampu", "padamkan lampu"],
-        "set_esp32_ip": ["gunakan ip", "alamat ip", "hubungkan ke ip", "gunakan esp32", "pakai esp32"],
-        # Tambahkan commands untuk AC
-        "ac_on": ["nyalakan ac", "hidupkan ac", "aktifkan ac"],
-        "ac_off": ["matikan ac", "nonaktifkan ac"],
-        "set_temp": ["atur suhu", "set suhu", "ubah suhu", "suhu ac"]
-    }
+def process_ai_command(response, user_input, command=None):
+    # command: hasil parse_command(user_input) jika sudah ada (jalur cepat tanpa AI).
+    # IP hanya diambil dari input pengguna; perintah lain dari input + jawaban AI.
+    command = command if command is not None else parse_command(user_input)
+    combined = parse_command(user_input + " " + response) if response else command
+
+    # Perintah perangkat: jenis perangkat dan aksi nyala/mati
+    device_commands = {"lamp_on": ("light", True), "lamp_off": ("light", False), "ac_on": ("ac", True), "ac_off": ("ac", False)}
 
-    combined_text = (user_input + " " + response).lower()
     executed_commands = []
+    updates = {}  # Semua perubahan dikirim ke Ubidots dalam satu batch
 
     # Check if there's an IP address in the user input
-    ip_address = extract_ip_address(user_input)
-    if ip_address and is_valid_ip_address(ip_address):
-        st.session_state.esp32_url = ip_address
+    if command.ip is not None:
+        st.session_state.esp32_url = command.ip
         st.session_state.camera_option = "ESP32-CAM"
-        executed_commands.append(f"URL ESP32-CAM diatur ke {ip_address}")
-        timestamp = time.strftime("%H:%M:%S", time.localtime())
-        st.session_state.activity_history.append(f"[{timestamp}] URL ESP32-CAM diatur ke {ip_address}")
-    elif any(keyword in user_input.lower() for keyword in ["ip", "alamat", "esp32"]):
+        executed_commands.append(f"URL ESP32-CAM diatur ke {command.ip}")
+        st.session_state.activity_history.add("esp32_url_set", source="ai", url=command.ip)
+    elif command.ip_hint:
         # Detected IP-related keywords but couldn't find valid IP
         executed_commands.append("Format IP address tidak valid. Gunakan format: 192.168.1.100")
 
     # Check for camera and other commands
-    for cmd, triggers in commands.items():
-        for trigger in triggers:
-            if trigger in combined_text:
-                if cmd == "camera_on" and not st.session_state.camera_on:
-                    st.session_state.camera_on = True
-                    send_ubidots(VARIABLE_CAMERA, 1)
-                    executed_commands.append("Kamera dinyalakan")
-                elif cmd == "camera_off" and st.session_state.camera_on:
-                    st.session_state.camera_on = False
-                    send_ubidots(VARIABLE_CAMERA, 0)
-                    executed_commands.append("Kamera dimatikan")
-                elif cmd == "lamp_on" and st.session_state.lamp == 0:
-                    st.session_state.lamp = 1
-                    send_ubidots(VARIABLE_LIGHT, 1)
-                    executed_commands.append("Lampu dinyalakan")
-                elif cmd == "lamp_off" and st.session_state.lamp == 1:
-                    st.session_state.lamp = 0
-                    send_ubidots(VARIABLE_LIGHT, 0)
-                    executed_commands.append("Lampu dimatikan")
-                # AC commands
-                elif cmd == "ac_on" and st.session_state.ac_power == 0:
-                    st.session_state.ac_power = 1
-                    send_ubidots(VARIABLE_AC, 1)
-                    send_ubidots(VARIABLE_TEMPERATURE, st.session_state.ac_temperature)
-                    executed_commands.append(f"AC dinyalakan (suhu: {st.session_state.ac_temperature}°C)")
-                elif cmd == "ac_off" and st.session_state.ac_power == 1:
-                    st.session_state.ac_power = 0
-                    send_ubidots(VARIABLE_AC, 0)
-                    executed_commands.append("AC dimatikan")
-                elif cmd == "set_temp":
-                    import re
-                    temp_match = re.search(r'(\d{1,2})(?:\s*)(derajat|°C|celsius)', combined_text.lower())
-                    if temp_match:
-                        new_temp = int(temp_match.group(1))
-                        if 16 <= new_temp <= 30:  # Range suhu AC yang umum
-                            st.session_state.ac_temperature = new_temp
-                            send_ubidots(VARIABLE_TEMPERATURE, new_temp)
-                            executed_commands.append(f"Suhu AC diatur ke {new_temp}°C")
-                        else:
-                            executed_commands.append("Suhu harus antara 16-30°C")
-                break
+    for cmd in INTENT_TRIGGERS:
+        if cmd not in combined.intents:
+            continue
+        if cmd == "camera_on" and not st.session_state.camera_on:
+            st.session_state.camera_on = True
+            updates[VARIABLE_CAMERA] = 1
+            executed_commands.append("Kamera dinyalakan")
+        elif cmd == "camera_off" and st.session_state.camera_on:
+            st.session_state.camera_on = False
+            updates[VARIABLE_CAMERA] = 0
+            executed_commands.append("Kamera dimatikan")
+        elif cmd in device_commands:
+            kind, on = device_commands[cmd]
+            targets = command_targets(kind, combined.text)
+            changed = device_registry.set_power(targets, on)
+            names = [device_label(device) for device in targets if device.variable in changed]
+            if names:
+                updates.update(changed)
+                detail = f" (suhu: {device_registry.setpoint_of(targets[0])}°C)" if on and kind == "ac" else ""
+                executed_commands.append(f"{', '.join(names)} {'dinyalakan' if on else 'dimatikan'}{detail}")
+        elif cmd == "set_temp" and combined.temperature is not None:
+            new_temp = combined.temperature
+            if TEMPERATURE_RANGE[0] <= new_temp <= TEMPERATURE_RANGE[1]:
+                updates.update(device_registry.set_setpoint(command_targets("ac", combined.text), new_temp))
+                executed_commands.append(f"Suhu AC diatur ke {new_temp}°C")
+            else:
+                executed_commands.append(f"Suhu harus antara {TEMPERATURE_RANGE[0]}-{TEMPERATURE_RANGE[1]}°C")
 
+    send_ubidots_batch(updates, force=True)
     return executed_commands
 
+
+def command_targets(kind, text):
+    # Ruangan yang disebut dalam perintah, "semua" untuk semua ruangan, selain itu ruangan utama
+    rooms = [room for room in device_registry.rooms() if room.lower() in text]
+    if rooms:
+        return [device for room in rooms for device in device_registry.devices(kind=kind, room=room)]
+    if "semua" in text:
+        return device_registry.devices(kind=kind)
+    return device_registry.devices(kind=kind, room=PRIMARY_ROOM)
+
 # === Fungsi Kontrol Otomatis AC ===
+# Pengaturan disimpan per proses seperti registry perangkat yang dikontrolnya,
+# jadi semua session menjalankan aturan yang sama terhadap AC yang sama
+@st.cache_resource
+def get_auto_ac_settings():
+    return AutoAcSettings(AUTO_AC_FILE)
+
+
+auto_ac = get_auto_ac_settings()
+
+
 def auto_control_ac():
-    if not st.session_state.auto_ac_enabled:
+    # AC di ruangan yang dipantau kamera utama
+    acs = device_registry.devices(kind="ac", room=PRIMARY_ROOM)
+    if not auto_ac.enabled or not acs:
         return
-    
+    ac_on = device_registry.any_on(acs)
+    ac_temperature = device_registry.setpoint_of(acs[0])
+
     current_temp = st.session_state.current_temperature
     people_count = st.session_state.count
-    threshold_temp = st.session_state.auto_ac_temp_threshold
-    people_threshold = st.session_state.auto_ac_people_threshold
+    threshold_temp = auto_ac.temp_threshold
+    people_threshold = auto_ac.people_threshold
     
     # Log untuk debugging
-    st.session_state.log.append(f"🤖 Auto AC: Suhu={current_temp}°C, Orang={people_count}")
+    st.session_state.log.add("auto_ac_check", source="auto_ac", coalesce=True, temperature=current_temp, people=people_count)
     
     # Kondisi untuk menyalakan AC: 
     # 1. Suhu ruangan melebihi ambang batas, DAN
     # 2. Ada orang dalam ruangan (jumlah >= threshold)
     if current_temp >= threshold_temp and people_count >= people_threshold:
-        if st.session_state.ac_power == 0:
+        if not ac_on:
             # Nyalakan AC jika belum menyala
-            st.session_state.ac_power = 1
-            
             # Atur suhu AC berdasarkan jumlah orang (semakin banyak orang, semakin dingin)
             # Base temperature 25°C, kurangi 0.5°C untuk setiap orang (minimal 18°C)
             dynamic_temp = max(18, 25 - (people_count * 0.5))
-            st.session_state.ac_temperature = int(dynamic_temp)
-            
+
             # Kirim ke Ubidots
-            send_ubidots(VARIABLE_AC, 1)
-            send_ubidots(VARIABLE_TEMPERATURE, st.session_state.ac_temperature)
+            control_devices(acs, on=True, setpoint=int(dynamic_temp))
             
             # Log aktivitas
-            timestamp = time.strftime("%H:%M:%S", time.localtime())
-            activity = f"[{timestamp}] AC dinyalakan otomatis (Suhu: {current_temp}°C, Orang: {people_count})"
-            st.session_state.activity_history.append(activity)
-            st.session_state.log.append(f"🤖 {activity}")
+            for event_log in (st.session_state.activity_history, st.session_state.log):
+                event_log.add("ac_auto_on", source="auto_ac", temperature=current_temp, people=people_count)
             
             # Reset waktu terakhir ruangan kosong
-            st.session_state.auto_ac_last_empty_time = None
+            auto_ac.empty_since = None
     
     # Kondisi untuk mematikan AC:
     # 1. Ruangan kosong (dengan delay), ATAU
@@ -379,402 +702,190 @@ def auto_control_ac():
     elif people_count < people_threshold:
         current_time = time.time()
         
-        # Catat waktu saat ruangan mulai kosong
-        if st.session_state.auto_ac_last_empty_time is None:
-            st.session_state.auto_ac_last_empty_time = current_time
-            st.session_state.log.append(f"🤖 Ruangan kosong, mulai penghitung waktu")
+        # Catat waktu saat ruangan mulai kosong (dari tracker jika tersedia, lebih akurat
+        # daripada waktu pemanggilan fungsi ini)
+        if auto_ac.empty_since is None:
+            auto_ac.empty_since = st.session_state.get("occupancy_empty_since") or current_time
+            st.session_state.log.add("room_empty", source="auto_ac")
         
         # Cek apakah sudah melewati delay
-        empty_time_minutes = (current_time - st.session_state.auto_ac_last_empty_time) / 60
-        if empty_time_minutes >= st.session_state.auto_ac_empty_delay and st.session_state.ac_power == 1:
+        empty_time_minutes = (current_time - auto_ac.empty_since) / 60
+        if empty_time_minutes >= auto_ac.empty_delay and ac_on:
             # Matikan AC setelah ruangan kosong selama delay yang ditentukan
-            st.session_state.ac_power = 0
-            send_ubidots(VARIABLE_AC, 0)
+            control_devices(acs, on=False)
             
             # Log aktivitas
-            timestamp = time.strftime("%H:%M:%S", time.localtime())
-            activity = f"[{timestamp}] AC dimatikan otomatis (ruangan kosong selama {empty_time_minutes:.1f} menit)"
-            st.session_state.activity_history.append(activity)
-            st.session_state.log.append(f"🤖 {activity}")
+            for event_log in (st.session_state.activity_history, st.session_state.log):
+                event_log.add("ac_auto_off_empty", source="auto_ac", minutes=empty_time_minutes)
     
-    elif current_temp < (threshold_temp - 2.0) and st.session_state.ac_power == 1:
+    elif current_temp < (threshold_temp - 2.0) and ac_on:
         # Matikan AC jika suhu sudah cukup dingin (threshold - 2°C)
-        st.session_state.ac_power = 0
-        send_ubidots(VARIABLE_AC, 0)
+        control_devices(acs, on=False)
         
         # Log aktivitas
-        timestamp = time.strftime("%H:%M:%S", time.localtime())
-        activity = f"[{timestamp}] AC dimatikan otomatis (suhu sudah dingin: {current_temp}°C)"
-        st.session_state.activity_history.append(activity)
-        st.session_state.log.append(f"🤖 {activity}")
+        for event_log in (st.session_state.activity_history, st.session_state.log):
+            event_log.add("ac_auto_off_cool", source="auto_ac", temperature=current_temp)
     
-    elif people_count >= people_threshold and st.session_state.ac_power == 1:
+    elif people_count >= people_threshold and ac_on:
         # Atur ulang suhu AC berdasarkan jumlah orang saat AC sudah menyala
         dynamic_temp = max(18, 25 - (people_count * 0.5))
         new_temp = int(dynamic_temp)
         
         # Hanya update jika ada perubahan
-        if new_temp != st.session_state.ac_temperature:
-            st.session_state.ac_temperature = new_temp
-            send_ubidots(VARIABLE_TEMPERATURE, new_temp)
+        if new_temp != ac_temperature:
+            control_devices(acs, setpoint=new_temp)
             
             # Log aktivitas
-            timestamp = time.strftime("%H:%M:%S", time.localtime())
-            activity = f"[{timestamp}] Suhu AC disesuaikan: {new_temp}°C (Orang: {people_count})"
-            st.session_state.activity_history.append(activity)
-            st.session_state.log.append(f"🤖 {activity}")
-
-# === Fungsi Streaming ESP32-CAM MJPEG ===
-def esp32_stream_generator(url):
-    st.session_state.log.append(f"🔄 Menghubungkan ke ESP32-CAM: {url}")
-    
-    # Pengaturan koneksi ultra-low-latency dengan header yang dioptimalkan
-    session = requests.Session()
-    session.headers.update({
-        'Connection': 'keep-alive',
-        'Accept': 'multipart/x-mixed-replace; boundary=frame',
-        'Cache-Control': 'no-cache, no-store, must-revalidate',
-        'Pragma': 'no-cache',
-        'Expires': '0',
-        'X-Requested-With': 'XMLHttpRequest'  # Mengurangi overhead HTTP
-    })
-    
-    # Strategi connection pooling yang lebih agresif
-    adapter = requests.adapters.HTTPAdapter(
-        pool_connections=2,
-        pool_maxsize=2,
-        max_retries=3,
-        pool_block=False
-    )
-    session.mount('http://', adapter)
-    
-    # Variabel monitoring
-    connection_attempts = 0
-    max_connection_attempts = 5
-    connection_backoff = 0.3  # Lebih cepat retry
-    stream_start_time = time.time()
-    max_stream_duration = 30  # Refresh koneksi setiap 30 detik untuk reliability
-    
-    while connection_attempts < max_connection_attempts and st.session_state.camera_on:
-        try:
-            # Timeout yang lebih agresif
-            timeout = (1.5, 1.5)  # (connect timeout, read timeout) - lebih agresif
-            
-            # Stream dengan buffer rendah
-            stream = session.get(url, stream=True, timeout=timeout)
-            
-            if stream.status_code != 200:
-                st.session_state.log.append(f"❌ Koneksi gagal: HTTP {stream.status_code}")
-                connection_attempts += 1
-                time.sleep(connection_backoff)
-                continue
-                
-            # Buffer minimal untuk low-latency
-            byte_buffer = bytearray()
-            last_frame_time = time.time()
-            frame_count = 0
-            last_successful_frame = time.time()
-            consecutive_empty_frames = 0
-            
-            # Pengaturan chunk size lebih kecil untuk responsivitas lebih baik
-            for chunk in stream.iter_content(chunk_size=1024):  # Chunk size yang lebih kecil
-                if not st.session_state.camera_on:
-                    break
-                    
-                # Refresh koneksi lebih sering
-                if time.time() - stream_start_time > max_stream_duration:
-                    st.session_state.log.append("🔄 ESP32-CAM connection refresh...")
-                    break
-                
-                if not chunk:
-                    consecutive_empty_frames += 1
-                    if consecutive_empty_frames > 2:  # Lebih agresif dalam reconnect
-                        break
-                    time.sleep(0.01)  # Tunggu sangat singkat
-                    continue
-                
-                consecutive_empty_frames = 0
-                byte_buffer.extend(chunk)
-                
-                # Optimized frame extraction dengan algoritma Boyer-Moore sederhana
-                start_idx = byte_buffer.find(b'\xff\xd8')
-                end_idx = byte_buffer.find(b'\xff\xd9')
-                
-                if start_idx != -1 and end_idx != -1 and start_idx < end_idx:
-                    frame_data = byte_buffer[start_idx:end_idx + 2]
-                    byte_buffer = byte_buffer[end_idx + 2:]  # Clear processed data
-                    
-                    try:
-                        # Decode optimized dengan opsi hardware acceleration
-                        frame = cv2.imdecode(
-                            np.frombuffer(frame_data, dtype=np.uint8),
-                            cv2.IMREAD_COLOR
-                        )
-                        
-                        if frame is not None and frame.size > 0:
-                            # Dynamic frame rate control - skip frames saat CPU load tinggi
-                            current_time = time.time()
-                            if current_time - last_successful_frame < 0.03:  # ~30fps limit
-                                continue
-                                
-                            # Pre-resize untuk performa
-                            frame = cv2.resize(frame, (320, 240), interpolation=cv2.INTER_AREA)
-                            
-                            last_successful_frame = current_time
-                            frame_count += 1
-                            
-                            # Performance metrics
-                            if frame_count % 10 == 0:
-                                fps = 10 / max(0.001, current_time - last_frame_time)
-                                last_frame_time = current_time
-                                if frame_count % 30 == 0:
-                                    st.session_state.log.append(f"📊 ESP32-CAM: {fps:.1f} FPS")
-                            
-                            yield frame
-                        else:
-                            # Handle invalid frame dengan cepat
-                            if time.time() - last_successful_frame > 0.5:  # Reduced timeout
-                                break
-                    
-                    except Exception as e:
-                        if time.time() - last_successful_frame > 0.5:
-                            break
-                
-                # Aggressive timeout untuk disconnection
-                if time.time() - last_successful_frame > 1.0:  # Reduced timeout
-                    break
-                
-                # Prevent buffer bloat dengan clearing agresif
-                if len(byte_buffer) > 8192:  # Reduced max buffer (8KB)
-                    byte_buffer = byte_buffer[-2048:]  # Keep only last 2KB
-            
-            # Close dan retry dengan efisien
-            stream.close()
-            
-            if st.session_state.camera_on:
-                connection_attempts += 1
-                time.sleep(connection_backoff)
-        
-        except requests.exceptions.Timeout:
-            connection_attempts += 1
-            time.sleep(connection_backoff)
-        
-        except Exception as e:
-            st.session_state.log.append(f"❌ Error: {str(e)[:40]}")
-            connection_attempts += 1
-            time.sleep(connection_backoff)
-    
-    # Cleanup
-    if 'stream' in locals():
-        try:
-            stream.close()
-        except:
-            pass
-    
-    if 'session' in locals():
-        try:
-            session.close()
-        except:
-            pass
-    
-    yield None
-    
-# === Format ESP32 URL ===
-def format_esp32_url(url):
-    # Format URL dengan benar untuk ESP32-CAM
-    if not url.startswith("http"):
-        url = "http://" + url
-
-    # Pastikan port 81 ada
-    if ":81" not in url:
-        # Hapus port lain jika ada
-        if ":" in url[8:]:  # 8 karakter = "http://" 
-            parts = url.split(":")
-            url = parts[0] + ":" + parts[1].split("/")[0]  # Ambil bagian host saja
-            url = url + ":81"
-        else:
-            url = url + ":81"
-
-    # Pastikan path /stream ada di akhir
-    if not url.endswith("/stream"):
-        # Hapus path lain jika ada
-        if "/" in url[8:] and ":" in url:
-            # Ambil base URL dengan port
-            base_parts = url.split("/")
-            url = base_parts[0] + "//" + base_parts[2]
-            if ":" not in url:
-                url = url + ":81"
-            url = url + "/stream"
-        else:
-            url = url + "/stream"
+            for event_log in (st.session_state.activity_history, st.session_state.log):
+                event_log.add("ac_auto_setpoint", source="auto_ac", setpoint=new_temp, people=people_count)
+
+# === Registry Kamera ===
+def camera_configs(primary_url):
+    # Kamera utama memakai VARIABLE_COUNT, kamera tambahan memakai variabel masing-masing
+    configs = {PRIMARY_CAMERA_ID: (primary_url, VARIABLE_COUNT, "Kamera Utama")}
+    for cam in st.session_state.extra_cameras:
+        configs[camera_id_from_name(cam["name"])] = (format_esp32_url(cam["url"]), cam["variable"], cam["name"])
+    return configs
+
+
+def motion_gate_roi():
+    x1, x2 = st.session_state.motion_roi_x
+    y1, y2 = st.session_state.motion_roi_y
+    if (x1, x2, y1, y2) == (0, 100, 0, 100):
+        return None
+    return (x1 / 100, y1 / 100, x2 / 100, y2 / 100)
 
-    return url
 
+def preview_encoder(camera_id):
+    # Satu encoder per session dan kamera: kualitas mengikuti laju update ke browser ini
+    encoders = st.session_state.setdefault("preview_encoders", {})
+    if camera_id not in encoders:
+        encoders[camera_id] = PreviewEncoder(budget_kbps=PREVIEW_BUDGET_KBPS)
+    return encoders[camera_id]
+
+
+def render_camera_frame(camera_id, name, camera, placeholder):
+    # Snapshot dari pipeline bersama: frame, JPEG asli, box tracker dan hitungan yang konsisten
+    snapshot = camera.snapshot
+    if snapshot.frame is None:
+        return
+    # Box hasil tracker (prediksi Kalman) dengan ID track yang stabil
+    boxes = snapshot.boxes.tolist()
+    # Tampilkan ROI motion gate jika tidak mencakup seluruh frame
+    roi = camera.motion_gate.roi if camera.motion_gate_enabled else None
+
+    def draw_overlay(frame):
+        for x1, y1, x2, y2, _, track_id in boxes:
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            cv2.putText(frame, f"#{track_id}", (x1 + 2, max(12, y1 - 4)),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 255, 0), 1)
+        if roi:
+            h, w = frame.shape[:2]
+            cv2.rectangle(frame, (int(roi[0] * w), int(roi[1] * h)), (int(roi[2] * w), int(roi[3] * h)), (255, 200, 0), 1)
+
+    # Tanpa box/ROI, JPEG asli dari kamera dikirim apa adanya; jumlah orang ada di caption
+    label = "Jumlah Orang" if camera_id == PRIMARY_CAMERA_ID else name
+    preview_encoder(camera_id).show(
+        placeholder, snapshot.frame, snapshot.jpeg,
+        overlay=draw_overlay if boxes or roi else None,
+        caption=f"{label}: {snapshot.count}",
+    )
 
-# === Add this helper function at the top level ===
-def optimize_frame_for_detection(frame):
-    """Ultra-optimized frame processing for detection"""
-    # Buat salinan frame untuk menghindari modifikasi asli
-    original_frame = frame.copy()
-    
-    # Resize dengan rasio aspect yang dipertahankan
-    height, width = frame.shape[:2]
-    target_size = 320  # Ukuran yang seimbang antara kecepatan dan akurasi
-    
-    # Hitung scale yang mempertahankan aspect ratio
-    scale = target_size / max(height, width)
-    new_height = int(height * scale)
-    new_width = int(width * scale)
-    
-    # Resize dengan metode yang tepat untuk kamera
-    detection_frame = cv2.resize(frame, (new_width, new_height), 
-                      interpolation=cv2.INTER_AREA)
-    
-    # Padding untuk membuat square (jika diperlukan YOLOv8)
-    if new_height != new_width:
-        top = bottom = max(0, (target_size - new_height) // 2)
-        left = right = max(0, (target_size - new_width) // 2)
-        detection_frame = cv2.copyMakeBorder(detection_frame, top, bottom, left, right, 
-                                  cv2.BORDER_CONSTANT, value=(0, 0, 0))
-    
-    # Pengurangan noise minimal dan selektif
-    # Menggunakan Gaussian Blur yang ringan hanya pada frame yang akan dideteksi
-    detection_frame = cv2.GaussianBlur(detection_frame, (3, 3), 0)
-    
-    return detection_frame, original_frame
 
-# === Fungsi Baca Data DHT11 ===
 def read_dht11_data():
-    try:
-        # Baca data dari Ubidots (DHT11 dikirim dari ESP32 ke Ubidots)
-        url = f"https://industrial.api.ubidots.com/api/v1.6/devices/{DEVICE_LABEL}/{VARIABLE_DHT11}/values/?token={UBIDOTS_TOKEN}"
-        response = requests.get(url)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if data.get("results") and len(data["results"]) > 0:
-                temperature = data["results"][0]["value"]
-                st.session_state.current_temperature = temperature
-                st.session_state.log.append(f"🌡️ Suhu DHT11: {temperature}°C")
-                
-                # Log activity for AI summary
-                timestamp = time.strftime("%H:%M:%S", time.localtime())
-                activity = f"[{timestamp}] Suhu DHT11 dibaca: {temperature}°C"
-                st.session_state.activity_history.append(activity)
-                
-                return temperature
-        return None
-    except Exception as e:
-        st.session_state.log.append(f"❌ Gagal membaca data DHT11: {e}")
+    # Baca suhu terakhir dari cache sensor (tanpa I/O jaringan); log hanya saat ada nilai baru
+    reading = sensor_cache.get(VARIABLE_DHT11)
+    if reading is None:
         return None
+    temperature, timestamp, source = reading
+    if timestamp > st.session_state.dht11_timestamp:
+        st.session_state.dht11_timestamp = timestamp
+        st.session_state.current_temperature = temperature
+        timeseries_store.record(f"temperature/{PRIMARY_ROOM}", temperature, timestamp)
+        st.session_state.log.add("dht11_reading", source="sensor", coalesce=True, temperature=temperature, source_name=source)
+
+        # Log activity for AI summary
+        st.session_state.activity_history.add("dht11_read", source="sensor", coalesce=True, temperature=temperature)
+    return temperature
+
+# === Fungsi Terapkan Event Jadwal ===
+def apply_schedule_events():
+    st.session_state.schedule_seq, events = schedule_engine.events_since(st.session_state.schedule_seq)
+    # State perangkat sudah diubah thread scheduler; session hanya mencatat log
+    for _, device_id, action, fire_time, late in events:
+        name = device_label(device_registry.get(device_id))
+        fire_clock = time.strftime("%H:%M", time.localtime(fire_time))
+        st.session_state.log.add("schedule_fired", source="schedule", name=name, on=action == "on", clock=fire_clock, late=late)
+
+        # Log activity for AI summary
+        st.session_state.activity_history.add("schedule_activity", source="schedule", name=name, on=action == "on")
+
+
+apply_schedule_events()
+
+
+# === Editor Jadwal Perangkat ===
+def schedule_editor(device):
+    schedule = st.session_state.schedules[device.device_id]
+    key = f"schedule_{device.device_id}_{st.session_state.schedule_generation}"
+
+    # Enable/disable schedule
+    schedule["enabled"] = st.checkbox(f"Aktifkan Jadwal {device.name}", value=schedule["enabled"], key=f"{key}_enabled")
+
+    # Schedule type selector
+    schedule_type = st.radio("Tipe Jadwal:",
+                             ["Harian", "Mingguan", "Tanggal Spesifik"],
+                             horizontal=True,
+                             index=2 if schedule.get("date_specific") else 1 if schedule.get("days") else 0,
+                             key=f"{key}_type")
+
+    # Update schedule type based on selection
+    schedule["date_specific"] = (schedule_type == "Tanggal Spesifik")
+
+    # Day selection for weekly schedule
+    if schedule_type == "Mingguan":
+        days_options = ["Sen", "Sel", "Rab", "Kam", "Jum", "Sab", "Min"]
+        schedule["days"] = st.multiselect("Pilih Hari",
+                                          days_options,
+                                          default=schedule.get("days") or days_options,
+                                          key=f"{key}_days")
+    elif schedule_type == "Harian":
+        schedule["days"] = []
+
+    # Date selection for specific date schedule
+    elif schedule_type == "Tanggal Spesifik":
+        schedule["days"] = []  # Sisa hari mingguan tidak boleh membuat jadwal terbaca sebagai Mingguan
+        schedule["specific_date"] = st.date_input("Pilih Tanggal",
+                                                  value=schedule.get("specific_date") or datetime.date.today(),
+                                                  key=f"{key}_date")
+
+    # Time selection
+    on_col, off_col = st.columns(2)
+    with on_col:
+        # Convert string time to datetime.time object
+        on_hour, on_minute = map(int, schedule["on_time"].split(":"))
+        on_time_input = st.time_input(f"Waktu Nyala {device.name}", value=datetime.time(hour=on_hour, minute=on_minute), key=f"{key}_on")
+        # Convert back to string format
+        schedule["on_time"] = f"{on_time_input.hour:02d}:{on_time_input.minute:02d}"
+
+    with off_col:
+        off_hour, off_minute = map(int, schedule["off_time"].split(":"))
+        off_time_input = st.time_input(f"Waktu Mati {device.name}", value=datetime.time(hour=off_hour, minute=off_minute), key=f"{key}_off")
+        schedule["off_time"] = f"{off_time_input.hour:02d}:{off_time_input.minute:02d}"
+
 
-# === Fungsi Cek dan Jalankan Jadwal ===
-def check_and_run_schedules():
-    # Get current time and date info
-    current_time = time.strftime("%H:%M")
-    current_date = datetime.date.today()
-    # Get day of week (0 is Monday in Python's datetime)
-    day_idx = datetime.datetime.now().weekday()
-    day_names = ["Sen", "Sel", "Rab", "Kam", "Jum", "Sab", "Min"]
-    current_day = day_names[day_idx]
-    
-    # Cek jadwal AC
-    if st.session_state.schedules["ac"]["enabled"]:
-        ac_on_time = st.session_state.schedules["ac"]["on_time"]
-        ac_off_time = st.session_state.schedules["ac"]["off_time"]
-        should_run_ac_schedule = False
-        
-        # Check if schedule should run based on day/date setting
-        if st.session_state.schedules["ac"]["date_specific"]:
-            # Specific date scheduling
-            specific_date = st.session_state.schedules["ac"]["specific_date"]
-            # Check if today matches the specific date
-            if specific_date and current_date == specific_date:
-                should_run_ac_schedule = True
-        elif st.session_state.schedules["ac"].get("days"):
-            # Weekly scheduling (specific days)
-            if current_day in st.session_state.schedules["ac"]["days"]:
-                should_run_ac_schedule = True
-        else:
-            # Daily scheduling (every day)
-            should_run_ac_schedule = True
-            
-        # Run schedule if conditions are met
-        if should_run_ac_schedule:
-            # Logika untuk menyalakan/mematikan AC berdasarkan jadwal
-            if current_time == ac_on_time and st.session_state.ac_power == 0:
-                st.session_state.ac_power = 1
-                send_ubidots(VARIABLE_AC, 1)
-                send_ubidots(VARIABLE_TEMPERATURE, st.session_state.ac_temperature)
-                st.session_state.log.append(f"🕒 Jadwal: AC dinyalakan ({current_time})")
-                
-                # Log activity for AI summary
-                timestamp = time.strftime("%H:%M:%S", time.localtime())
-                activity = f"[{timestamp}] AC dinyalakan otomatis sesuai jadwal"
-                st.session_state.activity_history.append(activity)
-                
-            elif current_time == ac_off_time and st.session_state.ac_power == 1:
-                st.session_state.ac_power = 0
-                send_ubidots(VARIABLE_AC, 0)
-                st.session_state.log.append(f"🕒 Jadwal: AC dimatikan ({current_time})")
-                
-                # Log activity for AI summary
-                timestamp = time.strftime("%H:%M:%S", time.localtime())
-                activity = f"[{timestamp}] AC dimatikan otomatis sesuai jadwal"
-                st.session_state.activity_history.append(activity)
-    
-    # Cek jadwal Lampu - similar logic as AC
-    if st.session_state.schedules["light"]["enabled"]:
-        light_on_time = st.session_state.schedules["light"]["on_time"]
-        light_off_time = st.session_state.schedules["light"]["off_time"]
-        should_run_light_schedule = False
-        
-        # Check if schedule should run based on day/date setting
-        if st.session_state.schedules["light"]["date_specific"]:
-            # Specific date scheduling
-            specific_date = st.session_state.schedules["light"]["specific_date"]
-            # Check if today matches the specific date
-            if specific_date and current_date == specific_date:
-                should_run_light_schedule = True
-        elif st.session_state.schedules["light"].get("days"):
-            # Weekly scheduling (specific days)
-            if current_day in st.session_state.schedules["light"]["days"]:
-                should_run_light_schedule = True
-        else:
-            # Daily scheduling (every day)
-            should_run_light_schedule = True
-            
-        # Run schedule if conditions are met
-        if should_run_light_schedule:
-            # Logika untuk menyalakan/mematikan lampu berdasarkan jadwal
-            if current_time == light_on_time and st.session_state.lamp == 0:
-                st.session_state.lamp = 1
-                send_ubidots(VARIABLE_LIGHT, 1)
-                st.session_state.log.append(f"🕒 Jadwal: Lampu dinyalakan ({current_time})")
-                
-                # Log activity for AI summary
-                timestamp = time.strftime("%H:%M:%S", time.localtime())
-                activity = f"[{timestamp}] Lampu dinyalakan otomatis sesuai jadwal"
-                st.session_state.activity_history.append(activity)
-                
-            elif current_time == light_off_time and st.session_state.lamp == 1:
-                st.session_state.lamp = 0
-                send_ubidots(VARIABLE_LIGHT, 0)
-                st.session_state.log.append(f"🕒 Jadwal: Lampu dimatikan ({current_time})")
-                
-                # Log activity for AI summary
-                timestamp = time.strftime("%H:%M:%S", time.localtime())
-                activity = f"[{timestamp}] Lampu dimatikan otomatis sesuai jadwal"
-                st.session_state.activity_history.append(activity)
-                
 # Info jadwal - improved display with advanced scheduling info
-def format_schedule_info(device_type):
-    schedule = st.session_state.schedules[device_type]
+def format_schedule_info(device_id):
+    schedule = st.session_state.schedules[device_id]
     if not schedule["enabled"]:
         return "Nonaktif"
         
     time_info = f"Nyala: {schedule['on_time']}, Mati: {schedule['off_time']}"
     
+    upcoming = schedule_engine.next_fire(device_id)
+    if upcoming is not None:
+        time_info += f", berikutnya {'nyala' if upcoming[1] == 'on' else 'mati'} {upcoming[0].strftime('%d/%m %H:%M')}"
+
     if schedule["date_specific"]:
         date_str = schedule["specific_date"].strftime("%d/%m/%Y") if schedule["specific_date"] else "belum dipilih"
         return f"Aktif - Tanggal {date_str} ({time_info})"
@@ -783,9 +894,59 @@ def format_schedule_info(device_type):
     else:
         return f"Aktif - Setiap hari ({time_info})"
 
+
+# === Grafik Riwayat ===
+# Grafik yang diperbarui dari loop kamera: [chart, kolom, resolusi, awal bucket berikutnya]
+history_charts = []
+
+
+def bucket_values(rows, field):
+    if field == "mean":
+        # Rata-rata berbobot waktu; bucket tanpa durasi (hanya satu sampel) memakai nilainya
+        return np.where(rows["covered"] > 0, rows["integral"] / np.maximum(rows["covered"], 1e-9), rows["min"])
+    if field == "hours":
+        return rows["integral"] / 3600  # Seri power 0/1: detik nyala
+    return rows[field].astype(np.float64)
+
+
+def history_table(columns, resolution, start, closed_only=False):
+    # columns: {label: (seri, "mean"/"min"/"max"/"hours")}; seri dengan bucket berbeda disejajarkan
+    buckets = {label: (rollup_engine.buckets(series, resolution, start, closed_only=closed_only), field)
+               for label, (series, field) in columns.items()}
+    starts = np.unique(np.concatenate([rows["start"] for rows, _ in buckets.values()] or [np.zeros(0)]))
+    table = {"Waktu": [datetime.datetime.fromtimestamp(t) for t in starts]}
+    for label, (rows, field) in buckets.items():
+        column = np.full(len(starts), np.nan)
+        column[np.searchsorted(starts, rows["start"])] = bucket_values(rows, field)
+        table[label] = column
+    next_start = starts[-1] + rollup_engine.resolutions[resolution] if len(starts) else start
+    return table, next_start
+
+
+def history_chart(columns, resolution, start, live=False, chart=st.line_chart):
+    # live: hanya bucket tertutup, bucket berikutnya ditambahkan lewat append_history_rows()
+    table, next_start = history_table(columns, resolution, start, closed_only=live)
+    if not table["Waktu"]:
+        st.caption("Belum ada riwayat")
+        return
+    element = chart(table, x="Waktu", height=220)
+    if live:
+        history_charts.append([element, columns, resolution, next_start])
+
+
+def append_history_rows():
+    # Bucket yang baru tertutup ditambahkan ke grafik tanpa menggambar ulang seluruh riwayat
+    for entry in history_charts:
+        element, columns, resolution, start = entry
+        table, entry[3] = history_table(columns, resolution, start, closed_only=True)
+        if table["Waktu"]:
+            element.add_rows(table)
+
 # === UI ===
 st.title("🔆SAKLAR: Smart Automated Kinetics for Lighting & Air Regulation❄️")
 
+ai_placeholder = None
+
 # Create tabs for different functionality
 tab1, tab2, tab3 = st.tabs(["Kamera & Deteksi", "AC & Jadwal", "AI Assistant"])
 
@@ -800,53 +961,132 @@ with tab1:
     status_placeholder = st.empty()
     detail_placeholder = st.empty()
 
+    # Kamera tambahan untuk ruangan lain, dideteksi dalam batch yang sama
+    with st.expander("📷 Kamera Tambahan (Multi-Ruangan)", expanded=False):
+        cam_col1, cam_col2, cam_col3 = st.columns(3)
+        with cam_col1:
+            new_camera_name = st.text_input("Nama Ruangan", key="new_camera_name")
+        with cam_col2:
+            new_camera_url = st.text_input("URL IP ESP32-CAM", key="new_camera_url")
+        with cam_col3:
+            new_camera_variable = st.text_input("Variabel Ubidots", key="new_camera_variable",
+                                                help="Kosongkan untuk memakai jumlah-orang-<nama ruangan>")
+
+        if st.button("➕ Tambah Kamera"):
+            new_camera_id = camera_id_from_name(new_camera_name)
+            existing_ids = {camera_id_from_name(cam["name"]) for cam in st.session_state.extra_cameras}
+            if not new_camera_id or not new_camera_url.strip():
+                st.error("⚠️ Nama ruangan dan URL kamera harus diisi!")
+            elif new_camera_id == PRIMARY_CAMERA_ID or new_camera_id in existing_ids:
+                st.error("⚠️ Nama ruangan sudah dipakai")
+            else:
+                st.session_state.extra_cameras.append({
+                    "name": new_camera_name.strip(),
+                    "url": new_camera_url.strip(),
+                    "variable": new_camera_variable.strip() or f"jumlah-orang-{new_camera_id}",
+                })
+                st.session_state.activity_history.add("camera_added", source="ui", name=new_camera_name.strip())
+
+        for cam in list(st.session_state.extra_cameras):
+            info_col, remove_col = st.columns([4, 1])
+            with info_col:
+                st.caption(f"**{cam['name']}** — `{cam['url']}` → `{cam['variable']}`")
+            with remove_col:
+                if st.button("🗑️", key=f"remove_camera_{camera_id_from_name(cam['name'])}"):
+                    st.session_state.extra_cameras.remove(cam)
+                    st.rerun()
+
+    # Motion gate: lewati YOLO saat ruangan statis untuk menghemat CPU
+    with st.expander("🏃 Motion Gate (Hemat CPU)", expanded=False):
+        st.toggle("Aktifkan Motion Gate", key="motion_gate_enabled",
+                  help="YOLO hanya dijalankan saat ada gerakan, hitungan terakhir dipertahankan saat ruangan statis")
+        gate_col1, gate_col2 = st.columns(2)
+        with gate_col1:
+            st.slider("Sensitivitas Gerakan", min_value=1, max_value=10, key="motion_sensitivity")
+            st.slider("ROI Horizontal (%)", min_value=0, max_value=100, key="motion_roi_x")
+        with gate_col2:
+            st.slider("Keep-alive Deteksi (detik)", min_value=5, max_value=300, key="motion_keepalive",
+                      help="YOLO tetap dijalankan berkala walaupun tidak ada gerakan")
+            st.slider("ROI Vertikal (%)", min_value=0, max_value=100, key="motion_roi_y")
+
+    extra_camera_placeholders = {}
+    if st.session_state.extra_cameras:
+        extra_cols = st.columns(min(3, len(st.session_state.extra_cameras)))
+        for i, cam in enumerate(st.session_state.extra_cameras):
+            with extra_cols[i % len(extra_cols)]:
+                extra_camera_placeholders[camera_id_from_name(cam["name"])] = st.empty()
+
 with tab2:
     st.header("🌡️ Kontrol AC & Penjadwalan")
     
     # Tampilkan suhu dari DHT11
+    read_dht11_data()
     temp_col, refresh_col = st.columns([3, 1])
     with temp_col:
         st.subheader(f"Suhu Ruangan: {st.session_state.current_temperature}°C")
     with refresh_col:
         if st.button("🔄 Refresh"):
-            read_dht11_data()
+            # Poll ulang di background; nilai baru tampil saat tersedia
+            sensor_cache.refresh()
     
     # Kontrol AC
     st.subheader("Kontrol AC")
-    ac_col1, ac_col2 = st.columns(2)
-    
-    with ac_col1:
-        ac_state = st.toggle("AC Power", value=bool(st.session_state.ac_power))
-        if ac_state != bool(st.session_state.ac_power):
-            st.session_state.ac_power = 1 if ac_state else 0
-            send_ubidots(VARIABLE_AC, st.session_state.ac_power)
-            
-            # Log activity
-            timestamp = time.strftime("%H:%M:%S", time.localtime())
-            activity = f"[{timestamp}] AC {'dinyalakan' if ac_state else 'dimatikan'} manual"
-            st.session_state.activity_history.append(activity)
-    
-    with ac_col2:
-        new_temp = st.slider("Suhu AC", min_value=16, max_value=30, value=st.session_state.ac_temperature)
-        if new_temp != st.session_state.ac_temperature:
-            st.session_state.ac_temperature = new_temp
-            if st.session_state.ac_power == 1:
-                send_ubidots(VARIABLE_TEMPERATURE, new_temp)
-                
+    all_acs = device_registry.devices(kind="ac")
+    if len(all_acs) > 1:
+        selected_ac = st.selectbox("Pilih AC", all_acs, format_func=device_label, key="selected_ac")
+    else:
+        selected_ac = all_acs[0] if all_acs else None
+
+    if selected_ac is not None:
+        ac_col1, ac_col2 = st.columns(2)
+
+        with ac_col1:
+            ac_power = device_registry.is_on(selected_ac)
+            # State ikut di key widget: perubahan dari jadwal/kontrol otomatis/session lain membuat widget baru
+            ac_state = st.toggle("AC Power", value=ac_power, key=f"power_{selected_ac.device_id}_{int(ac_power)}")
+            if ac_state != ac_power:
+                control_devices([selected_ac], on=ac_state)
+
                 # Log activity
-                timestamp = time.strftime("%H:%M:%S", time.localtime())
-                activity = f"[{timestamp}] Suhu AC diubah ke {new_temp}°C"
-                st.session_state.activity_history.append(activity)
+                st.session_state.activity_history.add("device_manual", source="ui", name=device_label(selected_ac), on=ac_state)
+
+        with ac_col2:
+            ac_temperature = device_registry.setpoint_of(selected_ac)
+            new_temp = st.slider("Suhu AC", min_value=16, max_value=30, value=ac_temperature, key=f"setpoint_{selected_ac.device_id}_{ac_temperature}")
+            if new_temp != ac_temperature:
+                # Setpoint tetap disimpan, tapi hanya dikirim jika AC menyala
+                if control_devices([selected_ac], setpoint=new_temp, only_on=True):
+                    # Log activity
+                    st.session_state.activity_history.add("setpoint_manual", source="ui", name=device_label(selected_ac), setpoint=new_temp)
+
+    # Semua perangkat per ruangan (kontrol massal)
+    with st.expander("Perangkat per Ruangan", expanded=False):
+        room = st.selectbox("Ruangan", device_registry.rooms(), key="device_room")
+        room_devices = device_registry.devices(room=room)
+        for device in room_devices:
+            power = device_registry.is_on(device)
+            state = st.toggle(f"{device.name} ({device.label})", value=power, key=f"room_power_{device.device_id}_{int(power)}")
+            if state != power:
+                control_devices([device], on=state)
+        bulk_col1, bulk_col2 = st.columns(2)
+        with bulk_col1:
+            if st.button("Nyalakan Semua", key="room_all_on"):
+                control_devices(room_devices, on=True)
+                st.session_state.activity_history.add("room_bulk", source="ui", room=room, on=True)
+        with bulk_col2:
+            if st.button("Matikan Semua", key="room_all_off"):
+                control_devices(room_devices, on=False)
+                st.session_state.activity_history.add("room_bulk", source="ui", room=room, on=False)
     
     # Tambahkan bagian kontrol otomatis AC (setelah kontrol manual AC)
     st.subheader("Kontrol Otomatis AC")
 
     auto_ac_enabled = st.toggle("Aktifkan Kontrol Otomatis AC", 
-                             value=st.session_state.auto_ac_enabled,
+                             value=auto_ac.enabled,
                              help="AC akan otomatis menyala/mati berdasarkan suhu dan jumlah orang")
 
-    # Update state
-    st.session_state.auto_ac_enabled = auto_ac_enabled
+    # Update pengaturan bersama (hanya disimpan jika berubah)
+    auto_ac.update(enabled=auto_ac_enabled)
 
     if auto_ac_enabled:
         # Tampilkan pengaturan kontrol otomatis
@@ -857,27 +1097,27 @@ with tab2:
             temp_threshold = st.slider("Ambang Suhu (°C)", 
                                      min_value=24.0, 
                                      max_value=32.0, 
-                                     value=st.session_state.auto_ac_temp_threshold,
+                                     value=float(auto_ac.temp_threshold),
                                      step=0.5,
                                      help="AC akan menyala jika suhu melebihi nilai ini")
-            st.session_state.auto_ac_temp_threshold = temp_threshold
+            auto_ac.update(temp_threshold=temp_threshold)
         
         with col2:
             # Slider untuk ambang jumlah orang
             people_threshold = st.slider("Minimal Jumlah Orang", 
                                        min_value=0, 
                                        max_value=5, 
-                                       value=st.session_state.auto_ac_people_threshold,
+                                       value=int(auto_ac.people_threshold),
                                        help="AC akan menyala jika jumlah orang sama atau lebih dari nilai ini")
-            st.session_state.auto_ac_people_threshold = people_threshold
+            auto_ac.update(people_threshold=people_threshold)
         
         # Delay untuk mematikan AC saat ruangan kosong
         empty_delay = st.slider("Tunda Mematikan AC (menit)", 
                               min_value=0, 
                               max_value=30, 
-                              value=st.session_state.auto_ac_empty_delay,
+                              value=int(auto_ac.empty_delay),
                               help="Waktu tunda sebelum mematikan AC saat ruangan kosong")
-        st.session_state.auto_ac_empty_delay = empty_delay
+        auto_ac.update(empty_delay=empty_delay)
         
         # Info tentang logika kontrol
         st.info("""
@@ -889,8 +1129,8 @@ with tab2:
         """)
         
         # Tampilkan status terakhir
-        if st.session_state.auto_ac_last_empty_time:
-            empty_time_minutes = (time.time() - st.session_state.auto_ac_last_empty_time) / 60
+        if auto_ac.empty_since:
+            empty_time_minutes = (time.time() - auto_ac.empty_since) / 60
             st.caption(f"⏱️ Ruangan kosong selama {empty_time_minutes:.1f} menit")
     else:
         st.caption("Kontrol otomatis AC dinonaktifkan. Atur AC secara manual atau dengan jadwal.")
@@ -898,122 +1138,56 @@ with tab2:
     # Penjadwalan
     st.subheader("Penjadwalan Perangkat")
     
-    # Tab penjadwalan
-    sched_tab1, sched_tab2 = st.tabs(["Jadwal AC", "Jadwal Lampu"])
-    
-    with sched_tab1:
-        # Enable/disable schedule
-        ac_enabled = st.checkbox("Aktifkan Jadwal AC", 
-                             value=st.session_state.schedules["ac"]["enabled"])
-        # Update the dictionary directly
-        st.session_state.schedules["ac"]["enabled"] = ac_enabled
-        
-        # Schedule type selector
-        ac_schedule_type = st.radio("Tipe Jadwal:", 
-                                ["Harian", "Mingguan", "Tanggal Spesifik"],
-                                horizontal=True,
-                                index=1 if st.session_state.schedules["ac"].get("days") else 0 if not st.session_state.schedules["ac"].get("date_specific") else 2)
-        
-        # Update schedule type based on selection
-        st.session_state.schedules["ac"]["date_specific"] = (ac_schedule_type == "Tanggal Spesifik")
-        
-        # Day selection for weekly schedule
-        if ac_schedule_type == "Mingguan":
-            days_options = ["Sen", "Sel", "Rab", "Kam", "Jum", "Sab", "Min"]
-            selected_days = st.multiselect("Pilih Hari", 
-                                         days_options,
-                                         default=st.session_state.schedules["ac"].get("days", ["Sen", "Sel", "Rab", "Kam", "Jum"]))
-            
-            st.session_state.schedules["ac"]["days"] = selected_days
-        
-        # Date selection for specific date schedule
-        elif ac_schedule_type == "Tanggal Spesifik":
-            selected_date = st.date_input("Pilih Tanggal", 
-                                         value=st.session_state.schedules["ac"].get("specific_date", datetime.date.today()))
-            
-            st.session_state.schedules["ac"]["specific_date"] = selected_date
-        
-        # Time selection
-        ac_col1, ac_col2 = st.columns(2)
-        with ac_col1:
-            # Convert string time to datetime.time object
-            ac_on_hour, ac_on_minute = map(int, st.session_state.schedules["ac"]["on_time"].split(":"))
-            ac_on_time = datetime.time(hour=ac_on_hour, minute=ac_on_minute)
-            
-            ac_on_time_input = st.time_input("Waktu Nyala AC", value=ac_on_time)
-            # Convert back to string format
-            st.session_state.schedules["ac"]["on_time"] = f"{ac_on_time_input.hour:02d}:{ac_on_time_input.minute:02d}"
-        
-        with ac_col2:
-            # Convert string time to datetime.time object
-            ac_off_hour, ac_off_minute = map(int, st.session_state.schedules["ac"]["off_time"].split(":"))
-            ac_off_time = datetime.time(hour=ac_off_hour, minute=ac_off_minute)
-            
-            ac_off_time_input = st.time_input("Waktu Mati AC", value=ac_off_time)
-            # Convert back to string format
-            st.session_state.schedules["ac"]["off_time"] = f"{ac_off_time_input.hour:02d}:{ac_off_time_input.minute:02d}"
-
-    with sched_tab2:
-        # Enable/disable schedule
-        light_enabled = st.checkbox("Aktifkan Jadwal Lampu", 
-                                value=st.session_state.schedules["light"]["enabled"])
-        # Update the dictionary directly
-        st.session_state.schedules["light"]["enabled"] = light_enabled
-        
-        # Schedule type selector
-        light_schedule_type = st.radio("Tipe Jadwal:", 
-                                   ["Harian", "Mingguan", "Tanggal Spesifik"],
-                                   horizontal=True,
-                                   index=1 if st.session_state.schedules["light"].get("days") else 0 if not st.session_state.schedules["light"].get("date_specific") else 2,
-                                   key="light_schedule_type")
-        
-        # Update schedule type based on selection
-        st.session_state.schedules["light"]["date_specific"] = (light_schedule_type == "Tanggal Spesifik")
-        
-        # Day selection for weekly schedule
-        if light_schedule_type == "Mingguan":
-            light_days_options = ["Sen", "Sel", "Rab", "Kam", "Jum", "Sab", "Min"]
-            light_selected_days = st.multiselect("Pilih Hari", 
-                                              light_days_options,
-                                              default=st.session_state.schedules["light"].get("days", ["Sen", "Sel", "Rab", "Kam", "Jum", "Sab", "Min"]),
-                                              key="light_days")
-            
-            st.session_state.schedules["light"]["days"] = light_selected_days
-        
-        # Date selection for specific date schedule
-        elif light_schedule_type == "Tanggal Spesifik":
-            light_selected_date = st.date_input("Pilih Tanggal", 
-                                             value=st.session_state.schedules["light"].get("specific_date", datetime.date.today()),
-                                             key="light_date")
-            
-            st.session_state.schedules["light"]["specific_date"] = light_selected_date
-        
-        # Time selection
-        light_col1, light_col2 = st.columns(2)
-        with light_col1:
-            # Convert string time to datetime.time object
-            light_on_hour, light_on_minute = map(int, st.session_state.schedules["light"]["on_time"].split(":"))
-            light_on_time = datetime.time(hour=light_on_hour, minute=light_on_minute)
-            
-            light_on_time_input = st.time_input("Waktu Nyala Lampu", value=light_on_time, key="light_on_time")
-            # Convert back to string format
-            st.session_state.schedules["light"]["on_time"] = f"{light_on_time_input.hour:02d}:{light_on_time_input.minute:02d}"
-        
-        with light_col2:
-            # Convert string time to datetime.time object
-            light_off_hour, light_off_minute = map(int, st.session_state.schedules["light"]["off_time"].split(":"))
-            light_off_time = datetime.time(hour=light_off_hour, minute=light_off_minute)
-            
-            light_off_time_input = st.time_input("Waktu Mati Lampu", value=light_off_time, key="light_off_time")
-            # Convert back to string format
-            st.session_state.schedules["light"]["off_time"] = f"{light_off_time_input.hour:02d}:{light_off_time_input.minute:02d}"
-    
+    # Pilih perangkat yang dijadwalkan
+    schedulable = device_registry.devices(capability="schedule")
+    if schedulable:
+        scheduled_device = st.selectbox("Perangkat", schedulable, format_func=device_label, key="schedule_device")
+        schedule_editor(scheduled_device)
+
+    sync_schedules()
+
     # Info jadwal
-    st.info(f"""
-    ⏰ **Status Jadwal:**
-    - AC: {format_schedule_info("ac")}
-    - Lampu: {format_schedule_info("light")}
-    """)
+    active_schedules = [
+        f"- {device_label(device)}: {format_schedule_info(device.device_id)}"
+        for device in schedulable
+        if st.session_state.schedules.get(device.device_id, {}).get("enabled")
+    ]
+    st.info("⏰ **Status Jadwal:**\n" + ("\n".join(active_schedules) if active_schedules else "Belum ada jadwal aktif"))
+
+    # Riwayat dari bucket rollup; rentang 30 hari cukup membaca 30 bucket harian per seri
+    st.subheader("Riwayat Ruangan")
+    history_range = st.radio("Rentang", list(HISTORY_RANGES), horizontal=True, key="history_range")
+    resolution, span = HISTORY_RANGES[history_range]
+    now = time.time()
+    temperature_series = f"temperature/{PRIMARY_ROOM}"
+    people_series = f"people/{PRIMARY_ROOM}"
+    live = resolution == "minute"
+
+    st.caption("Suhu (°C)")
+    history_chart({
+        "Rata-rata": (temperature_series, "mean"),
+        "Min": (temperature_series, "min"),
+        "Maks": (temperature_series, "max"),
+    }, resolution, now - span, live=live)
+    st.caption("Jumlah Orang")
+    history_chart({"Rata-rata": (people_series, "mean"), "Maks": (people_series, "max")}, resolution, now - span, live=live)
+    # Waktu nyala per menit tidak informatif; minimal per jam
+    st.caption("Waktu Nyala Perangkat (jam)")
+    history_chart(
+        {device_label(device): (f"power/{device.device_id}", "hours") for device in device_registry.devices(capability="power")},
+        "day" if resolution == "day" else "hour", now - span, chart=st.bar_chart,
+    )
+
+    month_start = now - 30 * 86400
+    ac_hours = sum(rollup_engine.total(f"power/{device.device_id}", "day", month_start, None)[0]
+                   for device in device_registry.devices(kind="ac")) / 3600
+    light_hours = sum(rollup_engine.total(f"power/{device.device_id}", "day", month_start, None)[0]
+                      for device in device_registry.devices(kind="light")) / 3600
+    people_seconds, people_covered = rollup_engine.total(people_series, "day", month_start, None)
+    month_col1, month_col2, month_col3 = st.columns(3)
+    month_col1.metric("AC Nyala (30 hari)", f"{ac_hours:.1f} jam")
+    month_col2.metric("Lampu Nyala (30 hari)", f"{light_hours:.1f} jam")
+    month_col3.metric("Rata-rata Orang (30 hari)", f"{people_seconds / people_covered:.1f}" if people_covered else "-")
 
 with tab3:
     st.header("💬 AI Assistant (Powered by Google Gemini)")
@@ -1024,26 +1198,29 @@ with tab3:
     if st.session_state.ai_enabled:
         # Generate summary button
         if st.button("🔍 Dapatkan Ringkasan Aktivitas"):
-            summary = generate_activity_summary()
             st.session_state.chat_history.append({"role": "user", "content": "Berikan ringkasan aktivitas sistem"})
-            st.session_state.chat_history.append({"role": "assistant", "content": summary})
+            st.session_state.ai_pending = (generate_activity_summary(), None)
 
         # Chat interface
         user_input = st.text_input("Ketik perintah atau pertanyaan:",
                                    placeholder="contoh: nyalakan kamera, matikan lampu, berapa orang terdeteksi?")
 
-        if user_input:
+        # Text input mempertahankan nilainya saat rerun; hanya input baru yang dikirim
+        if user_input and user_input != st.session_state.ai_last_input:
+            st.session_state.ai_last_input = user_input
             st.session_state.chat_history.append({"role": "user", "content": user_input})
 
-            # Generate AI response
-            ai_response = generate_ai_response(user_input)
-
-            # Process any commands in the response, passing both user input and AI response
-            executed_cmds = process_ai_command(ai_response, user_input)
-            if executed_cmds:
-                ai_response += "\n\n*Tindakan yang dilakukan:*\n" + "\n".join([f"- {cmd}" for cmd in executed_cmds])
-
-            st.session_state.chat_history.append({"role": "assistant", "content": ai_response})
+            command = parse_command(user_input)
+            if is_actionable(command):
+                # Perintah perangkat yang pasti langsung dijalankan tanpa menunggu Gemini
+                executed_cmds = process_ai_command("", user_input, command)
+                st.session_state.chat_history.append({"role": "assistant", "content": "⚡ " + (
+                    "*Tindakan yang dilakukan:*\n" + "\n".join(f"- {cmd}" for cmd in executed_cmds)
+                    if executed_cmds else "Perangkat sudah dalam kondisi yang diminta."
+                )})
+            else:
+                # Generate AI response (di-stream, perintah dijalankan saat jawaban lengkap)
+                st.session_state.ai_pending = (generate_ai_response(user_input), user_input)
 
         # Display chat history
         st.subheader("Riwayat Chat")
@@ -1055,6 +1232,12 @@ with tab3:
                 else:
                     st.markdown(f"**🤖 AI Assistant:** {message['content']}")
 
+        # Jawaban yang sedang di-stream; jika kamera aktif, loop kamera yang memperbaruinya
+        ai_placeholder = st.empty()
+        if not st.session_state.camera_on:
+            while poll_ai_reply(ai_placeholder, wait=0.1):
+                pass
+
         # Add a clear chat button
         if st.button("🗑️ Bersihkan Riwayat Chat"):
             st.session_state.chat_history = []
@@ -1066,35 +1249,35 @@ with tab3:
 if start:
     st.session_state.camera_on = True
     st.session_state.stop_clicks = 0
-    send_ubidots(VARIABLE_CAMERA, 1)
+    send_ubidots(VARIABLE_CAMERA, 1, force=True)
 
     # Log for AI
-    timestamp = time.strftime("%H:%M:%S", time.localtime())
-    st.session_state.activity_history.append(f"[{timestamp}] Kamera diaktifkan")
+    st.session_state.activity_history.add("camera_started", source="ui")
 
 if stop:
     st.session_state.stop_clicks += 1
     if st.session_state.stop_clicks >= 2:
         st.session_state.camera_on = False
         st.session_state.stop_clicks = 0
-        send_ubidots(VARIABLE_CAMERA, 0)
-        send_ubidots(VARIABLE_LIGHT, 0)
-        send_ubidots(VARIABLE_COUNT, 0)
+        control_devices(primary_lights, on=False)
+        send_ubidots_batch({VARIABLE_CAMERA: 0, VARIABLE_COUNT: 0}, force=True)
 
         # Log for AI
-        timestamp = time.strftime("%H:%M:%S", time.localtime())
-        st.session_state.activity_history.append(f"[{timestamp}] Kamera dan lampu dimatikan")
+        st.session_state.activity_history.add("camera_stopped", source="ui")
     else:
         st.session_state.camera_on = False
-        send_ubidots(VARIABLE_CAMERA, 0)
-        send_ubidots(VARIABLE_LIGHT, 0)
-        send_ubidots(VARIABLE_COUNT, 0)
+        control_devices(primary_lights, on=False)
+        send_ubidots_batch({VARIABLE_CAMERA: 0, VARIABLE_COUNT: 0}, force=True)
 
         # Log for AI
-        timestamp = time.strftime("%H:%M:%S", time.localtime())
-        st.session_state.activity_history.append(f"[{timestamp}] Kamera dan lampu dimatikan")
+        st.session_state.activity_history.add("camera_stopped", source="ui")
 
 # === Streaming dan Deteksi ===
+# Session yang berhenti melepas langganannya; capture berhenti saat viewer terakhir pergi
+if not st.session_state.camera_on and "camera_subscription" in st.session_state:
+    st.session_state.pop("camera_subscription").close()
+    st.session_state.log.add("camera_view_stopped", source="camera")
+
 if st.session_state.camera_on:
     try:
         # Ambil URL dari input
@@ -1106,233 +1289,162 @@ if st.session_state.camera_on:
         else:
             # Format URL dengan benar
             url = format_esp32_url(url)
-            st.session_state.log.append(f"📡 URL ESP32 final: {url}")
-
-            # Buat generator baru
-            frame_iterator = esp32_stream_generator(url)
+            st.session_state.log.add("camera_url", source="camera", url=url)
+
+            # Kamera dengan URL yang sama dipakai bersama oleh semua session
+            if "camera_subscription" not in st.session_state:
+                st.session_state.camera_subscription = camera_pipeline.subscribe(camera_configs(url))
+            subscription = st.session_state.camera_subscription
+            subscription.update(camera_configs(url))
+            subscription.configure_motion_gate(
+                st.session_state.motion_gate_enabled,
+                st.session_state.motion_sensitivity,
+                motion_gate_roi(),
+                st.session_state.motion_keepalive,
+            )
+            primary_camera = subscription.camera(PRIMARY_CAMERA_ID)
 
         last_frame_time = time.time()
         frame_count = 0
-        no_new_frame_count = 0
         last_count = -1
+        count = st.session_state.count
         last_ubidots_send = time.time()
-        skip_frames = 0
-        reconnect_time = time.time()
         frame_display_time = time.time()
-        
-        # Variabel untuk mengelola deteksi
-        detection_cooldown = 0
-        detection_interval = 3  # Hanya deteksi setiap 3 frame
-        last_valid_count = 0  # Simpan hasil deteksi terakhir yang valid
-        detection_confidence = 0  # Confidence level untuk hasil deteksi
+        extra_display_time = time.time()
+        history_append_time = time.time()
 
         while st.session_state.camera_on:
             try:
-                # Adaptive frame skipping yang lebih cerdas
-                current_time = time.time()
-                elapsed = current_time - frame_display_time
-
-                # Skip threshold dinamis berdasarkan performa sistem dan status deteksi
-                if detection_confidence > 0:  # Ada orang terdeteksi, prioritaskan akurasi
-                    if elapsed > 0.2:       
-                        skip_threshold = 3   # Kurangi skipping saat ada deteksi
-                    elif elapsed > 0.15:    
-                        skip_threshold = 2
-                    else:                   
-                        skip_threshold = 1   # Hampir tidak skip saat deteksi aktif
-                else:  # Tidak ada orang, prioritaskan performa
-                    if elapsed > 0.2:       
-                        skip_threshold = 5
-                    elif elapsed > 0.15:   
-                        skip_threshold = 4
-                    elif elapsed > 0.10:    
-                        skip_threshold = 3
-                    elif elapsed > 0.05:    
-                        skip_threshold = 2
-                    else:                  
-                        skip_threshold = 1
-
-                # Skip processing berdasarkan threshold
-                skip_frames += 1
-                if skip_frames % skip_threshold != 0:
-                    time.sleep(0.001)  # Minimal sleep
-                    continue
-
-                # Force reconnect ESP32-CAM secara periodik
-                if time.time() - reconnect_time > 120:
-                    st.session_state.log.append("🔄 Periodic ESP32-CAM reconnection...")
-                    frame_iterator = esp32_stream_generator(url)
-                    reconnect_time = time.time()
-                    continue
-
-                try:
-                    # Ambil frame dengan timeout
-                    frame_start = time.time()
-                    frame = next(frame_iterator)
-                    
-                    # Jika timeout >1 detik, log warning
-                    if time.time() - frame_start > 1.0:
-                        st.session_state.log.append("⚠️ Slow frame acquisition")
-
-                    # Handle frame kosong
-                    if frame is None:
-                        no_new_frame_count += 1
-                        if no_new_frame_count > 5:
-                            st.session_state.log.append("🔄 Connection issue - reinitializing...")
-                            frame_iterator = esp32_stream_generator(url)
-                            no_new_frame_count = 0
-                            reconnect_time = time.time()
-                        time.sleep(0.2)
-                        continue
-
-                    no_new_frame_count = 0  # Reset counter
-                    
-                    # Simpan frame original untuk display
-                    display_frame = frame.copy()
-                    
-                    # Hanya lakukan deteksi pada interval tertentu untuk mengurangi beban
-                    detection_cooldown += 1
-                    if detection_cooldown >= detection_interval:
-                        # Optimasi frame untuk deteksi tanpa mengubah frame display
-                        detection_frame, _ = optimize_frame_for_detection(frame)
-                        
-                        try:
-                            # Deteksi dengan parameter optimal untuk ESP32-CAM dengan efisiensi
-                            results = model.predict(
-                                detection_frame,
-                                verbose=False,
-                                conf=0.35,      # Threshold deteksi
-                                iou=0.45,       # Threshold NMS sedikit lebih tinggi
-                                agnostic_nms=True,
-                                max_det=5,      # Kurangi max deteksi untuk performa
-                                classes=[0]     # Hanya manusia
-                            )
-                            
-                            # Proses hasil deteksi
-                            boxes = results[0].boxes
-                            people_boxes = [box for box in boxes if int(box.cls[0]) == 0 and float(box.conf[0]) > 0.4]
-                            new_count = len(people_boxes)
-                            
-                            # State persistence - mempertahankan deteksi antara freeze
-                            if new_count > 0:
-                                last_valid_count = new_count
-                                detection_confidence = 5  # Reset confidence level
-                            elif detection_confidence > 0:
-                                # Pertahankan deteksi terakhir dengan confidence menurun
-                                detection_confidence -= 1
-                                new_count = last_valid_count if detection_confidence > 0 else 0
-                            
-                            count = new_count
-                            
-                            # Gambar bounding box pada frame display jika ada orang
-                            if people_boxes:
-                                # Gambar bounding box langsung ke display_frame
-                                scaled_boxes = []
-                                h, w = display_frame.shape[:2]
-                                h_ratio = h / detection_frame.shape[0]
-                                w_ratio = w / detection_frame.shape[1]
-                                
-                                for box in people_boxes:
-                                    x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                                    # Skala ulang koordinat
-                                    x1 = int(x1 * w_ratio)
-                                    y1 = int(y1 * h_ratio)
-                                    x2 = int(x2 * w_ratio)
-                                    y2 = int(y2 * h_ratio)
-                                    
-                                    # Gambar kotak persegi panjang pada frame display
-                                    cv2.rectangle(display_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                        
-                        except Exception as e:
-                            st.session_state.log.append(f"⚠️ Detection error: {str(e)[:50]}")
-                            # Jika error, gunakan count terakhir yang valid
-                            count = last_valid_count if detection_confidence > 0 else 0
-                        
-                        detection_cooldown = 0  # Reset cooldown
-                    
-                    # Gunakan display_frame untuk UI
-                    frame = display_frame
-                except StopIteration:
-                    st.session_state.log.append("🔄 Stream ended - reconnecting...")
-                    frame_iterator = esp32_stream_generator(url)
-                    time.sleep(0.5)
-                    continue
-
-                except Exception as e:
-                    st.session_state.log.append(f"⚠️ Stream error: {str(e)}")
-                    time.sleep(0.5)
-                    continue
+                # Log dari pipeline bersama (capture, deteksi, motion gate)
+                st.session_state.log.extend(subscription.drain_log(), source="pipeline")
+                # Status koneksi dan perintah kamera dari MQTT (mis. dimatikan dari dashboard Ubidots)
+                apply_mqtt_commands()
+                if not st.session_state.camera_on:
+                    break
+
+                # Tunggu snapshot baru dari pipeline; timeout singkat supaya
+                # telemetry dan UI tetap berjalan saat kamera stall
+                updated_cameras = subscription.wait(timeout=0.1)
+
+                count = primary_camera.count
+                st.session_state.occupancy_empty_since = primary_camera.tracker.empty_since
+
+                # Riwayat jumlah orang per ruangan (maksimal 1 sampel/detik jika tidak berubah)
+                for camera_id, _, name, camera in subscription.cameras():
+                    room = PRIMARY_ROOM if camera_id == PRIMARY_CAMERA_ID else name
+                    timeseries_store.record(f"people/{room}", camera.count)
 
                 # Update state jika ada perubahan jumlah orang
                 if count != last_count:
-                    timestamp = time.strftime("%H:%M:%S", time.localtime())
-                    st.session_state.activity_history.append(f"[{timestamp}] Terdeteksi {count} orang")
+                    st.session_state.activity_history.add("people_count", source="camera", count=count)
                     last_count = count
                     st.session_state.count = count
-                    st.session_state.lamp = 1 if count > 0 else 0
+                    # State lampu dikirim bersama telemetry berkala
+                    device_registry.set_power(primary_lights, count > 0)
 
                 # Kirim data ke Ubidots dengan interval lebih panjang
                 now = time.time()
                 if now - last_ubidots_send > 5.0:  # 5 detik
-                    send_ubidots(VARIABLE_LIGHT, st.session_state.lamp)
-                    send_ubidots(VARIABLE_COUNT, count)
+                    # Semua variabel dikirim sebagai satu dokumen ke device Ubidots
+                    telemetry = {VARIABLE_COUNT: count}
+
+                    # Jumlah orang per kamera tambahan ke variabel masing-masing
+                    for camera_id, count_variable, _, camera in subscription.cameras():
+                        if camera_id != PRIMARY_CAMERA_ID:
+                            telemetry[count_variable] = camera.count
                     
-                    # Kirim status AC jika ada perubahan
-                    if st.session_state.ac_power:
-                        send_ubidots(VARIABLE_AC, st.session_state.ac_power)
-                        send_ubidots(VARIABLE_TEMPERATURE, st.session_state.ac_temperature)
+                    # State perangkat ruangan utama (lampu, AC + suhu jika menyala)
+                    telemetry.update(device_registry.state_values(device_registry.devices(room=PRIMARY_ROOM)))
                     
+                    send_ubidots_batch(telemetry)
                     last_ubidots_send = now
 
-                # Baca data DHT11 setiap 30 detik
-                if now - st.session_state.last_dht11_read > 30.0:
-                    read_dht11_data()
-                    st.session_state.last_dht11_read = now
+                # Suhu DHT11 dari cache sensor (diperbarui lewat MQTT, tanpa menunggu jaringan)
+                read_dht11_data()
+
+                # Event dari thread scheduler (transisi jadwal sudah dikirim ke Ubidots)
+                apply_schedule_events()
 
-                # Cek jadwal setiap menit
-                if int(now) % 60 == 0:
-                    check_and_run_schedules()
+                # Jawaban AI yang sedang di-stream (tanpa menunggu Gemini)
+                if st.session_state.ai_pending is not None and ai_placeholder is not None:
+                    poll_ai_reply(ai_placeholder)
+
+                # Bucket menit yang sudah tertutup ke grafik riwayat 24 jam
+                if history_charts and now - history_append_time > 10.0:
+                    append_history_rows()
+                    history_append_time = now
 
                 # Kontrol otomatis AC setiap 15 detik
                 if now - last_ubidots_send > 5.0 or int(now) % 15 == 0:
                     auto_control_ac()
 
                 # Tampilkan frame dengan interval untuk mengurangi beban
-                if time.time() - frame_display_time > 0.1:  # Max 10 FPS UI updates
-                    cv2.putText(frame, f"Jumlah Orang: {count}", (10, 30), 
-                               cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 100, 100), 2)
-                    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    frame_placeholder.image(frame_rgb, channels="RGB", use_container_width=True)
+                primary_updated = PRIMARY_CAMERA_ID in updated_cameras
+                if primary_updated and time.time() - frame_display_time > 0.1:  # Max 10 FPS UI updates
+                    render_camera_frame(PRIMARY_CAMERA_ID, "Kamera Utama", primary_camera, frame_placeholder)
                     frame_display_time = time.time()
 
+                # Kamera tambahan ditampilkan lebih jarang (2 FPS)
+                if extra_camera_placeholders and time.time() - extra_display_time > 0.5:
+                    for camera_id, _, name, camera in subscription.cameras():
+                        placeholder = extra_camera_placeholders.get(camera_id)
+                        if placeholder is not None and camera_id in updated_cameras:
+                            render_camera_frame(camera_id, name, camera, placeholder)
+                    extra_display_time = time.time()
+
                 # Update UI status dengan interval lebih rendah
-                if frame_count % 15 == 0:
+                if primary_updated and frame_count % 15 == 0:
+                    capture_worker = primary_camera.worker
+                    frame_age = capture_worker.frame_age()
                     status_placeholder.markdown(
-                        f"👥 **Jumlah Orang:** `{count}` &nbsp;&nbsp; 💡 **Lampu:** `{'ON' if st.session_state.lamp else 'OFF'}`"
+                        f"👥 **Jumlah Orang:** `{count}` &nbsp;&nbsp; 💡 **Lampu:** `{'ON' if device_registry.any_on(primary_lights) else 'OFF'}`"
                     )
+                    gate_checks, gate_skipped = camera_pipeline.registry.motion_gate_stats()
+                    gate_summary = (
+                        f"{gate_skipped}/{gate_checks} inferensi dilewati ({gate_skipped / max(1, gate_checks):.0%})"
+                        if st.session_state.motion_gate_enabled else "Nonaktif"
+                    )
+                    extra_counts = ", ".join(
+                        f"{name}: {camera.count}" for camera_id, _, name, camera in subscription.cameras()
+                        if camera_id != PRIMARY_CAMERA_ID
+                    )
+                    if inference_pool is None:
+                        model_users, model_load_time = MODEL_CACHE.stats().get(camera_pipeline.model_lease.key, (0, 0.0))
+                    preview = preview_encoder(PRIMARY_CAMERA_ID)
                     detail_placeholder.markdown(f"""
                     **ℹ️ Detail**  
                     - Terakhir Kirim: `{time.strftime('%H:%M:%S', time.localtime(last_ubidots_send))}`  
                     - Status Kamera: `{'Aktif' if st.session_state.camera_on else 'Nonaktif'}`  
                     - URL ESP32-CAM: `{url}`  
+                    - Kamera: `{capture_worker.fps:.1f} FPS`, umur frame `{(frame_age or 0) * 1000:.0f} ms`, frame terlewat `{capture_worker.frames_dropped}`, reconnect `{capture_worker.reconnects}`, viewer `{camera_pipeline.subscriber_count()}`  
+                    {f"- Kamera Tambahan: `{extra_counts}`" if extra_counts else ""}
+                    - Motion Gate: `{gate_summary}`  
+                    - Preview: `{preview.update_rate:.1f} FPS`, `{preview.frame_bytes / 1024:.1f} KB/frame` (`{preview.bytes_per_second() / 1024:.0f} KB/s`), render `{preview.render_ms:.1f} ms`, JPEG asli `{preview.reuse_ratio():.0%}`, kualitas `{preview.quality}`  
+                    {f"- Inferensi: `{inference_pool.alive_workers()} worker`, latensi batch `{inference_pool.last_latency * 1000:.0f} ms`, batch dilewati `{inference_pool.dropped_batches}`" if inference_pool is not None else ""}
+                    {f"- Model Lokal: dipakai `{model_users}` pipeline, dimuat `{model_load_time:.1f} s`" if inference_pool is None else ""}
+                    - Telemetry: `{telemetry_dispatcher.batches_sent} batch` / `{telemetry_dispatcher.values_sent} nilai` terkirim, `{telemetry_dispatcher.filtered}` dibuang dead-band, `{telemetry_dispatcher.coalesced}` digabung, antrian `{telemetry_dispatcher.pending()}`, latensi `{telemetry_dispatcher.last_latency * 1000:.0f} ms`{f", error: {telemetry_dispatcher.last_error[:40]}" if telemetry_dispatcher.last_error else ""}  
+                    - Journal Telemetry: `{telemetry_dispatcher.backlog()}` tertunda, `{telemetry_dispatcher.journaled}` disimpan, `{telemetry_dispatcher.replayed}` dikirim ulang  
+                    - Jadwal: `{schedule_engine.fired}` transisi dijalankan, `{schedule_engine.caught_up}` susulan{f", error: {schedule_engine.last_error[:40]}" if schedule_engine.last_error else ""}  
+                    - Riwayat: `{timeseries_store.samples}` sampel, `{timeseries_store.bytes_written / 1024:.0f} KB` ditulis, flush `{timeseries_store.last_flush_ms:.1f} ms`, rollup `{rollup_engine.updates}` pembaruan{f", error: {timeseries_store.last_error[:40]}" if timeseries_store.last_error else ""}  
+                    - AI Assistant: `{assistant.hits}/{assistant.requests}` dari cache, `{assistant.deduped}` digabung, token pertama `{assistant.first_token_ms:.0f} ms`, jawaban `{assistant.last_latency:.1f} s`{f", error: {assistant.last_error[:40]}" if assistant.last_error else ""}  
+                    - Sensor DHT11: umur `{time.time() - st.session_state.dht11_timestamp:.0f} s`, poll HTTP `{sensor_cache.polls}` (`{sensor_cache.not_modified}` tidak berubah){f", error: {sensor_cache.last_error[:40]}" if sensor_cache.last_error else ""}  
+                    - MQTT: `{'Terhubung' if mqtt_link.is_connected() else 'Terputus'}` sejak `{time.strftime("%H:%M:%S", time.localtime(mqtt_link.state_since))}`, `{mqtt_link.connects}` koneksi / `{mqtt_link.disconnects}` terputus  
                     """)
 
-                frame_count += 1
-                # Log FPS dengan interval lebih jarang
-                if frame_count % 50 == 0:
-                    fps = 50 / (time.time() - last_frame_time)
-                    last_frame_time = time.time()
-                    st.session_state.log.append(f"📈 FPS: {fps:.1f}")
-
-                # Pengontrol kecepatan loop
-                time.sleep(0.01)
+                if primary_updated:
+                    frame_count += 1
+                    # Log FPS dengan interval lebih jarang
+                    if frame_count % 50 == 0:
+                        fps = 50 / (time.time() - last_frame_time)
+                        last_frame_time = time.time()
+                        st.session_state.log.add("fps", source="camera", coalesce=True, fps=fps)
 
             except Exception as e:
-                st.session_state.log.append(f"❌ Error: {str(e)}")
+                st.session_state.log.add("loop_error", level="error", source="camera", error=str(e))
                 time.sleep(0.1)
 
     except Exception as e:
-        st.session_state.log.append(f"❌ Error pada sistem kamera: {str(e)}")
+        st.session_state.log.add("camera_error", level="error", source="camera", error=str(e))
         st.session_state.camera_on = False
 
 # === Info Saat Kamera Mati ===
@@ -1343,10 +1455,11 @@ if not st.session_state.camera_on:
     - Status Kamera: `{'Aktif' if st.session_state.camera_on else 'Nonaktif'}`  
     - URL ESP32-CAM: `{st.session_state.esp32_url}`  
     - Suhu Ruangan: `{st.session_state.current_temperature}°C`
-    - Status AC: `{'ON' if st.session_state.ac_power else 'OFF'} ({st.session_state.ac_temperature}°C)`
+    - Perangkat: `{"; ".join(device_registry.summary())}`
     """)
 
 # Tampilkan log terakhir
 with st.expander("Log System", expanded=False):
-    for log in st.session_state.log[-10:]:
+    for log in st.session_state.log.tail(10):
         st.write(log)
+    st.caption(f"{len(st.session_state.log)} record tersimpan dari {sum(st.session_state.log.counts.values())} pesan")
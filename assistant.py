@@ -0,0 +1,149 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# === Klien AI Assistant ===
+# Satu klien per proses server untuk semua session. Jawaban lengkap disimpan
+# di cache LRU dengan TTL; kuncinya prompt yang dinormalisasi ditambah digest
+# state yang relevan (perangkat, jumlah orang, suhu, dan percakapan session
+# jika ikut dikirim), jadi pertanyaan sama pada state yang sama langsung
+# dijawab dari cache tanpa membawa jawaban satu session ke session lain. Panggilan ke Gemini
+# berjalan di thread sendiri dengan streaming dan batas waktu; session hanya
+# membaca potongan teks yang sudah masuk. Prompt yang sama yang sedang
+# diproses tidak dikirim ulang: pemanggil berikutnya membaca balasan yang sama.
+
+
+def normalize_prompt(text):
+    # "  Berapa orang?? " dan "berapa orang" menjadi kunci yang sama; IP dan jam tetap utuh
+    tokens = (token.strip(".:") for token in re.sub(r"[^\w.:]+", " ", text.lower()).split())
+    return " ".join(token for token in tokens if token)
+
+
+def state_digest(*parts):
+    digest = hashlib.blake2b(digest_size=8)
+    for part in parts:
+        digest.update(repr(part).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class Reply:
+    # Balasan yang sedang/sudah di-stream; bisa dibaca beberapa session sekaligus
+    def __init__(self, key, text=None, cached=False):
+        self.key = key
+        self.cached = cached
+        self.error = None
+        self.started = time.time()
+        self._chunks = [text] if text else []
+        self._cond = threading.Condition()
+        self._done = text is not None
+
+    @property
+    def done(self):
+        return self._done
+
+    def text(self):
+        with self._cond:
+            return "".join(self._chunks)
+
+    def wait(self, timeout):
+        # Tunggu potongan baru atau selesai (maksimal timeout detik); True jika sudah selesai
+        with self._cond:
+            if not self._done:
+                count = len(self._chunks)
+                self._cond.wait_for(lambda: self._done or len(self._chunks) > count, timeout)
+            return self._done
+
+    def _append(self, text):
+        with self._cond:
+            self._chunks.append(text)
+            self._cond.notify_all()
+
+    def _finish(self, error=None):
+        with self._cond:
+            self.error = error
+            self._done = True
+            self._cond.notify_all()
+
+
+class AssistantClient:
+    def __init__(self, ttl=300.0, capacity=128, timeout=20.0):
+        self.ttl = ttl            # Umur maksimal jawaban di cache (detik)
+        self.capacity = capacity  # Jumlah jawaban di cache (LRU)
+        self.timeout = timeout    # Batas waktu satu jawaban lengkap (detik)
+
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # kunci -> (waktu, teks)
+        self._inflight = {}          # kunci -> Reply yang sedang di-stream
+
+        # Statistik untuk panel detail
+        self.requests = 0
+        self.hits = 0
+        self.deduped = 0
+        self.calls = 0
+        self.errors = 0
+        self.first_token_ms = 0.0
+        self.last_latency = 0.0
+        self.last_error = None
+
+    def key(self, prompt, *state):
+        return normalize_prompt(prompt), state_digest(*state)
+
+    def ask(self, model, key, build_messages):
+        # build_messages() hanya dipanggil jika model benar-benar perlu dipanggil
+        with self._lock:
+            self.requests += 1
+            entry = self._cache.get(key)
+            if entry is not None and time.time() - entry[0] <= self.ttl:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return Reply(key, entry[1], cached=True)
+            reply = self._inflight.get(key)
+            if reply is not None:
+                self.deduped += 1
+                return reply
+            reply = self._inflight[key] = Reply(key)
+            self.calls += 1
+        try:
+            messages = build_messages()
+        except Exception as e:
+            self._complete(reply, e)
+            return reply
+        threading.Thread(target=self._run, args=(model, reply, messages), name="assistant-call", daemon=True).start()
+        return reply
+
+    def expired(self, reply):
+        # Session berhenti menunggu balasan yang melewati batas waktu
+        return not reply.done and time.time() - reply.started > self.timeout
+
+    def _run(self, model, reply, messages):
+        error = None
+        deadline = reply.started + self.timeout
+        try:
+            stream = model.generate_content(messages, stream=True, request_options={"timeout": self.timeout})
+            for chunk in stream:
+                if not reply.text():
+                    self.first_token_ms = (time.time() - reply.started) * 1000
+                reply._append(chunk.text)
+                if time.time() > deadline:
+                    raise TimeoutError(f"jawaban tidak lengkap dalam {self.timeout:.0f} detik")
+        except Exception as e:
+            error = e
+        self._complete(reply, error)
+
+    def _complete(self, reply, error):
+        text = reply.text()
+        with self._lock:
+            self._inflight.pop(reply.key, None)
+            if error is None and text:
+                self._cache[reply.key] = (time.time(), text)
+                self._cache.move_to_end(reply.key)
+                while len(self._cache) > self.capacity:
+                    self._cache.popitem(last=False)
+            if error is not None:
+                self.errors += 1
+                self.last_error = str(error)
+            self.last_latency = time.time() - reply.started
+        reply._finish(error)
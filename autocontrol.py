@@ -0,0 +1,67 @@
+import json
+import os
+import threading
+
+# === Pengaturan Kontrol Otomatis AC ===
+# AC yang dikontrol ada di DeviceRegistry bersama, jadi pengaturannya juga
+# satu per proses server (bukan per session): dua tab browser tidak bisa
+# saling menyalakan/mematikan AC dengan ambang yang berbeda. Pengaturan
+# disimpan ke file JSON dan dimuat ulang setelah restart.
+
+DEFAULT_SETTINGS = {
+    "enabled": False,
+    "temp_threshold": 27.0,  # Suhu ambang batas untuk menyalakan AC
+    "people_threshold": 1,   # Minimal jumlah orang untuk menyalakan AC
+    "empty_delay": 5,        # Tunda mematikan AC (menit) saat ruangan kosong
+}
+
+
+class AutoAcSettings:
+    def __init__(self, path=None):
+        self.path = path            # File JSON pengaturan (None = hanya di memori)
+        self._lock = threading.Lock()
+        self._values = dict(DEFAULT_SETTINGS)
+        self.empty_since = None     # Waktu ruangan mulai kosong, sama untuk semua session
+        self.last_error = None
+        self._load()
+
+    def __getattr__(self, name):
+        # settings.enabled, settings.temp_threshold, ...
+        values = self.__dict__.get("_values")
+        if values is None or name not in values:
+            raise AttributeError(name)
+        return values[name]
+
+    def update(self, **values):
+        # Simpan hanya jika ada nilai yang berubah
+        with self._lock:
+            changed = {name: value for name, value in values.items() if self._values[name] != value}
+            if not changed:
+                return False
+            self._values.update(changed)
+            self._save(dict(self._values))
+        return True
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError) as e:
+            self.last_error = f"Gagal memuat pengaturan: {e}"
+            return
+        self._values.update({name: stored[name] for name in DEFAULT_SETTINGS if name in stored})
+
+    def _save(self, stored):
+        # Tulis ke file sementara lalu ganti, supaya file tidak pernah setengah tertulis
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            temp = f"{self.path}.tmp"
+            with open(temp, "w", encoding="utf-8") as f:
+                json.dump(stored, f, indent=2)
+            os.replace(temp, self.path)
+        except OSError as e:
+            self.last_error = f"Gagal menyimpan pengaturan: {e}"
@@ -0,0 +1,173 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from detector import DETECTION_CONF, DETECTION_IOU, DETECTION_MAX_DET
+
+# === Backend Inferensi YOLOv8n (PyTorch / ONNX Runtime / OpenVINO) ===
+# Semua backend menerima list frame BGR uint8 hasil letterbox (imgsz x imgsz)
+# dan mengembalikan list array float32 (k, 6) [x1, y1, x2, y2, conf, cls]
+# pada koordinat frame input, sama seperti format hasil worker inferensi.
+# Model ONNX/OpenVINO dibuat sekali dengan model_export.py dan hanya berisi
+# head kelas orang (output [cx, cy, w, h, skor_orang]).
+
+BACKENDS = ("pytorch", "onnxruntime", "openvino")
+MODEL_DIR = "models"
+MODEL_STEM = "yolov8n-320-person"
+
+
+def default_model_path(backend, int8=False):
+    suffix = "-int8" if int8 else ""
+    if backend == "pytorch":
+        return "yolov8n.pt"
+    if backend == "onnxruntime":
+        return os.path.join(MODEL_DIR, f"{MODEL_STEM}{suffix}.onnx")
+    if backend == "openvino":
+        return os.path.join(MODEL_DIR, f"{MODEL_STEM}-openvino", f"{MODEL_STEM}{suffix}.xml")
+    raise ValueError(f"Backend tidak dikenal: {backend} (pilihan: {', '.join(BACKENDS)})")
+
+
+def frames_to_tensor(frames, out=None):
+    # BGR uint8 NHWC -> RGB float32 NCHW [0, 1], ditulis langsung ke out jika ukurannya cocok
+    n = len(frames)
+    height, width = frames[0].shape[:2]
+    if out is None or len(out) < n or out.shape[2:] != (height, width):
+        out = np.empty((n, 3, height, width), dtype=np.float32)
+    out = out[:n]
+    for frame, tensor in zip(frames, out):
+        np.multiply(frame.transpose(2, 0, 1)[::-1], np.float32(1 / 255), out=tensor, dtype=np.float32)
+    return out
+
+
+class InputTensor:
+    # Buffer input float32 per thread yang dipakai ulang antar panggilan predict;
+    # instance backend bisa dipakai bersama oleh beberapa session sekaligus
+    def __init__(self):
+        self._local = threading.local()
+
+    def fill(self, frames):
+        buffer = getattr(self._local, "buffer", None)
+        tensor = frames_to_tensor(frames, buffer)
+        if buffer is None or not np.may_share_memory(tensor, buffer):
+            self._local.buffer = tensor  # Batch lebih besar: buffer baru dipakai ke depannya
+        return tensor
+
+
+def decode_person_output(output, conf=DETECTION_CONF, iou=DETECTION_IOU, max_det=DETECTION_MAX_DET):
+    # output: (B, C, N) dengan baris [cx, cy, w, h, skor kelas...]; hanya kelas 0 (orang) dipakai
+    detections = []
+    for pred in output:
+        scores = pred[4]
+        keep = np.flatnonzero(scores > conf)
+        if keep.size == 0:
+            detections.append(np.zeros((0, 6), dtype=np.float32))
+            continue
+
+        cxcywh = pred[:4, keep].T
+        scores = scores[keep]
+        xywh = cxcywh.copy()
+        xywh[:, :2] -= cxcywh[:, 2:] / 2
+        indices = cv2.dnn.NMSBoxes(xywh.tolist(), scores.tolist(), conf, iou)
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1)[:max_det]
+
+        det = np.zeros((len(indices), 6), dtype=np.float32)
+        det[:, :2] = xywh[indices, :2]
+        det[:, 2:4] = xywh[indices, :2] + xywh[indices, 2:]
+        det[:, 4] = scores[indices]
+        detections.append(det)
+    return detections
+
+
+class TorchBackend:
+    name = "pytorch"
+
+    def __init__(self, model_path, imgsz=320, threads=None):
+        import torch
+        from ultralytics import YOLO
+        if threads:
+            torch.set_num_threads(threads)
+        self.imgsz = imgsz
+        self.model = YOLO(model_path)
+
+    def predict(self, frames):
+        results = self.model.predict(
+            list(frames),
+            verbose=False,
+            imgsz=self.imgsz,
+            conf=DETECTION_CONF,
+            iou=DETECTION_IOU,
+            agnostic_nms=True,
+            max_det=DETECTION_MAX_DET,
+            classes=[0]     # Hanya manusia
+        )
+        return [result.boxes.data.cpu().numpy()[:, :6] for result in results]
+
+
+class OnnxRuntimeBackend:
+    name = "onnxruntime"
+
+    def __init__(self, model_path, imgsz=320, threads=None):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise RuntimeError("Backend onnxruntime membutuhkan paket onnxruntime (pip install onnxruntime)")
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.imgsz = imgsz
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.input_tensor = InputTensor()
+
+    def predict(self, frames):
+        output = self.session.run(None, {self.input_name: self.input_tensor.fill(frames)})[0]
+        return decode_person_output(output)
+
+
+class OpenVinoBackend:
+    name = "openvino"
+
+    def __init__(self, model_path, imgsz=320, threads=None):
+        try:
+            import openvino as ov
+        except ImportError:
+            raise RuntimeError("Backend openvino membutuhkan paket openvino (pip install openvino)")
+        config = {"PERFORMANCE_HINT": "LATENCY"}
+        if threads:
+            config["INFERENCE_NUM_THREADS"] = threads
+        self.imgsz = imgsz
+        core = ov.Core()
+        self.compiled = core.compile_model(core.read_model(model_path), "CPU", config)
+        self.output = self.compiled.output(0)
+        self.input_tensor = InputTensor()
+
+    def predict(self, frames):
+        output = self.compiled(self.input_tensor.fill(frames))[self.output]
+        return decode_person_output(output)
+
+
+BACKEND_CLASSES = {
+    "pytorch": TorchBackend,
+    "onnxruntime": OnnxRuntimeBackend,
+    "openvino": OpenVinoBackend,
+}
+
+
+def load_backend(backend="pytorch", model_path=None, int8=False, imgsz=320, threads=None, warmup=True):
+    if backend not in BACKEND_CLASSES:
+        raise ValueError(f"Backend tidak dikenal: {backend} (pilihan: {', '.join(BACKENDS)})")
+    if backend == "pytorch" and int8:
+        raise ValueError("Kuantisasi INT8 hanya tersedia untuk backend onnxruntime dan openvino")
+    model_path = model_path or default_model_path(backend, int8)
+    if backend != "pytorch" and not os.path.exists(model_path):
+        raise RuntimeError(f"Model {model_path} belum ada, jalankan: python model_export.py export")
+
+    instance = BACKEND_CLASSES[backend](model_path, imgsz=imgsz, threads=threads)
+    if warmup:
+        # Warm-up supaya frame pertama tidak terkena cold start
+        instance.predict([np.zeros((imgsz, imgsz, 3), dtype=np.uint8)])
+    return instance
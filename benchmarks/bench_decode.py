@@ -0,0 +1,100 @@
+"""Benchmark decode JPEG ESP32-CAM: decode penuh + resize vs decode tereduksi.
+
+Jalankan dari root repo:
+    python benchmarks/bench_decode.py
+    python benchmarks/bench_decode.py --jpeg-dir rekaman/   # frame asli kamera
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from esp32_stream import FrameDecoder, decode_frame, jpeg_dimensions, reduced_decode_flag  # noqa: E402
+
+RESOLUTIONS = {
+    "SVGA": (800, 600),
+    "VGA": (640, 480),
+    "QVGA": (320, 240),
+}
+
+
+def synthetic_jpeg(size, quality=80):
+    # Gambar sintetis dengan gradien, bentuk dan noise agar ukuran JPEG realistis
+    width, height = size
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    image = np.dstack([(x + y) / 2, np.broadcast_to(x, (height, width)), np.broadcast_to(y, (height, width))])
+    image = image + rng.normal(0, 12, image.shape)
+    image = np.clip(image, 0, 255).astype(np.uint8)
+    for i in range(12):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        color = tuple(int(c) for c in rng.integers(0, 255, 3))
+        cv2.circle(image, center, int(rng.integers(10, height // 4)), color, -1)
+    ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError("Gagal membuat JPEG sintetis")
+    return encoded.tobytes()
+
+
+def full_decode(jpeg, frame_size):
+    # Jalur lama: decode resolusi penuh lalu cv2.resize(INTER_AREA)
+    frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if (frame.shape[1], frame.shape[0]) != frame_size:
+        frame = cv2.resize(frame, frame_size, interpolation=cv2.INTER_AREA)
+    return frame
+
+
+def time_per_frame(func, jpeg, frame_size, iterations):
+    func(jpeg, frame_size)  # Warm-up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(jpeg, frame_size)
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def load_samples(jpeg_dir):
+    samples = []
+    for name in sorted(os.listdir(jpeg_dir)):
+        if name.lower().endswith((".jpg", ".jpeg")):
+            with open(os.path.join(jpeg_dir, name), "rb") as f:
+                samples.append((name, f.read()))
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--width", type=int, default=320, help="Lebar input detector")
+    parser.add_argument("--height", type=int, default=240, help="Tinggi input detector")
+    parser.add_argument("--quality", type=int, default=80)
+    parser.add_argument("--jpeg-dir", help="Folder berisi frame JPEG hasil rekaman kamera")
+    args = parser.parse_args()
+
+    frame_size = (args.width, args.height)
+    if args.jpeg_dir:
+        samples = load_samples(args.jpeg_dir)
+    else:
+        samples = [(name, synthetic_jpeg(size, args.quality)) for name, size in RESOLUTIONS.items()]
+
+    print(f"Target {frame_size[0]}x{frame_size[1]}, {args.iterations} iterasi per kasus, OpenCV {cv2.__version__}")
+    print(f"{'Sumber':<12} {'Dimensi':>10} {'KB':>7} {'Faktor':>7} {'Penuh ms':>9} {'Reduksi ms':>11} {'Cache ms':>9} {'Speedup':>8}")
+    for name, jpeg in samples:
+        dims = jpeg_dimensions(jpeg)
+        _, factor = reduced_decode_flag(dims, frame_size)
+        full_ms = time_per_frame(full_decode, jpeg, frame_size, args.iterations)
+        reduced_ms = time_per_frame(decode_frame, jpeg, frame_size, args.iterations)
+        # Jalur CaptureWorker: dimensi sumber di-cache per stream
+        decoder = FrameDecoder(frame_size)
+        cached_ms = time_per_frame(lambda jpeg, _: decoder.decode(jpeg), jpeg, frame_size, args.iterations)
+        dims_text = f"{dims[0]}x{dims[1]}" if dims else "?"
+        print(f"{name:<12} {dims_text:>10} {len(jpeg) / 1024:>7.1f} {'1/' + str(factor):>7} "
+              f"{full_ms:>9.3f} {reduced_ms:>11.3f} {cached_ms:>9.3f} {full_ms / cached_ms:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Benchmark perintah AI Assistant: scan frasa lama vs parser intent lokal.
+
+Jalankan dari root repo:
+    python benchmarks/bench_intents.py
+    python benchmarks/bench_intents.py --gemini-key KEY   # ikut ukur round trip Gemini (jalur lama)
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from intents import INTENT_TRIGGERS, is_actionable, parse_command  # noqa: E402
+
+COMMANDS = [
+    "nyalakan lampu",
+    "matikan ac ruang rapat",
+    "atur suhu 24 derajat",
+    "tolong nonaktifkan kamera sekarang",
+    "gunakan ip 192.168.1.10:81",
+    "berapa orang yang terdeteksi hari ini dan apakah ac perlu dinyalakan?",
+]
+
+
+def legacy_scan(user_input, response=""):
+    # Jalur lama: loop bersarang atas semua frasa, regex diimpor dan dikompilasi di dalam loop
+    import re
+    combined_text = (user_input + " " + response).lower()
+    found = []
+    ip = re.findall(r'\b(?:\d{1,3}\.){3}\d{1,3}(?::\d+)?\b', user_input)
+    for cmd, triggers in INTENT_TRIGGERS.items():
+        for trigger in triggers:
+            if trigger in combined_text:
+                if cmd == "set_temp":
+                    import re
+                    re.search(r'(\d{1,2})(?:\s*)(derajat|°C|celsius)', combined_text.lower())
+                found.append(cmd)
+                break
+    return found, ip
+
+
+def time_per_call(func, text, iterations):
+    func(text)  # Warm-up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(text)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def gemini_round_trip(api_key, prompt, repeats=3):
+    import google.generativeai as genai
+    genai.configure(api_key=api_key)
+    model = genai.GenerativeModel("gemini-2.0-flash")
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.generate_content(prompt).text
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--gemini-key", help="API key Gemini untuk mengukur jalur lama (scan setelah jawaban AI)")
+    args = parser.parse_args()
+
+    print(f"{'Perintah':48} {'Lama (µs)':>10} {'Parser (µs)':>12} {'Langsung':>9}")
+    for text in COMMANDS:
+        legacy = time_per_call(legacy_scan, text, args.iterations)
+        parsed = time_per_call(parse_command, text, args.iterations)
+        print(f"{text[:48]:48} {legacy:10.1f} {parsed:12.1f} {'ya' if is_actionable(parse_command(text)) else 'AI':>9}")
+
+    if args.gemini_key:
+        # Jalur lama menunggu jawaban Gemini lengkap sebelum perintah dijalankan
+        round_trip = gemini_round_trip(args.gemini_key, COMMANDS[0])
+        parsed = time_per_call(parse_command, COMMANDS[0], args.iterations) / 1000
+        print(f"\nLatensi perintah '{COMMANDS[0]}': lama {round_trip:.0f} ms (Gemini + scan), jalur cepat {parsed:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
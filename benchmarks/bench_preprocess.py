@@ -0,0 +1,94 @@
+"""Benchmark preprocessing frame untuk YOLO: jalur lama vs letterbox langsung ke buffer.
+
+Jalankan dari root repo:
+    python benchmarks/bench_preprocess.py
+    python benchmarks/bench_preprocess.py --batch 4 --blur
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backends import InputTensor  # noqa: E402
+from detector import DETECTION_SIZE, DetectionBuffer  # noqa: E402
+
+FRAME_SIZES = {
+    "QVGA": (320, 240),
+    "VGA": (640, 480),
+    "SVGA": (800, 600),
+}
+
+
+def legacy_letterbox(frame, blur):
+    # Jalur lama optimize_frame_for_detection: salinan frame, resize, copyMakeBorder, blur
+    original_frame = frame.copy()
+    height, width = frame.shape[:2]
+    scale = DETECTION_SIZE / max(height, width)
+    new_height, new_width = int(height * scale), int(width * scale)
+    detection_frame = cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_AREA)
+    if new_height != new_width:
+        top = bottom = max(0, (DETECTION_SIZE - new_height) // 2)
+        left = right = max(0, (DETECTION_SIZE - new_width) // 2)
+        detection_frame = cv2.copyMakeBorder(detection_frame, top, bottom, left, right,
+                                             cv2.BORDER_CONSTANT, value=(0, 0, 0))
+    if blur:
+        detection_frame = cv2.GaussianBlur(detection_frame, (3, 3), 0)
+    return detection_frame, original_frame
+
+
+def legacy_tensor(frames):
+    batch = np.stack(frames)[..., ::-1].transpose(0, 3, 1, 2)
+    return np.ascontiguousarray(batch, dtype=np.float32) / 255.0
+
+
+def time_per_frame(func, frames, iterations):
+    func(frames)  # Warm-up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(frames)
+    return (time.perf_counter() - start) / iterations / len(frames) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--batch", type=int, default=1, help="Jumlah kamera per batch")
+    parser.add_argument("--blur", action="store_true", help="Aktifkan Gaussian blur di kedua jalur")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    buffer = DetectionBuffer()
+    tensor = InputTensor()
+
+    def legacy_uint8(frames):
+        return [legacy_letterbox(frame, args.blur)[0] for frame in frames]
+
+    def direct_uint8(frames):
+        return buffer.fill(frames, blur=args.blur)
+
+    def legacy_float(frames):
+        return legacy_tensor(legacy_uint8(frames))
+
+    def direct_float(frames):
+        return tensor.fill(direct_uint8(frames)[0])
+
+    print(f"Input {DETECTION_SIZE}x{DETECTION_SIZE}, batch {args.batch}, blur {'on' if args.blur else 'off'}, "
+          f"{args.iterations} iterasi, ms per frame")
+    print(f"{'Frame':<6} {'Dimensi':>9} {'uint8 lama':>11} {'uint8 baru':>11} {'Speedup':>8} "
+          f"{'float lama':>11} {'float baru':>11} {'Speedup':>8}")
+    for name, (width, height) in FRAME_SIZES.items():
+        frames = [rng.integers(0, 255, (height, width, 3), dtype=np.uint8) for _ in range(args.batch)]
+        old_u8 = time_per_frame(legacy_uint8, frames, args.iterations)
+        new_u8 = time_per_frame(direct_uint8, frames, args.iterations)
+        old_f32 = time_per_frame(legacy_float, frames, args.iterations)
+        new_f32 = time_per_frame(direct_float, frames, args.iterations)
+        print(f"{name:<6} {f'{width}x{height}':>9} {old_u8:>11.3f} {new_u8:>11.3f} {old_u8 / new_u8:>7.2f}x "
+              f"{old_f32:>11.3f} {new_f32:>11.3f} {old_f32 / new_f32:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
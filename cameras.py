@@ -0,0 +1,187 @@
+import re
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from detector import PEOPLE_DTYPE
+from esp32_stream import CaptureWorker
+from motion import MotionGate
+from tracker import PeopleTracker
+
+# === Registry Kamera Multi-Ruangan ===
+# Setiap kamera memiliki worker capture sendiri. Loop deteksi mengumpulkan
+# frame terbaru dari semua kamera lalu menjalankan satu batch YOLO, dan
+# jumlah orang per kamera (dari tracker) dikirim ke variabel Ubidots
+# masing-masing.
+
+PRIMARY_CAMERA_ID = "utama"
+
+# Keadaan terbaru satu kamera untuk ditampilkan; diganti utuh, tidak pernah diubah
+CameraSnapshot = namedtuple("CameraSnapshot", ["seq", "frame", "jpeg", "boxes", "count", "time"])
+
+
+def camera_id_from_name(name):
+    return re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-")
+
+
+class Camera:
+    def __init__(self, camera_id, url, count_variable, name=None):
+        self.camera_id = camera_id
+        self.url = url
+        self.count_variable = count_variable
+        self.name = name or camera_id
+        self.worker = None
+
+        # Frame terbaru dari worker
+        self.last_seq = 0
+        self.frame = None
+        self.jpeg = None                # Byte JPEG asli dari frame, untuk preview
+        self.frame_time = 0.0
+        self.detection_pending = False  # Frame baru yang belum masuk batch deteksi
+        self.motion_gate = MotionGate()
+        self.motion_gate_enabled = True
+
+        # Hasil deteksi: tracker menjaga ID dan memprediksi box di antara batch YOLO
+        self.tracker = PeopleTracker()
+        self.count = 0
+        self.snapshot = CameraSnapshot(0, None, None, np.zeros(0, dtype=PEOPLE_DTYPE), 0, 0.0)
+
+    def start(self, on_frame=None):
+        if self.worker is None or not self.worker.is_alive():
+            self.worker = CaptureWorker(self.url, on_frame=on_frame, keep_jpeg=True).start()
+
+    def stop(self):
+        if self.worker is not None:
+            self.worker.stop()
+            self.worker = None
+
+    def is_running(self):
+        return self.worker is not None and self.worker.is_alive()
+
+    def poll(self):
+        if self.worker is None:
+            return False
+        seq, frame, frame_time = self.worker.latest(after_seq=self.last_seq)
+        if frame is None:
+            return False
+        jpeg_seq, jpeg = self.worker.latest_jpeg()
+        self.last_seq = seq
+        self.frame = frame
+        self.jpeg = jpeg if jpeg_seq == seq else None
+        self.frame_time = frame_time
+        self.detection_pending = True
+        return True
+
+    def needs_detection(self, now):
+        # Frame tanpa gerakan tidak perlu YOLO, hitungan terakhir dipertahankan
+        if not self.detection_pending or self.frame is None:
+            return False
+        if self.motion_gate_enabled and not self.motion_gate.should_detect(self.frame, now):
+            self.detection_pending = False
+            return False
+        return True
+
+    def take_for_detection(self):
+        # Frame baru yang datang selama deteksi berjalan akan masuk batch berikutnya
+        self.detection_pending = False
+        return self.frame
+
+    def update_detection(self, detections, now):
+        # detections: structured array PEOPLE_DTYPE pada koordinat frame display
+        self.tracker.update(detections, now)
+        self.count = self.tracker.count()
+
+    def hold_detection(self):
+        # Jika deteksi error, track dan hitungan terakhir dipertahankan tanpa dianggap "miss"
+        self.count = self.tracker.count()
+
+    def tracked_boxes(self, now):
+        # Box prediksi Kalman untuk frame saat ini, termasuk di antara batch YOLO
+        self.tracker.predict(now)
+        return self.tracker.boxes()
+
+    def publish(self, now):
+        # Dipanggil oleh thread pipeline saja; session membaca snapshot tanpa menyentuh tracker
+        self.snapshot = CameraSnapshot(self.last_seq, self.frame, self.jpeg, self.tracked_boxes(now), self.count, now)
+
+
+class CameraRegistry:
+    def __init__(self):
+        self._cameras = {}
+        self._lock = threading.Lock()
+        self._frame_event = threading.Event()
+
+    def add(self, camera_id, url, count_variable, name=None):
+        with self._lock:
+            camera = self._cameras.get(camera_id)
+            if camera is not None:
+                if camera.url == url and camera.count_variable == count_variable:
+                    camera.name = name or camera.name
+                    return camera
+                camera.stop()
+            camera = Camera(camera_id, url, count_variable, name)
+            self._cameras[camera_id] = camera
+            return camera
+
+    def remove(self, camera_id):
+        with self._lock:
+            camera = self._cameras.pop(camera_id, None)
+        if camera is not None:
+            camera.stop()
+
+    def get(self, camera_id):
+        return self._cameras.get(camera_id)
+
+    def cameras(self):
+        with self._lock:
+            return list(self._cameras.values())
+
+    def sync(self, configs):
+        # configs: {camera_id: (url, count_variable, name)}; kamera lain dihapus
+        for camera_id in [cid for cid in self._cameras if cid not in configs]:
+            self.remove(camera_id)
+        for camera_id, (url, count_variable, name) in configs.items():
+            self.add(camera_id, url, count_variable, name)
+
+    def start_all(self):
+        for camera in self.cameras():
+            camera.start(on_frame=self._frame_event.set)
+
+    def stop_all(self):
+        stopped = 0
+        for camera in self.cameras():
+            if camera.worker is not None:
+                camera.stop()
+                stopped += 1
+        return stopped
+
+    def wait_for_frames(self, timeout):
+        # Tunggu frame baru dari kamera mana pun, lalu ambil frame terbaru semuanya
+        self._frame_event.wait(timeout)
+        self._frame_event.clear()
+        return [camera for camera in self.cameras() if camera.poll()]
+
+    def configure_motion_gate(self, enabled, sensitivity, roi, keepalive, camera_ids=None):
+        for camera in self.cameras():
+            if camera_ids is not None and camera.camera_id not in camera_ids:
+                continue
+            camera.motion_gate_enabled = enabled
+            camera.motion_gate.configure(sensitivity, roi)
+            camera.motion_gate.keepalive = keepalive
+
+    def pending_detection(self, now):
+        return [camera for camera in self.cameras() if camera.needs_detection(now)]
+
+    def motion_gate_stats(self):
+        checks = sum(camera.motion_gate.checks for camera in self.cameras())
+        skipped = sum(camera.motion_gate.skipped for camera in self.cameras())
+        return checks, skipped
+
+    def drain_logs(self):
+        messages = []
+        for camera in self.cameras():
+            if camera.worker is not None:
+                prefix = "" if camera.camera_id == PRIMARY_CAMERA_ID else f"[{camera.name}] "
+                messages.extend(prefix + message for message in camera.worker.drain_log())
+        return messages
@@ -0,0 +1,117 @@
+import cv2
+import numpy as np
+
+# === Parameter Deteksi YOLOv8 ===
+DETECTION_CONF = 0.35      # Threshold deteksi
+DETECTION_IOU = 0.45       # Threshold NMS sedikit lebih tinggi
+DETECTION_MAX_DET = 5      # Kurangi max deteksi untuk performa
+PERSON_MIN_CONF = 0.4      # Confidence minimal untuk dihitung sebagai orang
+DETECTION_SIZE = 320       # Ukuran input model, seimbang antara kecepatan dan akurasi
+DETECTION_BLUR = False     # Gaussian blur ringan sebelum deteksi (opsional)
+
+
+# === Preprocessing Frame untuk Deteksi ===
+# Frame di-resize dan di-letterbox langsung ke buffer input berukuran tepat
+# (slot shared memory worker atau buffer batch yang dipakai ulang), tanpa
+# salinan frame asli, copyMakeBorder, atau letterbox ulang oleh Ultralytics.
+def letterbox_params(shape, size=DETECTION_SIZE):
+    # -> (scale_x, scale_y, pad_x, pad_y, new_w, new_h); hanya bergantung pada ukuran frame
+    height, width = shape[:2]
+    scale = size / max(height, width)
+    new_w = max(1, int(width * scale))
+    new_h = max(1, int(height * scale))
+    pad_x = (size - new_w) // 2
+    pad_y = (size - new_h) // 2
+    return new_w / width, new_h / height, pad_x, pad_y, new_w, new_h
+
+
+def letterbox_into(frame, out, blur=DETECTION_BLUR):
+    # out: array uint8 (size, size, 3) yang sudah dialokasikan; mengembalikan
+    # (scale_x, scale_y, pad_x, pad_y) untuk memetakan box kembali ke frame
+    size = out.shape[0]
+    scale_x, scale_y, pad_x, pad_y, new_w, new_h = letterbox_params(frame.shape, size)
+    if new_h < size:
+        out[:pad_y] = 0
+        out[pad_y + new_h:] = 0
+    if new_w < size:
+        out[:, :pad_x] = 0
+        out[:, pad_x + new_w:] = 0
+    target = out[pad_y:pad_y + new_h, pad_x:pad_x + new_w]
+    if frame.shape[:2] == target.shape[:2]:
+        target[:] = frame
+    else:
+        cv2.resize(frame, (new_w, new_h), dst=target, interpolation=cv2.INTER_AREA)
+    if blur:
+        # Pengurangan noise minimal, hanya pada area gambar
+        cv2.GaussianBlur(target, (3, 3), 0, dst=target)
+    return scale_x, scale_y, pad_x, pad_y
+
+
+class DetectionBuffer:
+    # Buffer batch uint8 (n, size, size, 3) yang dipakai ulang antar panggilan deteksi
+    def __init__(self, size=DETECTION_SIZE):
+        self.size = size
+        self._batch = np.empty((0, size, size, 3), dtype=np.uint8)
+
+    def fill(self, frames, blur=DETECTION_BLUR):
+        if len(frames) > len(self._batch):
+            self._batch = np.empty((len(frames), self.size, self.size, 3), dtype=np.uint8)
+        batch = self._batch[:len(frames)]
+        letterboxes = [letterbox_into(frame, slot, blur) for frame, slot in zip(frames, batch)]
+        return batch, letterboxes
+
+
+def optimize_frame_for_detection(frame, size=DETECTION_SIZE, blur=DETECTION_BLUR):
+    # Versi satu frame (alokasi baru), untuk skrip ekspor/kalibrasi
+    detection_frame = np.empty((size, size, 3), dtype=np.uint8)
+    letterbox = letterbox_into(frame, detection_frame, blur)
+    return detection_frame, letterbox
+
+
+# === Skala Hasil Deteksi ke Frame Display ===
+# Hasil akhir per frame adalah structured array PEOPLE_DTYPE yang dipakai
+# langsung oleh hitungan, tracker, gambar box dan telemetry.
+PEOPLE_DTYPE = np.dtype([
+    ("x1", np.int32), ("y1", np.int32), ("x2", np.int32), ("y2", np.int32),
+    ("conf", np.float32),
+    ("track_id", np.int32),  # 0 untuk deteksi yang belum melewati tracker
+])
+BOX_FIELDS = ["x1", "y1", "x2", "y2"]
+
+
+def people_array(boxes, confs, track_ids=0):
+    # boxes: (k, 4) koordinat frame, confs: (k,) -> structured array PEOPLE_DTYPE
+    people = np.empty(len(boxes), dtype=PEOPLE_DTYPE)
+    for i, name in enumerate(BOX_FIELDS):
+        people[name] = boxes[:, i]
+    people["conf"] = confs
+    people["track_id"] = track_ids
+    return people
+
+
+def scale_people_boxes(frame, letterbox, detections):
+    # detections: array (k, 6) [x1, y1, x2, y2, conf, cls] pada koordinat input model;
+    # letterbox: (scale_x, scale_y, pad_x, pad_y) dari letterbox_into / letterbox_params.
+    # Filter kelas/confidence, pemetaan balik letterbox dan konversi int dalam operasi array.
+    h, w = frame.shape[:2]
+    scale_x, scale_y, pad_x, pad_y = letterbox[:4]
+    dets = np.asarray(detections, dtype=np.float32).reshape(-1, 6)
+    dets = dets[(dets[:, 5] == 0) & (dets[:, 4] > PERSON_MIN_CONF)]
+    boxes = (dets[:, :4] - (pad_x, pad_y, pad_x, pad_y)) / (scale_x, scale_y, scale_x, scale_y)
+    np.clip(boxes, 0, (w, h, w, h), out=boxes)
+    boxes = boxes.astype(np.int32)
+    visible = (boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])  # Box di luar frame/padding
+    return people_array(boxes[visible], dets[visible, 4])
+
+
+# === Deteksi Orang Batch (banyak kamera, satu panggilan model) ===
+def detect_people_batch(engine, frames, buffer=None):
+    # Semua frame diproses dalam satu panggilan backend sehingga overhead
+    # per panggilan dan pemanfaatan CPU dibagi ke seluruh kamera
+    buffer = buffer or DetectionBuffer(getattr(engine, "imgsz", DETECTION_SIZE))
+    detection_frames, letterboxes = buffer.fill(frames)
+    detections = engine.predict(detection_frames)
+    return [
+        scale_people_boxes(frame, letterbox, dets)
+        for frame, letterbox, dets in zip(frames, letterboxes, detections)
+    ]
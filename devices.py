@@ -0,0 +1,185 @@
+import threading
+
+import numpy as np
+
+# === Registry Perangkat ===
+# Semua perangkat (lampu, AC, ...) didaftarkan di satu tabel per proses
+# server: metadata di record ber-__slots__, state (nyala/mati, setpoint) di
+# array numpy yang diindeks posisi perangkat. Kontrol manual, perintah AI,
+# jadwal dan telemetry memakai jalur yang sama: ubah state sekumpulan
+# perangkat lalu kirim hanya variabel Ubidots yang benar-benar berubah.
+
+DEFAULT_ROOM = "Ruang Utama"
+
+# Jenis perangkat: label tampilan dan kemampuan yang didukung
+DEVICE_KINDS = {
+    "light": ("Lampu", ("power", "schedule")),
+    "ac": ("AC", ("power", "setpoint", "schedule")),
+}
+
+
+class Device:
+    __slots__ = ("index", "device_id", "kind", "name", "room", "variable", "setpoint_variable", "capabilities")
+
+    def __init__(self, index, device_id, kind, name, room, variable, setpoint_variable=None):
+        self.index = index
+        self.device_id = device_id
+        self.kind = kind
+        self.name = name
+        self.room = room
+        self.variable = variable                    # Variabel Ubidots untuk nyala/mati
+        self.setpoint_variable = setpoint_variable  # Variabel Ubidots setpoint (mis. suhu AC)
+        self.capabilities = DEVICE_KINDS[kind][1]
+
+    def supports(self, capability):
+        return capability in self.capabilities
+
+    @property
+    def label(self):
+        return DEVICE_KINDS[self.kind][0]
+
+
+class DeviceRegistry:
+    def __init__(self, capacity=16):
+        self._lock = threading.RLock()
+        self._devices = []   # Device per indeks
+        self._by_id = {}
+        self._by_room = {}   # ruangan -> [indeks]
+        self._by_kind = {}   # jenis -> [indeks]
+        self.power = np.zeros(capacity, dtype=np.int8)
+        self.setpoint = np.zeros(capacity, dtype=np.float32)
+        self._listeners = []  # Dipanggil (device, "power"/"setpoint", nilai) untuk setiap perubahan state
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def _notify(self, indices, field, value):
+        for index in indices:
+            for callback in self._listeners:
+                callback(self._devices[index], field, value)
+
+    @classmethod
+    def from_config(cls, configs):
+        # configs: [{"id", "kind", "name", "variable", "room", "setpoint_variable", "setpoint"}]
+        registry = cls(capacity=max(16, len(configs)))
+        for config in configs:
+            registry.add(
+                config["id"], config["kind"], config.get("name", config["id"]), config["variable"],
+                room=config.get("room", DEFAULT_ROOM),
+                setpoint_variable=config.get("setpoint_variable"),
+                setpoint=config.get("setpoint", 0),
+            )
+        return registry
+
+    def add(self, device_id, kind, name, variable, room=DEFAULT_ROOM, setpoint_variable=None, setpoint=0):
+        if kind not in DEVICE_KINDS:
+            raise ValueError(f"Jenis perangkat tidak dikenal: {kind}")
+        with self._lock:
+            if device_id in self._by_id:
+                raise ValueError(f"Perangkat sudah terdaftar: {device_id}")
+            index = len(self._devices)
+            if index == len(self.power):
+                # Array state tumbuh dua kali lipat seperti list
+                self.power = np.concatenate([self.power, np.zeros_like(self.power)])
+                self.setpoint = np.concatenate([self.setpoint, np.zeros_like(self.setpoint)])
+            device = Device(index, device_id, kind, name, room, variable, setpoint_variable)
+            self._devices.append(device)
+            self._by_id[device_id] = device
+            self._by_room.setdefault(room, []).append(index)
+            self._by_kind.setdefault(kind, []).append(index)
+            self.setpoint[index] = setpoint
+            return device
+
+    # --- Pencarian ---
+    def __len__(self):
+        return len(self._devices)
+
+    def __contains__(self, device_id):
+        return device_id in self._by_id
+
+    def get(self, device_id):
+        return self._by_id.get(device_id)
+
+    def rooms(self):
+        return list(self._by_room)
+
+    def kinds(self):
+        return list(self._by_kind)
+
+    def devices(self, kind=None, room=None, capability=None):
+        if kind is not None and room is not None:
+            indices = sorted(set(self._by_kind.get(kind, ())) & set(self._by_room.get(room, ())))
+        elif kind is not None:
+            indices = self._by_kind.get(kind, ())
+        elif room is not None:
+            indices = self._by_room.get(room, ())
+        else:
+            indices = range(len(self._devices))
+        devices = [self._devices[i] for i in indices]
+        if capability is not None:
+            devices = [device for device in devices if device.supports(capability)]
+        return devices
+
+    def primary(self, kind, room=None):
+        # Perangkat pertama dengan jenis tersebut (di ruangan tertentu jika diberikan)
+        devices = self.devices(kind=kind, room=room)
+        return devices[0] if devices else None
+
+    def is_on(self, device):
+        return bool(self.power[device.index])
+
+    def setpoint_of(self, device):
+        return int(self.setpoint[device.index])
+
+    def any_on(self, devices):
+        return bool(devices) and bool(self.power[[device.index for device in devices]].any())
+
+    # --- Kontrol (mengembalikan {variabel: nilai} yang berubah untuk dikirim ke Ubidots) ---
+    def set_power(self, devices, on):
+        value = 1 if on else 0
+        with self._lock:
+            indices = np.array([device.index for device in devices], dtype=np.intp)
+            changed = indices[self.power[indices] != value]
+            self.power[changed] = value
+            self._notify(changed, "power", value)
+            values = {}
+            for index in changed:
+                device = self._devices[index]
+                values[device.variable] = value
+                if on and device.setpoint_variable:
+                    values[device.setpoint_variable] = int(self.setpoint[index])
+            return values
+
+    def set_setpoint(self, devices, setpoint, only_on=False):
+        # only_on: kirim setpoint hanya untuk perangkat yang sedang menyala (state tetap disimpan)
+        with self._lock:
+            devices = [device for device in devices if device.supports("setpoint")]
+            indices = np.array([device.index for device in devices], dtype=np.intp)
+            changed = indices[self.setpoint[indices] != setpoint]
+            self.setpoint[changed] = setpoint
+            self._notify(changed, "setpoint", setpoint)
+            return {
+                self._devices[index].setpoint_variable: int(setpoint)
+                for index in changed
+                if self._devices[index].setpoint_variable and (not only_on or self.power[index])
+            }
+
+    def state_values(self, devices=None):
+        # State terkini untuk telemetry berkala; setpoint hanya untuk perangkat yang menyala
+        devices = self._devices if devices is None else devices
+        values = {}
+        for device in devices:
+            values[device.variable] = int(self.power[device.index])
+            if device.setpoint_variable and self.power[device.index]:
+                values[device.setpoint_variable] = int(self.setpoint[device.index])
+        return values
+
+    def summary(self):
+        # "Ruang Utama: Lampu (ON), AC (OFF)" per ruangan, untuk konteks AI dan panel detail
+        lines = []
+        for room, indices in self._by_room.items():
+            states = ", ".join(
+                f"{self._devices[i].name} ({'ON' if self.power[i] else 'OFF'})" for i in indices
+            )
+            lines.append(f"{room}: {states}")
+        return lines
@@ -0,0 +1,301 @@
+import datetime
+import threading
+import time
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+# === Ringkasan Aktivitas Inkremental ===
+# Ringkasan terstruktur per hari untuk konteks AI: interval ruangan terisi,
+# interval nyala perangkat, suhu min/maks, transisi jadwal dan error. Setiap
+# sampel time-series (listener TimeSeriesStore), transisi jadwal atau error
+# log dilipat ke hari berjalan dalam O(1). Saat dibaca, ringkasan dibentuk
+# menjadi blok teks pendek dengan batas token, jadi konteks AI mencakup
+# seharian penuh tanpa mengirim ratusan baris log mentah. Interval yang
+# diikuti jeda tanpa sampel lebih dari max_hold (mis. server mati) ditutup
+# pada sampel terakhir sebelum jeda.
+
+CHARS_PER_TOKEN = 4  # Perkiraan kasar untuk batas token
+
+
+def day_start(timestamp):
+    day = datetime.date.fromtimestamp(timestamp)
+    return datetime.datetime.combine(day, datetime.time()).timestamp()
+
+
+def _clock(timestamp):
+    return time.strftime("%H:%M", time.localtime(timestamp))
+
+
+def _duration(seconds):
+    hours, minutes = divmod(int(seconds) // 60, 60)
+    return f"{hours}j {minutes:02d}m" if hours else f"{minutes}m"
+
+
+class Intervals:
+    # Interval nyala/terisi dalam satu hari; celah pendek digabung, jumlah interval dibatasi
+    __slots__ = ("spans", "since", "total", "starts", "merge_gap", "capacity")
+
+    def __init__(self, merge_gap=120.0, capacity=48):
+        self.spans = []      # [mulai, selesai] interval yang sudah ditutup
+        self.since = None    # Awal interval yang masih terbuka
+        self.total = 0.0     # Detik dalam interval tertutup
+        self.starts = 0      # Berapa kali interval dimulai
+        self.merge_gap = merge_gap
+        self.capacity = capacity
+
+    def start(self, timestamp):
+        if self.since is None:
+            self.since = timestamp
+            self.starts += 1
+
+    def stop(self, timestamp):
+        if self.since is None:
+            return
+        self.total += timestamp - self.since
+        if self.spans and (self.since - self.spans[-1][1] <= self.merge_gap or len(self.spans) >= self.capacity):
+            self.spans[-1][1] = timestamp  # Hanya tampilan; total tetap menghitung durasi sebenarnya
+        else:
+            self.spans.append([self.since, timestamp])
+        self.since = None
+
+    def seconds(self, now):
+        return self.total + (now - self.since if self.since is not None else 0.0)
+
+    def describe(self, limit):
+        # "08:02-10:15, 13:00-sekarang"; hanya limit interval terakhir
+        texts = [f"{_clock(start)}-{_clock(end)}" for start, end in self.spans]
+        if self.since is not None:
+            texts.append(f"{_clock(self.since)}-sekarang")
+        if len(texts) > limit:
+            texts = ["..."] + texts[-limit:] if limit else []
+        return ", ".join(texts)
+
+
+class DayDigest:
+    def __init__(self, start, merge_gap, max_intervals):
+        self.start = start
+        self.end = start
+        self.merge_gap = merge_gap
+        self.max_intervals = max_intervals
+        self.occupancy = {}          # ruangan -> Intervals saat ada orang
+        self.peak = {}               # ruangan -> jumlah orang maksimal
+        self.power = {}              # id perangkat -> Intervals saat nyala
+        self.temperature = {}        # ruangan -> [min, maks, terakhir]
+        self.schedules = Counter()   # (id perangkat, aksi) -> jumlah transisi
+        self.errors = Counter()      # kode -> jumlah
+        self.last_error = None       # (waktu, teks)
+        self.events = 0
+
+    def intervals(self, table, key):
+        intervals = table.get(key)
+        if intervals is None:
+            intervals = table[key] = Intervals(self.merge_gap, self.max_intervals)
+        return intervals
+
+
+class ActivityDigest:
+    def __init__(self, days=2, merge_gap=120.0, max_intervals=48, max_hold=900.0):
+        self.days = days                    # Jumlah hari yang disimpan (hari ini + kemarin)
+        self.merge_gap = merge_gap          # Celah (detik) yang digabung saat menampilkan interval
+        self.max_intervals = max_intervals  # Interval per perangkat/ruangan per hari
+        self.max_hold = max_hold            # Jeda antar sampel yang lebih lama dari ini menutup interval
+        self._lock = threading.Lock()
+        self._days = OrderedDict()          # awal hari -> DayDigest
+        self._seen = {}                     # seri -> waktu sampel terakhir
+        self.events = 0
+
+    # --- Sumber event ---
+    def attach(self, store):
+        # Isi dari riwayat hari yang disimpan, lalu ikuti sampel baru
+        self.backfill(store)
+        store.add_listener(self.record)
+
+    def backfill(self, store):
+        now = time.time()
+        start = day_start(now - (self.days - 1) * 86400)
+        names, times, values, indices, previous, lasts = [], [], [], [], [], {}
+        for series in store.series():
+            if series.split("/", 1)[0] not in ("people", "power", "temperature"):
+                continue
+            samples = store.query(series, start, now + 1)
+            if not len(samples):
+                continue
+            t = samples["t"]
+            # Hanya perubahan nilai dan sampel di sekitar jeda panjang yang mengubah ringkasan
+            gap = np.diff(t) > self.max_hold
+            keep = np.r_[True, samples["v"][1:] != samples["v"][:-1]] | np.r_[gap, False] | np.r_[False, gap]
+            times.append(t[keep])
+            values.append(samples["v"][keep])
+            indices.append(np.full(int(keep.sum()), len(names)))
+            previous.append(np.r_[np.nan, np.where(gap, t[:-1], np.nan)][keep])
+            names.append(series)
+            lasts[series] = float(t[-1])
+        if not names:
+            return
+        # Semua seri diputar ulang berurutan waktu supaya pergantian hari konsisten
+        times, values, indices = np.concatenate(times), np.concatenate(values), np.concatenate(indices)
+        previous = np.concatenate(previous)
+        with self._lock:
+            for i in np.argsort(times, kind="stable"):
+                gap_start = None if np.isnan(previous[i]) else float(previous[i])
+                self._apply(names[indices[i]], float(times[i]), float(values[i]), gap_start)
+            self._seen.update(lasts)
+            # Seri tanpa sampel baru selama max_hold: server sempat mati, interval ditutup di sampel terakhir
+            for series, last in lasts.items():
+                if now - last > self.max_hold:
+                    self._close(series, last)
+
+    def record(self, series, timestamp, value):
+        kind = series.partition("/")[0]
+        if kind not in ("people", "power", "temperature"):
+            return
+        with self._lock:
+            last = self._seen.get(series)
+            self._seen[series] = timestamp
+            gap_start = last if last is not None and timestamp - last > self.max_hold else None
+            self._apply(series, timestamp, value, gap_start)
+
+    def _apply(self, series, timestamp, value, gap_start=None):
+        kind, _, name = series.partition("/")
+        if gap_start is not None:
+            self._close(series, gap_start)
+        day = self._day(timestamp)
+        if day is None:
+            return
+        if kind == "people":
+            day.peak[name] = max(day.peak.get(name, 0), int(value))
+            self._switch(day.intervals(day.occupancy, name), value > 0, timestamp)
+        elif kind == "power":
+            self._switch(day.intervals(day.power, name), value > 0, timestamp)
+        else:
+            stats = day.temperature.get(name)
+            if stats is None:
+                day.temperature[name] = [value, value, value]
+            else:
+                stats[0], stats[1], stats[2] = min(stats[0], value), max(stats[1], value), value
+        self._count(day, timestamp)
+
+    def schedule(self, device_id, action, timestamp=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            day = self._day(timestamp)
+            if day is not None:
+                day.schedules[(device_id, action)] += 1
+                self._count(day, timestamp)
+
+    def log_record(self, record):
+        # Listener EventLog: hanya record level error yang dihitung
+        if record.level != "error":
+            return
+        with self._lock:
+            day = self._day(record.time)
+            if day is not None:
+                day.errors[record.code] += 1
+                day.last_error = (record.time, str(record.fields.get("error", record.code)))
+                self._count(day, record.time)
+
+    def _close(self, series, timestamp):
+        # Interval seri berhenti di timestamp; lanjutan yang dibuka tengah malam sesudahnya dibatalkan
+        kind, _, name = series.partition("/")
+        if kind not in ("people", "power"):
+            return
+        opened = day_start(timestamp)
+        for day in self._days.values():
+            intervals = (day.occupancy if kind == "people" else day.power).get(name)
+            if intervals is None or intervals.since is None:
+                continue
+            if day.start == opened:
+                intervals.stop(max(timestamp, intervals.since))
+            elif day.start > opened and intervals.since == day.start:
+                intervals.since = None
+                intervals.starts -= 1
+
+    def _count(self, day, timestamp):
+        day.events += 1
+        day.end = max(day.end, timestamp)
+        self.events += 1
+
+    @staticmethod
+    def _switch(intervals, on, timestamp):
+        if on:
+            intervals.start(timestamp)
+        else:
+            intervals.stop(timestamp)
+
+    def _day(self, timestamp):
+        start = day_start(timestamp)
+        day = self._days.get(start)
+        if day is not None:
+            return day
+        latest = next(reversed(self._days.values()), None)
+        if latest is not None and start < latest.start:
+            return None  # Event terlambat untuk hari yang sudah ditutup
+        day = self._days[start] = DayDigest(start, self.merge_gap, self.max_intervals)
+        if latest is not None:
+            # Interval yang masih terbuka ditutup tengah malam dan dilanjutkan di hari baru
+            for table, new_table in ((latest.occupancy, day.occupancy), (latest.power, day.power)):
+                for key, intervals in table.items():
+                    if intervals.since is not None:
+                        intervals.stop(start)
+                        day.intervals(new_table, key).start(start)
+            latest.end = start
+        while len(self._days) > self.days:
+            self._days.popitem(last=False)
+        return day
+
+    # --- Teks untuk konteks AI ---
+    def render(self, labels=None, max_tokens=300, now=None):
+        # labels: {id perangkat: nama tampilan}; interval dipangkas sampai teks muat dalam max_tokens
+        labels = labels or {}
+        now = time.time() if now is None else now
+        with self._lock:
+            days = list(reversed(self._days.values()))  # Hari ini dulu
+            for limit in (6, 3, 1, 0):
+                lines = [line for day in days for line in self._lines(day, labels, now, limit)]
+                text = "\n".join(lines)
+                if len(text) <= max_tokens * CHARS_PER_TOKEN:
+                    return text
+        # Masih terlalu panjang: buang baris paling akhir (hari yang lebih lama)
+        budget = max_tokens * CHARS_PER_TOKEN - len("\n...")
+        kept, size = [], 0
+        for line in lines:
+            size += len(line) + 1
+            if size > budget:
+                kept.append("...")
+                break
+            kept.append(line)
+        return "\n".join(kept)
+
+    def _lines(self, day, labels, now, limit):
+        today = day.start == day_start(now)
+        end = now if today else day.start + 86400
+        title = "Hari ini" if today else datetime.date.fromtimestamp(day.start).isoformat()
+        lines = [f"{title} ({_clock(day.start)}-{_clock(end) if today else '24:00'}):"]
+        for room, intervals in day.occupancy.items():
+            spans = intervals.describe(limit)
+            lines.append(
+                f"- Orang di {room}: ada {_duration(intervals.seconds(end))} dalam {intervals.starts} periode"
+                + (f" ({spans})" if spans else "") + f", maksimal {day.peak.get(room, 0)} orang"
+            )
+        for device_id, intervals in day.power.items():
+            spans = intervals.describe(limit)
+            lines.append(
+                f"- {labels.get(device_id, device_id)}: nyala {_duration(intervals.seconds(end))}, {intervals.starts}x"
+                + (f" ({spans})" if spans else "")
+            )
+        for room, (low, high, last) in day.temperature.items():
+            lines.append(f"- Suhu {room}: {low:.1f}-{high:.1f}°C, terakhir {last:.1f}°C")
+        if day.schedules:
+            schedules = ", ".join(
+                f"{labels.get(device_id, device_id)} {'nyala' if action == 'on' else 'mati'} {count}x"
+                for (device_id, action), count in day.schedules.items()
+            )
+            lines.append(f"- Jadwal: {schedules}")
+        if day.errors:
+            errors = ", ".join(f"{code} {count}x" for code, count in day.errors.most_common(3))
+            error_time, error_text = day.last_error
+            lines.append(f"- Error: {errors}; terakhir {_clock(error_time)}: {error_text[:80]}")
+        if len(lines) == 1:
+            lines.append("- Tidak ada aktivitas tercatat")
+        return lines
@@ -0,0 +1,489 @@
+import re
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+import requests
+
+# === Parser MJPEG Inkremental untuk ESP32-CAM ===
+# ESP32-CAM mengirim multipart/x-mixed-replace, setiap part berisi header
+# "Content-Length" diikuti satu JPEG utuh. Parser ini menyimpan semua byte
+# dalam satu bytearray, melanjutkan pemindaian dari posisi terakhir, dan
+# mengembalikan frame sebagai memoryview tanpa menyalin data.
+
+SOI = b"\xff\xd8"
+EOI = b"\xff\xd9"
+HEADER_END = b"\r\n\r\n"
+CONTENT_LENGTH_PATTERN = re.compile(rb"content-length:\s*(\d+)", re.IGNORECASE)
+
+DEFAULT_MAX_FRAME_BYTES = 1024 * 1024  # 1 MB, jauh di atas frame UXGA ESP32-CAM
+MAX_HEADER_BYTES = 256
+HEADER_PROBE_BYTES = 512  # Cukup untuk header part + awal JPEG
+
+
+class MjpegParser:
+    """Parser MJPEG streaming yang menghasilkan frame JPEG sebagai memoryview.
+
+    Memoryview yang dikembalikan oleh feed() hanya valid sampai feed()
+    berikutnya dipanggil, jadi decode frame sebelum memasukkan chunk baru.
+    """
+
+    def __init__(self, max_frame_bytes=DEFAULT_MAX_FRAME_BYTES):
+        self.max_frame_bytes = max_frame_bytes
+        self._buf = bytearray()
+        self._pos = 0            # Awal data yang belum dikonsumsi
+        self._scan = 0           # Posisi lanjutan pencarian marker
+        self._frame_start = -1   # Offset SOI frame yang sedang dirakit
+        self._frame_end = -1     # Offset akhir frame jika Content-Length diketahui
+        self._views = []
+
+        # Statistik untuk monitoring
+        self.frames = 0
+        self.frames_by_length = 0
+        self.bytes_discarded = 0
+        self.resyncs = 0
+
+    def reset(self):
+        self._release_views()
+        self._buf = bytearray()
+        self._pos = self._scan = 0
+        self._frame_start = self._frame_end = -1
+
+    def bytes_wanted(self, default):
+        # Jika panjang frame diketahui, minta tepat sisa byte frame tersebut
+        # supaya chunk besar tidak menambah latensi
+        if self._frame_end != -1:
+            remaining = self._frame_end - len(self._buf)
+            if remaining > 0:
+                return remaining
+        # Kamera yang mengirim Content-Length: baca header dalam potongan kecil
+        if self.frames_by_length:
+            return min(default, HEADER_PROBE_BYTES)
+        return default
+
+    def feed(self, chunk):
+        self._compact()
+        if chunk:
+            self._buf.extend(chunk)
+
+        frames = []
+        while True:
+            frame = self._next_frame()
+            if frame is None:
+                break
+            frames.append(frame)
+
+        # Lindungi dari stream rusak yang tidak pernah menutup frame
+        pending_start = self._frame_start if self._frame_start != -1 else self._pos
+        if len(self._buf) - pending_start > self.max_frame_bytes:
+            self.bytes_discarded += len(self._buf) - self._pos
+            self.resyncs += 1
+            self._pos = self._scan = len(self._buf)
+            self._frame_start = self._frame_end = -1
+
+        return frames
+
+    def _next_frame(self):
+        buf = self._buf
+
+        if self._frame_start == -1:
+            start = buf.find(SOI, max(self._scan, self._pos))
+            if start == -1:
+                # Simpan byte terakhir karena marker bisa terpotong antar chunk
+                self._scan = max(self._pos, len(buf) - 1)
+                return None
+            self._frame_start = start
+            self._frame_end = self._content_end(start)
+            self._scan = start + 2
+
+        start = self._frame_start
+        if self._frame_end != -1:
+            end = self._frame_end
+            if len(buf) < end:
+                return None
+            if buf[end - 2:end] == EOI:
+                self.frames_by_length += 1
+                return self._emit(start, end)
+            # Content-Length tidak cocok dengan isi, kembali ke pencarian EOI
+            self._frame_end = -1
+            self.resyncs += 1
+
+        end = buf.find(EOI, max(self._scan, start + 2))
+        if end == -1:
+            self._scan = max(start + 2, len(buf) - 1)
+            return None
+        return self._emit(start, end + 2)
+
+    def _content_end(self, start):
+        # Header part berada di antara data terakhir yang dikonsumsi dan SOI
+        # (header ESP32-CAM < 256 byte, cukup salin bagian kecil ini saja)
+        header = bytes(self._buf[max(self._pos, start - MAX_HEADER_BYTES):start])
+        if not header.endswith(HEADER_END):
+            return -1
+        match = CONTENT_LENGTH_PATTERN.search(header)
+        if match is None:
+            return -1
+        length = int(match.group(1))
+        if length < 4 or length > self.max_frame_bytes:
+            return -1
+        return start + length
+
+    def _emit(self, start, end):
+        self.bytes_discarded += start - self._pos
+        view = memoryview(self._buf)[start:end]
+        self._views.append(view)
+        self._pos = self._scan = end
+        self._frame_start = self._frame_end = -1
+        self.frames += 1
+        return view
+
+    def _release_views(self):
+        for view in self._views:
+            try:
+                view.release()
+            except BufferError:
+                pass
+        self._views = []
+
+    def _compact(self):
+        self._release_views()
+        if self._pos == 0:
+            return
+
+        offset = self._pos
+        try:
+            del self._buf[:offset]
+        except BufferError:
+            # Pemanggil masih memegang buffer turunan (mis. numpy array),
+            # pindahkan sisa data ke buffer baru dan biarkan buffer lama
+            self._buf = bytearray(memoryview(self._buf)[offset:])
+        self._pos = 0
+        self._scan = max(0, self._scan - offset)
+        if self._frame_start != -1:
+            self._frame_start -= offset
+        if self._frame_end != -1:
+            self._frame_end -= offset
+
+
+# === Format ESP32 URL ===
+def format_esp32_url(url):
+    # Format URL dengan benar untuk ESP32-CAM
+    if not url.startswith("http"):
+        url = "http://" + url
+
+    # Pastikan port 81 ada
+    if ":81" not in url:
+        # Hapus port lain jika ada
+        if ":" in url[8:]:  # 8 karakter = "http://" 
+            parts = url.split(":")
+            url = parts[0] + ":" + parts[1].split("/")[0]  # Ambil bagian host saja
+            url = url + ":81"
+        else:
+            url = url + ":81"
+
+    # Pastikan path /stream ada di akhir
+    if not url.endswith("/stream"):
+        # Hapus path lain jika ada
+        if "/" in url[8:] and ":" in url:
+            # Ambil base URL dengan port
+            base_parts = url.split("/")
+            url = base_parts[0] + "//" + base_parts[2]
+            if ":" not in url:
+                url = url + ":81"
+            url = url + "/stream"
+        else:
+            url = url + "/stream"
+
+    return url
+
+
+# === Decode JPEG Resolusi Tereduksi ===
+# libjpeg dapat men-decode langsung ke 1/2, 1/4 atau 1/8 resolusi dengan
+# menskalakan koefisien DCT, sehingga gambar resolusi penuh tidak pernah
+# dibuat di memori. Faktor dipilih sebesar mungkin selama hasilnya masih
+# lebih besar atau sama dengan ukuran input detector.
+
+REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+# Marker SOF (baseline, progressive, dll.) yang menyimpan dimensi gambar
+SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def jpeg_dimensions(jpeg):
+    # Baca (lebar, tinggi) dari header SOF tanpa men-decode gambar
+    i = 2
+    n = len(jpeg)
+    while i + 9 < n:
+        if jpeg[i] != 0xFF:
+            return None
+        marker = jpeg[i + 1]
+        if marker == 0xFF:  # Fill byte
+            i += 1
+            continue
+        if marker in SOF_MARKERS:
+            height = (jpeg[i + 5] << 8) | jpeg[i + 6]
+            width = (jpeg[i + 7] << 8) | jpeg[i + 8]
+            return width, height
+        if 0xD0 <= marker <= 0xD9 or marker == 0x01:  # Marker tanpa panjang
+            i += 2
+            continue
+        i += 2 + ((jpeg[i + 2] << 8) | jpeg[i + 3])
+    return None
+
+
+def reduced_decode_flag(source_size, target_size):
+    # Pilih flag IMREAD_REDUCED_COLOR_* terbesar yang tidak lebih kecil dari target
+    if not source_size or not target_size:
+        return cv2.IMREAD_COLOR, 1
+    src_w, src_h = source_size
+    dst_w, dst_h = target_size
+    for factor, flag in REDUCED_DECODE_FLAGS:
+        if src_w // factor >= dst_w and src_h // factor >= dst_h:
+            return flag, factor
+    return cv2.IMREAD_COLOR, 1
+
+
+def _decode(jpeg, frame_size, source_size):
+    # (frame hasil akhir, ukuran hasil decode sebelum resize, faktor reduksi)
+    flag, factor = reduced_decode_flag(source_size, frame_size)
+    frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), flag)
+    if frame is None or frame.size == 0:
+        return None, None, factor
+    decoded = (frame.shape[1], frame.shape[0])
+    # Sisa skala (mis. SVGA/2 = 400x300) diselesaikan dengan resize kecil
+    if frame_size and decoded != frame_size:
+        frame = cv2.resize(frame, frame_size, interpolation=cv2.INTER_AREA)
+    return frame, decoded, factor
+
+
+def decode_frame(jpeg, frame_size, source_size=None):
+    # source_size: dimensi sumber yang sudah diketahui; None = baca dari header SOF
+    frame, _, _ = _decode(jpeg, frame_size, source_size or jpeg_dimensions(jpeg))
+    return frame
+
+
+class FrameDecoder:
+    # Dimensi sumber di-cache per stream: header SOF hanya dibaca ulang jika
+    # ukuran hasil decode tidak sesuai (resolusi kamera diganti)
+    def __init__(self, frame_size):
+        self.frame_size = frame_size
+        self.source_size = None
+        self.header_parses = 0
+
+    def decode(self, jpeg):
+        if self.source_size is None:
+            self.source_size = jpeg_dimensions(jpeg)
+            self.header_parses += 1
+        frame, decoded, factor = _decode(jpeg, self.frame_size, self.source_size)
+        if decoded is None:
+            self.source_size = None
+        elif factor == 1:
+            # Decode penuh: ukuran hasil decode adalah ukuran sumber
+            self.source_size = decoded
+        elif decoded != (-(-self.source_size[0] // factor), -(-self.source_size[1] // factor)):
+            self.source_size = None
+        return frame
+
+
+# === Worker Capture ESP32-CAM di Thread Terpisah ===
+# Thread ini membaca stream, men-decode frame, dan hanya menyimpan frame
+# terbaru (single slot). Loop deteksi selalu mengambil frame paling baru,
+# jadi stall jaringan dan reconnect tidak memblokir YOLO maupun UI.
+
+STREAM_HEADERS = {
+    'Connection': 'keep-alive',
+    'Accept': 'multipart/x-mixed-replace; boundary=frame',
+    'Cache-Control': 'no-cache, no-store, must-revalidate',
+    'Pragma': 'no-cache',
+    'Expires': '0',
+    'X-Requested-With': 'XMLHttpRequest'  # Mengurangi overhead HTTP
+}
+
+
+class CaptureWorker:
+    def __init__(self, url, frame_size=(320, 240), max_fps=30, chunk_size=16384, on_frame=None, keep_jpeg=False):
+        self.url = url
+        self.on_frame = on_frame  # Callback opsional setiap ada frame baru
+        self.keep_jpeg = keep_jpeg  # Simpan byte JPEG asli untuk preview tanpa encode ulang
+        self.frame_size = frame_size
+        self._decoder = FrameDecoder(frame_size)
+        self.min_frame_interval = 1.0 / max_fps if max_fps else 0.0
+        self.chunk_size = chunk_size
+        self.timeout = (1.5, 1.5)  # (connect timeout, read timeout)
+        self.max_stream_duration = 30  # Refresh koneksi setiap 30 detik
+        self.min_backoff = 0.3
+        self.max_backoff = 5.0
+
+        self._cond = threading.Condition()
+        self._frame = None
+        self._jpeg = None
+        self._seq = 0
+        self._frame_time = 0.0
+        self._consumed_seq = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._log = deque(maxlen=50)
+
+        # Statistik untuk monitoring
+        self.frames_decoded = 0
+        self.frames_dropped = 0      # Frame tertimpa sebelum sempat diambil
+        self.frames_skipped = 0      # Frame dilewati sebelum decode (batas FPS)
+        self.decode_errors = 0
+        self.reconnects = 0
+        self.connected = False
+        self.fps = 0.0
+
+    # --- API untuk loop deteksi ---
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name=f"esp32-capture-{self.url}", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def latest(self, after_seq=0, timeout=None):
+        # Kembalikan (seq, frame, waktu_frame) terbaru; frame None jika belum
+        # ada frame yang lebih baru dari after_seq dalam batas timeout
+        with self._cond:
+            if self._seq <= after_seq and timeout:
+                self._cond.wait_for(
+                    lambda: self._seq > after_seq or self._stop.is_set(), timeout
+                )
+            if self._seq <= after_seq:
+                return self._seq, None, self._frame_time
+            self._consumed_seq = self._seq
+            return self._seq, self._frame, self._frame_time
+
+    def latest_jpeg(self):
+        # (seq, byte JPEG asli) dari frame terbaru; None jika keep_jpeg nonaktif
+        with self._cond:
+            return self._seq, self._jpeg
+
+    def frame_age(self):
+        with self._cond:
+            if not self._frame_time:
+                return None
+            return time.time() - self._frame_time
+
+    def drain_log(self):
+        messages = []
+        while self._log:
+            messages.append(self._log.popleft())
+        return messages
+
+    # --- Thread capture ---
+    def _publish(self, frame, frame_time, jpeg=None):
+        with self._cond:
+            if self._seq > self._consumed_seq:
+                self.frames_dropped += 1
+            self._frame = frame
+            self._jpeg = jpeg
+            self._frame_time = frame_time
+            self._seq += 1
+            self._cond.notify_all()
+        if self.on_frame is not None:
+            self.on_frame()
+
+    def _run(self):
+        self._log.append(f"🔄 Menghubungkan ke ESP32-CAM: {self.url}")
+        session = requests.Session()
+        session.headers.update(STREAM_HEADERS)
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=1, max_retries=0, pool_block=False
+        )
+        session.mount('http://', adapter)
+
+        backoff = self.min_backoff
+        try:
+            while not self._stop.is_set():
+                try:
+                    if self._read_stream(session):
+                        backoff = self.min_backoff
+                except Exception as e:
+                    self._log.append(f"❌ Error stream: {str(e)[:40]}")
+                self.connected = False
+                if self._stop.is_set():
+                    break
+                # Backoff eksponensial tanpa memblokir loop deteksi
+                self.reconnects += 1
+                self._stop.wait(backoff)
+                backoff = min(self.max_backoff, backoff * 2)
+        finally:
+            self.connected = False
+            session.close()
+
+    def _read_stream(self, session):
+        stream = session.get(self.url, stream=True, timeout=self.timeout)
+        try:
+            if stream.status_code != 200:
+                self._log.append(f"❌ Koneksi gagal: HTTP {stream.status_code}")
+                return False
+
+            self.connected = True
+            parser = MjpegParser()
+            stream_start_time = time.time()
+            last_decode_time = 0.0
+            fps_window_start = time.time()
+            fps_window_frames = 0
+            got_frame = False
+
+            while not self._stop.is_set():
+                if time.time() - stream_start_time > self.max_stream_duration:
+                    self._log.append("🔄 ESP32-CAM connection refresh...")
+                    break
+
+                # Baca tepat sisa byte frame jika Content-Length diketahui
+                chunk = stream.raw.read(
+                    parser.bytes_wanted(self.chunk_size), decode_content=True
+                )
+                if not chunk:
+                    break
+
+                frames = parser.feed(chunk)
+                if not frames:
+                    continue
+
+                now = time.time()
+                self.frames_skipped += len(frames) - 1
+                if now - last_decode_time < self.min_frame_interval:
+                    self.frames_skipped += 1
+                    continue
+
+                # Decode langsung dari memoryview tanpa menyalin data JPEG
+                frame = self._decoder.decode(frames[-1])
+                if frame is None:
+                    self.decode_errors += 1
+                    continue
+
+                last_decode_time = now
+                got_frame = True
+                self.frames_decoded += 1
+                # memoryview hanya valid sampai feed berikutnya, jadi JPEG disalin jika disimpan
+                self._publish(frame, now, bytes(frames[-1]) if self.keep_jpeg else None)
+
+                fps_window_frames += 1
+                if now - fps_window_start >= 5.0:
+                    self.fps = fps_window_frames / (now - fps_window_start)
+                    fps_window_start = now
+                    fps_window_frames = 0
+            return got_frame
+        finally:
+            stream.close()
@@ -0,0 +1,72 @@
+import time
+from collections import Counter, deque, namedtuple
+
+# === Log Terstruktur dengan Kapasitas Tetap ===
+# Log sistem dan riwayat aktivitas disimpan sebagai record (waktu, level,
+# sumber, kode pesan, field) di ring buffer berkapasitas tetap, bukan list
+# f-string yang terus tumbuh. Teks baru dibentuk saat dibaca (expander log,
+# konteks AI). Record yang identik dengan record sebelumnya, atau kode yang
+# ditandai coalesce (FPS, antrian telemetry, ...), hanya menaikkan hitungan
+# pengulangan record terakhir.
+
+LogRecord = namedtuple("LogRecord", ["time", "level", "source", "code", "fields", "repeat"])
+
+TEXT = "text"  # Kode untuk pesan teks jadi (mis. log dari thread capture/MQTT)
+
+
+class EventLog:
+    def __init__(self, messages, capacity=500, timestamps=False):
+        self.messages = messages      # kode -> template str.format atau fungsi(**fields)
+        self.timestamps = timestamps  # Awali teks dengan [HH:MM:SS] (riwayat aktivitas)
+        self._records = deque(maxlen=capacity)
+        self.counts = Counter()       # Jumlah total per kode, termasuk yang sudah keluar dari buffer
+        self._listeners = []          # Dipanggil dengan setiap LogRecord baru/yang diperbarui
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def add(self, code, level="info", source="app", coalesce=False, **fields):
+        self.counts[code] += 1
+        last = self._records[-1] if self._records else None
+        if last is not None and last.code == code and last.source == source and (coalesce or last.fields == fields):
+            # Ganti record terakhir: field terbaru, hitungan pengulangan bertambah
+            record = self._records[-1] = LogRecord(time.time(), level, source, code, fields, last.repeat + 1)
+        else:
+            record = LogRecord(time.time(), level, source, code, fields, 1)
+            self._records.append(record)
+        for callback in self._listeners:
+            callback(record)
+
+    def append(self, text, level="info", source="app"):
+        self.add(TEXT, level=level, source=source, text=text)
+
+    def extend(self, texts, source="app"):
+        for text in texts:
+            self.append(text, source=source)
+
+    def __len__(self):
+        return len(self._records)
+
+    def records(self, limit=None, level=None):
+        records = list(self._records) if level is None else [r for r in self._records if r.level == level]
+        return records[-limit:] if limit else records
+
+    def format(self, record):
+        template = self.messages.get(record.code)
+        if record.code == TEXT:
+            text = record.fields["text"]
+        elif template is None:
+            text = f"{record.code} {record.fields}"
+        elif callable(template):
+            text = template(**record.fields)
+        else:
+            text = template.format(**record.fields)
+        if record.repeat > 1:
+            text += f" (×{record.repeat})"
+        if self.timestamps:
+            text = f"[{time.strftime('%H:%M:%S', time.localtime(record.time))}] {text}"
+        return text
+
+    def tail(self, limit=10):
+        # Teks record terakhir, dibentuk hanya untuk yang dibaca
+        return [self.format(record) for record in self.records(limit)]
@@ -0,0 +1,336 @@
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from detector import DETECTION_MAX_DET, letterbox_into
+
+# === Layanan Inferensi YOLO di Proses Terpisah ===
+# Worker YOLO (backend PyTorch/ONNX Runtime/OpenVINO) berjalan di proses
+# sendiri dengan budget CPU/thread tetap, sehingga tidak berebut GIL dengan
+# thread script Streamlit dan MQTT.
+# Frame dikirim lewat ring shared memory (tanpa pickle), hasil deteksi
+# ditulis kembali ke shared memory sebagai array float32 [x1, y1, x2, y2,
+# conf, cls] per slot. Session UI hanya mengirim batch dan mengambil hasil.
+
+RESULT_FIELDS = 6  # x1, y1, x2, y2, conf, cls
+
+
+def _worker_main(worker_index, backend, model_path, int8, threads, cpus, input_size, slots,
+                 frames_name, results_name, task_queue, result_queue):
+    # Batasi thread BLAS/OpenMP sebelum library inferensi di-import
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+
+    from backends import load_backend
+
+    frames_shm = shared_memory.SharedMemory(name=frames_name)
+    results_shm = shared_memory.SharedMemory(name=results_name)
+    frames = np.ndarray((slots, input_size, input_size, 3), dtype=np.uint8, buffer=frames_shm.buf)
+    results = np.ndarray((slots, DETECTION_MAX_DET, RESULT_FIELDS), dtype=np.float32, buffer=results_shm.buf)
+
+    try:
+        # load_backend juga melakukan warm-up supaya frame pertama tidak terkena cold start
+        engine = load_backend(backend, model_path, int8=int8, imgsz=input_size, threads=threads)
+        result_queue.put(("ready", worker_index, None))
+
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+            batch_id, slot_ids = task
+            # Pool perlu tahu worker mana yang memegang slot task ini (lihat karantina slot)
+            result_queue.put(("started", (batch_id, worker_index), None))
+            try:
+                predictions = engine.predict([frames[slot] for slot in slot_ids])
+                counts = []
+                for slot, data in zip(slot_ids, predictions):
+                    data = data[:DETECTION_MAX_DET, :RESULT_FIELDS]
+                    results[slot, :len(data)] = data
+                    counts.append(len(data))
+                result_queue.put(("result", (batch_id, counts), None))
+            except Exception as e:
+                result_queue.put(("result", (batch_id, None), str(e)))
+    except Exception as e:
+        result_queue.put(("failed", worker_index, str(e)))
+    finally:
+        del frames, results
+        frames_shm.close()
+        results_shm.close()
+
+
+class InferencePool:
+    def __init__(self, backend="pytorch", model_path=None, int8=False, workers=1,
+                 threads_per_worker=None, input_size=320, slots=16, pin_cpus=True):
+        cpu_count = os.cpu_count() or 1
+        self.backend = backend
+        self.model_path = model_path
+        self.int8 = int8
+        self.workers = max(1, workers)
+        self.threads_per_worker = threads_per_worker or max(1, cpu_count // self.workers)
+        self.input_size = input_size
+        self.slots = slots
+        self.pin_cpus = pin_cpus
+        self.stale_timeout = 10.0  # Slot batch yang tidak diambil dianggap terbuang
+        self.quarantine_timeout = 60.0  # Batas akhir karantina jika pesan worker yang crash hilang
+
+        self._ctx = mp.get_context("spawn")  # Aman untuk proses induk yang multi-thread
+        self._task_queue = self._ctx.Queue()
+        self._result_queue = self._ctx.Queue()
+        self._processes = []
+        self._frames_shm = None
+        self._results_shm = None
+        self._frames = None
+        self._results = None
+
+        self._lock = threading.Lock()
+        self._free_slots = list(range(slots))
+        self._inflight = {}     # batch_id -> (slot_ids, waktu submit)
+        self._done = {}         # batch_id -> {parts, counts per part, bagian selesai, error}
+        # Slot batch yang dibatalkan tetap dikarantina sampai worker yang memegangnya
+        # selesai (pesan result) atau mati, supaya tidak ditimpa setelah dipakai ulang
+        self._quarantine = {}   # (batch_id, part) -> (slot_ids, waktu karantina)
+        self._running = {}      # (batch_id, part) -> indeks worker yang sedang mengerjakan
+        self._batch_ids = itertools.count(1)
+
+        # Statistik untuk monitoring
+        self.batches = 0
+        self.frames = 0
+        self.dropped_batches = 0
+        self.last_latency = 0.0
+        self.last_error = None
+
+    # --- Siklus hidup ---
+    def start(self, timeout=120.0):
+        frame_bytes = self.slots * self.input_size * self.input_size * 3
+        result_bytes = self.slots * DETECTION_MAX_DET * RESULT_FIELDS * 4
+        self._frames_shm = shared_memory.SharedMemory(create=True, size=frame_bytes)
+        self._results_shm = shared_memory.SharedMemory(create=True, size=result_bytes)
+        self._frames = np.ndarray((self.slots, self.input_size, self.input_size, 3),
+                                  dtype=np.uint8, buffer=self._frames_shm.buf)
+        self._results = np.ndarray((self.slots, DETECTION_MAX_DET, RESULT_FIELDS),
+                                   dtype=np.float32, buffer=self._results_shm.buf)
+
+        for index in range(self.workers):
+            self._spawn_worker(index)
+
+        # Tunggu semua worker selesai load model dan warm-up
+        ready = 0
+        deadline = time.time() + timeout
+        while ready < self.workers:
+            try:
+                kind, index, error = self._result_queue.get(timeout=max(0.1, deadline - time.time()))
+            except queue.Empty:
+                self.shutdown()
+                raise RuntimeError("Worker inferensi tidak siap dalam batas waktu")
+            if kind == "failed":
+                self.shutdown()
+                raise RuntimeError(f"Worker inferensi {index} gagal: {error}")
+            if kind == "ready":
+                ready += 1
+        return self
+
+    def _cpus_for(self, index):
+        if not self.pin_cpus or not hasattr(os, "sched_getaffinity"):
+            return None
+        available = sorted(os.sched_getaffinity(0))
+        start = index * self.threads_per_worker
+        cpus = available[start:start + self.threads_per_worker]
+        return cpus or None
+
+    def _spawn_worker(self, index):
+        process = self._ctx.Process(
+            target=_worker_main,
+            name=f"yolo-worker-{index}",
+            args=(index, self.backend, self.model_path, self.int8, self.threads_per_worker, self._cpus_for(index),
+                  self.input_size, self.slots, self._frames_shm.name, self._results_shm.name,
+                  self._task_queue, self._result_queue),
+            daemon=True,
+        )
+        process.start()
+        if index < len(self._processes):
+            self._processes[index] = process
+        else:
+            self._processes.append(process)
+
+    def alive_workers(self):
+        return sum(1 for process in self._processes if process.is_alive())
+
+    def _respawn_dead_workers(self):
+        # Worker yang crash dijalankan ulang; task yang sedang dikerjakannya gagal dan slotnya dilepas
+        self._drain_results()
+        for index, process in enumerate(self._processes):
+            if not process.is_alive():
+                self.last_error = f"Worker {index} berhenti (exit {process.exitcode}), dijalankan ulang"
+                with self._lock:
+                    for key in [key for key, worker in self._running.items() if worker == index]:
+                        del self._running[key]
+                        self._finish_part(key, error=self.last_error)
+                self._spawn_worker(index)
+
+    def shutdown(self):
+        for _ in self._processes:
+            self._task_queue.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+        self._frames = self._results = None
+        for shm in (self._frames_shm, self._results_shm):
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+        self._frames_shm = self._results_shm = None
+
+    # --- API client ---
+    def submit(self, frames):
+        # Letterbox frame langsung ke slot shared memory lalu bagi batch ke semua
+        # worker. Mengembalikan batch_id, atau None jika slot penuh (batch dilewati).
+        # Parameter letterbox untuk memetakan box kembali: detector.letterbox_params.
+        n = len(frames)
+        self._respawn_dead_workers()
+        with self._lock:
+            if len(self._free_slots) < n:
+                self._reclaim_stale()
+                self._expire_quarantine()
+            if len(self._free_slots) < n:
+                self.dropped_batches += 1
+                return None
+            slot_ids = [self._free_slots.pop() for _ in range(n)]
+            batch_id = next(self._batch_ids)
+            chunks = min(n, self.workers)
+            self._inflight[batch_id] = (slot_ids, time.time())
+            self._done[batch_id] = {"parts": chunks, "counts": {}, "finished": set(), "error": None}
+
+        for slot, frame in zip(slot_ids, frames):
+            letterbox_into(frame, self._frames[slot])
+
+        # Satu task per worker agar batch dikerjakan paralel
+        for i in range(chunks):
+            self._task_queue.put(((batch_id, i), slot_ids[i::chunks]))
+        return batch_id
+
+    def poll(self, batch_id):
+        # Non-blocking: None jika belum selesai, list array (k, 6) jika selesai
+        self._drain_results()
+        with self._lock:
+            state = self._done.get(batch_id)
+            if state is None:
+                raise RuntimeError("Batch inferensi tidak dikenal atau sudah kedaluwarsa")
+            if state["error"] is None and len(state["counts"]) < state["parts"]:
+                return None
+            error = state["error"]
+            slot_ids, submitted = self._inflight[batch_id]
+            if error:
+                # Bagian lain batch mungkin masih dikerjakan worker: slotnya dikarantina
+                self._retire(batch_id)
+            else:
+                del self._inflight[batch_id], self._done[batch_id]
+                counts = {}
+                for part_counts in state["counts"].values():
+                    counts.update(part_counts)
+                detections = [self._results[slot, :counts[slot]].copy() for slot in slot_ids]
+                self._free_slots.extend(slot_ids)
+
+        if error:
+            raise RuntimeError(error)
+        self.batches += 1
+        self.frames += len(slot_ids)
+        self.last_latency = time.time() - submitted
+        return detections
+
+    def cancel(self, batch_id):
+        with self._lock:
+            self._retire(batch_id)
+
+    def predict(self, frames, timeout=5.0):
+        # Versi blocking dari submit + poll
+        batch_id = self.submit(frames)
+        if batch_id is None:
+            raise RuntimeError("Slot inferensi penuh")
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            detections = self.poll(batch_id)
+            if detections is not None:
+                return detections
+            time.sleep(0.002)
+        self.cancel(batch_id)
+        raise TimeoutError("Inferensi melewati batas waktu")
+
+    def _drain_results(self):
+        while True:
+            try:
+                kind, payload, error = self._result_queue.get_nowait()
+            except queue.Empty:
+                return
+            if kind == "failed":
+                self.last_error = f"Worker {payload}: {error}"
+                continue
+            if kind == "started":
+                key, worker = payload
+                with self._lock:
+                    self._running[key] = worker
+                continue
+            if kind != "result":
+                continue
+            key, counts = payload
+            with self._lock:
+                self._running.pop(key, None)
+                self._finish_part(key, counts, error)
+
+    def _finish_part(self, key, counts=None, error=None):
+        # Dipanggil dengan lock saat worker selesai mengerjakan (atau mati saat mengerjakan) satu bagian batch
+        quarantined = self._quarantine.pop(key, None)
+        if quarantined is not None:
+            self._free_slots.extend(quarantined[0])  # Batch sudah dibatalkan; worker tidak lagi menyentuh slot
+            return
+        batch_id, part = key
+        state = self._done.get(batch_id)
+        entry = self._inflight.get(batch_id)
+        if state is None or entry is None:
+            return
+        state["finished"].add(part)
+        if error or counts is None:
+            state["error"] = error or "Inferensi gagal"
+        else:
+            slot_ids = entry[0][part::state["parts"]]
+            state["counts"][part] = dict(zip(slot_ids, counts))
+
+    def _retire(self, batch_id):
+        # Batch dibatalkan/kedaluwarsa/gagal: slot bagian yang sudah selesai langsung bebas,
+        # sisanya dikarantina sampai result atau kematian worker-nya terlihat di _drain_results
+        entry = self._inflight.pop(batch_id, None)
+        state = self._done.pop(batch_id, None)
+        if entry is None:
+            return
+        slot_ids = entry[0]
+        parts = state["parts"] if state is not None else 1
+        finished = state["finished"] if state is not None else set()
+        now = time.time()
+        for part in range(parts):
+            if part in finished:
+                self._free_slots.extend(slot_ids[part::parts])
+            else:
+                self._quarantine[(batch_id, part)] = (slot_ids[part::parts], now)
+
+    def _reclaim_stale(self):
+        now = time.time()
+        for batch_id, (slot_ids, submitted) in list(self._inflight.items()):
+            if now - submitted > self.stale_timeout:
+                self._retire(batch_id)
+
+    def _expire_quarantine(self):
+        # Cadangan jika pesan "started"/"result" hilang bersama worker yang crash
+        now = time.time()
+        for key, (slot_ids, since) in list(self._quarantine.items()):
+            if now - since > self.quarantine_timeout and key not in self._running:
+                del self._quarantine[key]
+                self._free_slots.extend(slot_ids)
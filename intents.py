@@ -0,0 +1,91 @@
+import re
+from collections import namedtuple
+
+# === Parser Intent Lokal ===
+# Perintah perangkat yang pasti ("nyalakan lampu", "atur suhu 24 derajat",
+# "gunakan ip 192.168.1.10") dikenali tanpa menunggu Gemini. Semua frasa
+# pemicu, slot suhu dan alamat IP digabung menjadi satu regex yang dikompilasi
+# sekali saat modul dimuat, lalu teks dipindai satu kali dengan finditer.
+# Frasa dicocokkan per kata utuh, jadi "nonaktifkan kamera" tidak ikut
+# terbaca sebagai "aktifkan kamera".
+
+# Intent -> frasa pemicu; urutan dict adalah urutan eksekusi
+INTENT_TRIGGERS = {
+    "camera_on": ["nyalakan kamera", "hidupkan kamera", "aktifkan kamera"],
+    "camera_off": ["matikan kamera", "nonaktifkan kamera"],
+    "lamp_on": ["nyalakan lampu", "hidupkan lampu"],
+    "lamp_off": ["matikan lampu", "padamkan lampu"],
+    "set_esp32_ip": ["gunakan ip", "alamat ip", "hubungkan ke ip", "gunakan esp32", "pakai esp32"],
+    "ac_on": ["nyalakan ac", "hidupkan ac", "aktifkan ac"],
+    "ac_off": ["matikan ac", "nonaktifkan ac"],
+    "set_temp": ["atur suhu", "set suhu", "ubah suhu", "suhu ac"],
+}
+
+# Intent yang langsung dijalankan tanpa AI (set_temp hanya jika suhunya disebut)
+ACTION_INTENTS = {"camera_on", "camera_off", "lamp_on", "lamp_off", "ac_on", "ac_off"}
+
+TEMPERATURE_RANGE = (16, 30)  # Range suhu AC yang umum
+
+Command = namedtuple("Command", ["text", "intents", "temperature", "ip", "ip_hint"])
+
+
+def _alternatives(phrases):
+    # Frasa terpanjang dulu; spasi boleh lebih dari satu
+    return "|".join(r"\s+".join(map(re.escape, phrase.split())) for phrase in sorted(phrases, key=len, reverse=True))
+
+
+def _build_pattern():
+    set_temp = _alternatives(INTENT_TRIGGERS["set_temp"])
+    groups = [
+        # "atur suhu (ac) (ke/jadi) 24": slot suhu langsung setelah pemicu set_temp
+        rf"(?P<temp_target>(?:{set_temp})(?:\s+ac)?(?:\s+(?:ke|jadi|menjadi))?\s*(?P<target_value>\d{{1,2}}))",
+        # "24 derajat", "24°C", "24 celsius"
+        r"(?P<temp_unit>(?P<unit_value>\d{1,2})\s*(?:derajat|°\s*c|celsius))",
+        # IPv4 dengan port opsional (mis. 192.168.1.1:81)
+        r"(?P<ip>(?:\d{1,3}\.){3}\d{1,3}(?::\d+)?)",
+    ]
+    groups += [rf"(?P<{intent}>{_alternatives(phrases)})" for intent, phrases in INTENT_TRIGGERS.items()]
+    groups.append(r"(?P<ip_hint>ip|alamat|esp32)")
+    return re.compile(r"(?<!\w)(?:" + "|".join(groups) + r")(?!\w)")
+
+
+_PATTERN = _build_pattern()
+
+
+def is_valid_ip_address(ip):
+    # Setiap oktet harus 0-255
+    return all(0 <= int(part) <= 255 for part in ip.split(":")[0].split("."))
+
+
+def parse_command(text):
+    text = text.lower()
+    intents = set()
+    temperature = ip = None
+    ip_hint = False
+    for match in _PATTERN.finditer(text):
+        group = match.lastgroup
+        if group == "temp_target":
+            intents.add("set_temp")
+            temperature = temperature if temperature is not None else int(match.group("target_value"))
+        elif group == "temp_unit":
+            temperature = temperature if temperature is not None else int(match.group("unit_value"))
+        elif group == "ip":
+            if ip is None and is_valid_ip_address(match.group()):
+                ip = match.group()
+            else:
+                ip_hint = True
+        elif group == "ip_hint":
+            ip_hint = True
+        else:
+            intents.add(group)
+    ip_hint = ip_hint or "set_esp32_ip" in intents
+    return Command(text, frozenset(intents), temperature, ip, ip_hint)
+
+
+def is_actionable(command):
+    # Perintah lengkap yang bisa langsung dijalankan tanpa bertanya ke AI
+    return bool(
+        command.intents & ACTION_INTENTS
+        or ("set_temp" in command.intents and command.temperature is not None)
+        or command.ip is not None
+    )
@@ -0,0 +1,103 @@
+import threading
+import time
+import weakref
+
+# === Cache Model Bersama per Proses ===
+# Model (YOLO lokal, Gemini) dimuat sekali per proses server dan dipinjam
+# oleh setiap session lewat ModelLease. Kunci cache berisi konfigurasi model
+# (backend, path, int8, ...), jadi session dengan konfigurasi sama berbagi
+# satu instance. Model tanpa peminjam tetap disimpan selama idle_timeout
+# detik (reload halaman tidak memicu cold start), lalu dilepas.
+
+
+class ModelLease:
+    # Pinjaman satu session; dilepas otomatis saat session (dan lease) dibuang
+    def __init__(self, cache, key, model):
+        self.key = key
+        self.model = model
+        self._finalizer = weakref.finalize(self, cache._release, key)
+
+    def release(self):
+        self._finalizer()
+
+    @property
+    def active(self):
+        return self._finalizer.alive
+
+
+class _Entry:
+    def __init__(self):
+        self.model = None
+        self.error = None
+        self.refs = 0
+        self.idle_since = None
+        self.load_time = 0.0
+        self.ready = threading.Event()
+
+
+class ModelCache:
+    def __init__(self, idle_timeout=300.0):
+        self.idle_timeout = idle_timeout
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key, loader):
+        # loader() hanya dipanggil sekali per kunci; session lain menunggu hasilnya
+        with self._lock:
+            self._evict_idle()
+            entry = self._entries.get(key)
+            owner = entry is None
+            if owner:
+                entry = self._entries[key] = _Entry()
+            entry.refs += 1
+            entry.idle_since = None
+
+        if owner:
+            start = time.perf_counter()
+            try:
+                entry.model = loader()
+            except Exception as e:
+                entry.error = e
+                with self._lock:
+                    self._entries.pop(key, None)
+            entry.load_time = time.perf_counter() - start
+            entry.ready.set()
+        else:
+            entry.ready.wait()
+
+        if entry.error is not None:
+            if not owner:
+                with self._lock:
+                    entry.refs -= 1
+            raise entry.error
+        return ModelLease(self, key, entry.model)
+
+    def _release(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry.refs -= 1
+            if entry.refs <= 0:
+                entry.refs = 0
+                entry.idle_since = time.time()
+            self._evict_idle()
+
+    def _evict_idle(self):
+        now = time.time()
+        for key, entry in list(self._entries.items()):
+            if entry.idle_since is not None and now - entry.idle_since >= self.idle_timeout:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        # {kunci: (jumlah peminjam, waktu muat detik)} untuk panel detail
+        with self._lock:
+            return {key: (entry.refs, entry.load_time) for key, entry in self._entries.items() if entry.ready.is_set()}
+
+
+# Satu cache untuk seluruh proses; modul ini tidak dieksekusi ulang saat Streamlit rerun
+MODEL_CACHE = ModelCache()
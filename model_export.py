@@ -0,0 +1,260 @@
+"""Ekspor, kuantisasi INT8 dan perbandingan backend YOLOv8n untuk SAKLAR.
+
+Contoh (dijalankan dari root repo):
+    python model_export.py export                       # ONNX + OpenVINO, input 320, head orang saja
+    python model_export.py record --url 192.168.1.50 --frames 300
+    python model_export.py quantize --calib calibration/
+    python model_export.py compare --frames calibration/
+"""
+import argparse
+import os
+import shutil
+import time
+
+import cv2
+import numpy as np
+
+from backends import BACKENDS, MODEL_DIR, default_model_path, frames_to_tensor, load_backend
+from detector import PERSON_MIN_CONF, optimize_frame_for_detection
+from esp32_stream import CaptureWorker, format_esp32_url
+
+IMGSZ = 320
+CALIBRATION_DIR = "calibration"
+
+
+# === Ekspor satu kali ===
+def keep_person_head(onnx_path):
+    # Potong output (B, 84, N) menjadi (B, 5, N): box + skor kelas orang saja,
+    # sehingga transfer output dan NMS tidak lagi memproses 79 kelas lain
+    import onnx
+    from onnx import helper, numpy_helper
+
+    model = onnx.load(onnx_path)
+    graph = model.graph
+    output = graph.output[0]
+    sliced_name = output.name + "_person"
+    constants = {
+        "person_starts": np.array([0], dtype=np.int64),
+        "person_ends": np.array([5], dtype=np.int64),
+        "person_axes": np.array([1], dtype=np.int64),
+    }
+    graph.initializer.extend(numpy_helper.from_array(value, name) for name, value in constants.items())
+    graph.node.append(helper.make_node(
+        "Slice", [output.name, "person_starts", "person_ends", "person_axes"], [sliced_name],
+        name="person_head_slice",
+    ))
+    dims = output.type.tensor_type.shape.dim
+    shape = [d.dim_param or d.dim_value for d in dims]
+    shape[1] = 5
+    graph.output.remove(output)
+    graph.output.append(helper.make_tensor_value_info(sliced_name, output.type.tensor_type.elem_type, shape))
+    onnx.checker.check_model(model)
+    onnx.save(model, onnx_path)
+
+
+def export_models(weights, openvino=True):
+    from ultralytics import YOLO
+
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    onnx_path = default_model_path("onnxruntime")
+    exported = YOLO(weights).export(format="onnx", imgsz=IMGSZ, dynamic=True, simplify=True)
+    shutil.move(exported, onnx_path)
+    keep_person_head(onnx_path)
+    print(f"✅ ONNX: {onnx_path}")
+
+    if openvino:
+        try:
+            import openvino as ov
+        except ImportError:
+            print("⚠️ Paket openvino tidak terpasang, ekspor OpenVINO dilewati")
+            return
+        xml_path = default_model_path("openvino")
+        os.makedirs(os.path.dirname(xml_path), exist_ok=True)
+        ov_model = ov.convert_model(onnx_path, input=[-1, 3, IMGSZ, IMGSZ])
+        ov.save_model(ov_model, xml_path)
+        print(f"✅ OpenVINO: {xml_path}")
+
+
+# === Rekam frame kamera untuk kalibrasi dan perbandingan ===
+def record_frames(url, count, out_dir, interval):
+    os.makedirs(out_dir, exist_ok=True)
+    worker = CaptureWorker(format_esp32_url(url)).start()
+    saved = 0
+    last_seq = 0
+    try:
+        while saved < count:
+            seq, frame, _ = worker.latest(after_seq=last_seq, timeout=5.0)
+            if frame is None:
+                print("⚠️ Tidak ada frame baru dari kamera, mencoba lagi...")
+                continue
+            last_seq = seq
+            cv2.imwrite(os.path.join(out_dir, f"frame_{int(time.time() * 1000)}.jpg"), frame)
+            saved += 1
+            time.sleep(interval)
+    finally:
+        worker.stop()
+    print(f"✅ {saved} frame disimpan di {out_dir}")
+
+
+def load_detection_frames(frames_dir, limit=None):
+    names = sorted(n for n in os.listdir(frames_dir) if n.lower().endswith((".jpg", ".jpeg", ".png")))
+    if limit:
+        names = names[:limit]
+    frames = []
+    for name in names:
+        image = cv2.imread(os.path.join(frames_dir, name), cv2.IMREAD_COLOR)
+        if image is not None:
+            frames.append(optimize_frame_for_detection(image)[0])
+    if not frames:
+        raise SystemExit(f"Tidak ada frame di {frames_dir}")
+    return frames
+
+
+# === Kuantisasi INT8 (post-training, dikalibrasi dengan frame kamera) ===
+def quantize_onnx(frames):
+    try:
+        from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+        from onnxruntime.quantization.shape_inference import quant_pre_process
+    except ImportError:
+        raise SystemExit("Kuantisasi ONNX membutuhkan paket onnxruntime")
+
+    class FrameReader(CalibrationDataReader):
+        def __init__(self, input_name):
+            self._items = iter([{input_name: frames_to_tensor([frame])} for frame in frames])
+
+        def get_next(self):
+            return next(self._items, None)
+
+    import onnx
+    fp32_path = default_model_path("onnxruntime")
+    int8_path = default_model_path("onnxruntime", int8=True)
+    prep_path = fp32_path.replace(".onnx", "-prep.onnx")
+    quant_pre_process(fp32_path, prep_path)
+    input_name = onnx.load(prep_path).graph.input[0].name
+    quantize_static(
+        prep_path, int8_path, FrameReader(input_name),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+    )
+    os.remove(prep_path)
+    print(f"✅ ONNX INT8: {int8_path}")
+
+
+def quantize_openvino(frames):
+    try:
+        import nncf
+        import openvino as ov
+    except ImportError:
+        print("⚠️ Kuantisasi OpenVINO membutuhkan paket openvino dan nncf, dilewati")
+        return
+    core = ov.Core()
+    fp32_path = default_model_path("openvino")
+    int8_path = default_model_path("openvino", int8=True)
+    dataset = nncf.Dataset(frames, lambda frame: frames_to_tensor([frame]))
+    quantized = nncf.quantize(core.read_model(fp32_path), dataset, preset=nncf.QuantizationPreset.MIXED,
+                              subset_size=len(frames))
+    ov.save_model(quantized, int8_path)
+    print(f"✅ OpenVINO INT8: {int8_path}")
+
+
+# === Laporan perbandingan latensi dan akurasi hitungan ===
+def count_people(detections):
+    return int(np.count_nonzero(detections[:, 4] > PERSON_MIN_CONF)) if len(detections) else 0
+
+
+def compare_backends(frames, variants, threads, repeats):
+    report = []
+    baseline_counts = None
+    for backend, int8 in variants:
+        label = backend + ("-int8" if int8 else "")
+        try:
+            engine = load_backend(backend, int8=int8, imgsz=IMGSZ, threads=threads)
+        except Exception as e:
+            report.append((label, None, str(e)))
+            continue
+
+        latencies = []
+        counts = []
+        for frame in frames:
+            for _ in range(repeats):
+                start = time.perf_counter()
+                detections = engine.predict([frame])[0]
+                latencies.append((time.perf_counter() - start) * 1000)
+            counts.append(count_people(detections))
+        counts = np.array(counts)
+        if baseline_counts is None:
+            baseline_counts = counts  # Varian pertama (PyTorch) menjadi acuan
+
+        latencies = np.array(latencies)
+        report.append((label, {
+            "mean_ms": latencies.mean(),
+            "p95_ms": np.percentile(latencies, 95),
+            "fps": 1000 / latencies.mean(),
+            "exact": np.mean(counts == baseline_counts) * 100,
+            "mae": np.abs(counts - baseline_counts).mean(),
+        }, None))
+
+    print(f"\nPerbandingan backend ({len(frames)} frame, input {IMGSZ}, {threads or 'default'} thread)\n")
+    print("| Backend | Rata-rata ms | p95 ms | FPS | Hitungan sama (%) | MAE hitungan |")
+    print("|---|---:|---:|---:|---:|---:|")
+    base_mean = None
+    for label, stats, error in report:
+        if stats is None:
+            print(f"| {label} | — | — | — | — | dilewati: {error} |")
+            continue
+        base_mean = base_mean or stats["mean_ms"]
+        print(f"| {label} | {stats['mean_ms']:.2f} ({base_mean / stats['mean_ms']:.2f}x) | {stats['p95_ms']:.2f} | "
+              f"{stats['fps']:.1f} | {stats['exact']:.1f} | {stats['mae']:.3f} |")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_export = sub.add_parser("export", help="Ekspor yolov8n ke ONNX/OpenVINO (input 320, head orang)")
+    p_export.add_argument("--weights", default="yolov8n.pt")
+    p_export.add_argument("--no-openvino", action="store_true")
+
+    p_record = sub.add_parser("record", help="Rekam frame ESP32-CAM untuk kalibrasi INT8")
+    p_record.add_argument("--url", required=True)
+    p_record.add_argument("--frames", type=int, default=300)
+    p_record.add_argument("--interval", type=float, default=1.0, help="Jeda antar frame (detik)")
+    p_record.add_argument("--out", default=CALIBRATION_DIR)
+
+    p_quant = sub.add_parser("quantize", help="Kuantisasi INT8 post-training dengan frame kamera")
+    p_quant.add_argument("--calib", default=CALIBRATION_DIR)
+    p_quant.add_argument("--limit", type=int, default=300)
+    p_quant.add_argument("--backend", choices=["onnxruntime", "openvino", "all"], default="all")
+
+    p_compare = sub.add_parser("compare", help="Laporan latensi dan akurasi hitungan vs PyTorch")
+    p_compare.add_argument("--frames", default=CALIBRATION_DIR)
+    p_compare.add_argument("--limit", type=int, default=200)
+    p_compare.add_argument("--threads", type=int, default=None)
+    p_compare.add_argument("--repeats", type=int, default=3)
+    p_compare.add_argument("--backends", nargs="+", default=[
+        "pytorch", "onnxruntime", "onnxruntime-int8", "openvino", "openvino-int8"
+    ], help=f"Pilihan: {', '.join(BACKENDS)} (+ akhiran -int8)")
+
+    args = parser.parse_args()
+    if args.command == "export":
+        export_models(args.weights, openvino=not args.no_openvino)
+    elif args.command == "record":
+        record_frames(args.url, args.frames, args.out, args.interval)
+    elif args.command == "quantize":
+        frames = load_detection_frames(args.calib, args.limit)
+        if args.backend in ("onnxruntime", "all"):
+            quantize_onnx(frames)
+        if args.backend in ("openvino", "all"):
+            quantize_openvino(frames)
+    elif args.command == "compare":
+        variants = []
+        for name in args.backends:
+            backend, _, suffix = name.partition("-")
+            variants.append((backend, suffix == "int8"))
+        compare_backends(load_detection_frames(args.frames, args.limit), variants, args.threads, args.repeats)
+
+
+if __name__ == "__main__":
+    main()
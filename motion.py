@@ -0,0 +1,108 @@
+import time
+
+import cv2
+import numpy as np
+
+# === Motion Gate sebelum YOLO ===
+# Deteksi gerakan murah pada frame grayscale kecil (80x60) dengan model
+# background running-average. YOLO hanya dijalankan jika ada gerakan di ROI,
+# beberapa frame setelah gerakan berhenti (agar hitungan akhir akurat), atau
+# sebagai keep-alive berkala. Di luar itu hitungan terakhir dipertahankan.
+
+GATE_SIZE = (80, 60)
+
+
+def sensitivity_thresholds(sensitivity):
+    # Sensitivitas 1 (kurang peka) - 10 (sangat peka) -> (ambang piksel, luas minimal)
+    sensitivity = min(10, max(1, int(sensitivity)))
+    pixel_threshold = 40 - sensitivity * 3          # 37 .. 10 level abu-abu
+    min_area = 0.03 / sensitivity                   # 3% .. 0.3% piksel ROI
+    return pixel_threshold, min_area
+
+
+class MotionGate:
+    def __init__(self, sensitivity=5, roi=None, keepalive=30.0, settle_checks=3, learning_rate=0.05):
+        self.keepalive = keepalive
+        self.settle_checks = settle_checks
+        self.learning_rate = learning_rate
+        self.roi = None
+        self._mask = None
+        self.configure(sensitivity, roi)
+
+        self._background = None
+        self._settle_remaining = 0
+        self._last_inference = 0.0
+
+        # Statistik untuk melihat penghematan CPU
+        self.checks = 0
+        self.skipped = 0
+        self.motion_triggers = 0
+        self.keepalive_triggers = 0
+        self.motion_level = 0.0
+
+    def configure(self, sensitivity=5, roi=None):
+        # roi: (x1, y1, x2, y2) dalam pecahan 0..1 dari lebar/tinggi frame, None = seluruh frame
+        self.sensitivity = sensitivity
+        self.pixel_threshold, self.min_area = sensitivity_thresholds(sensitivity)
+        if roi != self.roi:
+            self.roi = roi
+            self._mask = None
+
+    def reset(self):
+        self._background = None
+        self._settle_remaining = 0
+        self._last_inference = 0.0
+
+    def _roi_mask(self):
+        if self._mask is None:
+            width, height = GATE_SIZE
+            mask = np.zeros((height, width), dtype=bool)
+            if self.roi:
+                x1, y1, x2, y2 = self.roi
+                mask[int(y1 * height):max(int(y2 * height), int(y1 * height) + 1),
+                     int(x1 * width):max(int(x2 * width), int(x1 * width) + 1)] = True
+            else:
+                mask[:] = True
+            self._mask = mask
+        return self._mask
+
+    def should_detect(self, frame, now=None):
+        if now is None:
+            now = time.time()
+        self.checks += 1
+
+        small = cv2.resize(frame, GATE_SIZE, interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+
+        if self._background is None:
+            # Frame pertama: belum ada background, selalu deteksi
+            self._background = gray.astype(np.float32)
+            return self._accept(now)
+
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self._background))
+        mask = self._roi_mask()
+        changed = np.count_nonzero((diff > self.pixel_threshold) & mask)
+        self.motion_level = changed / max(1, np.count_nonzero(mask))
+        cv2.accumulateWeighted(gray, self._background, self.learning_rate)
+
+        if self.motion_level >= self.min_area:
+            self._settle_remaining = self.settle_checks
+            self.motion_triggers += 1
+            return self._accept(now)
+        if self._settle_remaining > 0:
+            # Tetap deteksi beberapa kali setelah gerakan berhenti
+            self._settle_remaining -= 1
+            return self._accept(now)
+        if self.keepalive and now - self._last_inference >= self.keepalive:
+            self.keepalive_triggers += 1
+            return self._accept(now)
+
+        self.skipped += 1
+        return False
+
+    def _accept(self, now):
+        self._last_inference = now
+        return True
+
+    def skip_ratio(self):
+        return self.skipped / self.checks if self.checks else 0.0
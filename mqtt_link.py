@@ -0,0 +1,124 @@
+import json
+import threading
+import time
+from collections import deque
+
+import paho.mqtt.client as mqtt
+
+# === Koneksi MQTT Ubidots Bersama ===
+# Satu client paho per proses server. Status koneksi diperbarui langsung dari
+# callback paho (bukan hanya dihitung saat startup), paho menyambung ulang
+# sendiri dengan backoff, dan subscription dipasang ulang di setiap
+# on_connect. Callback berjalan di thread paho sehingga tidak menyentuh
+# st.session_state: pesan terakhir per topic dan log disimpan di sini untuk
+# dibaca oleh session. Log diberi nomor urut dan tidak dikosongkan saat
+# dibaca; setiap session membaca dari cursor-nya sendiri sehingga semua
+# viewer melihat setiap baris.
+
+
+class MqttLink:
+    def __init__(self, broker, port, token, topics=(), keepalive=60, min_reconnect=1, max_reconnect=60):
+        self.broker = broker
+        self.port = port
+        self.topics = list(topics)
+        self.keepalive = keepalive
+
+        self.client = mqtt.Client()
+        self.client.username_pw_set(token, "")
+        self.client.reconnect_delay_set(min_reconnect, max_reconnect)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_message = self._on_message
+
+        self._lock = threading.Lock()
+        self._messages = {}   # topic -> (seq, payload, waktu terima)
+        self._seq = 0
+        self._listeners = []  # Dipanggil (connected: bool) setiap status koneksi berubah
+        self._log = deque(maxlen=100)  # (nomor urut, teks)
+        self._log_seq = 0
+
+        self.connected = False
+        self.state_since = time.time()
+        self.connects = 0
+        self.disconnects = 0
+        self.last_error = None
+
+    def start(self):
+        # connect_async: gagal di awal tidak fatal, loop paho terus mencoba menyambung
+        self._add_log(f"🔌 Mencoba terhubung ke broker: {self.broker}:{self.port}")
+        self.client.connect_async(self.broker, self.port, self.keepalive)
+        self.client.loop_start()
+        return self
+
+    def stop(self):
+        self.client.disconnect()
+        self.client.loop_stop()
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def is_connected(self):
+        return self.connected and self.client.is_connected()
+
+    def publish(self, topic, payload, qos=1):
+        # True jika pesan diterima oleh client paho untuk dikirim
+        if not self.is_connected():
+            return False
+        info = self.client.publish(topic, payload, qos=qos)
+        return info.rc == mqtt.MQTT_ERR_SUCCESS
+
+    def latest(self, topic):
+        # (seq, payload, waktu) pesan terakhir pada topic, seq 0 jika belum ada
+        with self._lock:
+            return self._messages.get(topic, (0, None, 0.0))
+
+    def current_seq(self):
+        with self._lock:
+            return self._seq
+
+    def log_since(self, seq):
+        # (nomor urut terakhir, [teks]) untuk baris log setelah seq
+        with self._lock:
+            return self._log_seq, [text for line_seq, text in self._log if line_seq > seq]
+
+    def _add_log(self, text):
+        with self._lock:
+            self._log_seq += 1
+            self._log.append((self._log_seq, text))
+
+    # --- Callback paho (thread jaringan paho) ---
+    def _set_state(self, connected):
+        self.connected = connected
+        self.state_since = time.time()
+        for callback in list(self._listeners):
+            try:
+                callback(connected)
+            except Exception as e:
+                self._add_log(f"❌ Error listener MQTT: {e}")
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            self.connects += 1
+            self._add_log("✅ Terhubung ke Ubidots")
+            for topic in self.topics:
+                client.subscribe(topic)
+            self._set_state(True)
+        else:
+            self.last_error = f"kode {rc}"
+            self._add_log(f"❌ Gagal terhubung, kode: {rc}")
+
+    def _on_disconnect(self, client, userdata, rc):
+        if self.connected:
+            self.disconnects += 1
+            self._add_log(f"⚠️ Koneksi MQTT terputus (kode {rc}), menyambung ulang otomatis")
+        self._set_state(False)
+
+    def _on_message(self, client, userdata, msg):
+        try:
+            payload = json.loads(msg.payload)
+        except Exception as e:
+            self._add_log(f"Error MQTT: {e}")
+            return
+        with self._lock:
+            self._seq += 1
+            self._messages[msg.topic] = (self._seq, payload, time.time())
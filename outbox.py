@@ -0,0 +1,76 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# === Journal Telemetry Tahan Restart (store-and-forward) ===
+# Nilai yang gagal dikirim disimpan di SQLite (mode WAL) beserta timestamp
+# aslinya, lalu dikirim ulang bertahap setelah koneksi kembali. Ukuran
+# dibatasi jumlah baris dan umur data sehingga disk tidak penuh saat
+# broker lama tidak terjangkau.
+
+
+class TelemetryJournal:
+    def __init__(self, path, max_rows=500_000, max_age=7 * 86400, trim_every=200):
+        # 500 ribu baris (~30 MB) cukup untuk beberapa hari hitungan orang dan suhu
+        self.path = path
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.trim_every = trim_every
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, variable TEXT NOT NULL, value TEXT NOT NULL, ts REAL NOT NULL)"
+        )
+        self._since_trim = 0
+        self.dropped = 0  # Baris terhapus karena batas ukuran/umur
+
+    def append(self, entries):
+        # entries: {variabel: (nilai, timestamp detik)}
+        rows = [(var, json.dumps(val), ts) for var, (val, ts) in entries.items()]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany("INSERT INTO outbox (variable, value, ts) VALUES (?, ?, ?)", rows)
+            self._since_trim += len(rows)
+            if self._since_trim >= self.trim_every:
+                self._trim()
+
+    def peek(self, limit):
+        # Baris tertua lebih dulu: [(id, variabel, nilai, timestamp)]
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, variable, value, ts FROM outbox ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+        return [(row_id, var, json.loads(value), ts) for row_id, var, value, ts in rows]
+
+    def delete_through(self, last_id):
+        # Hapus semua baris sampai last_id (hasil peek yang sudah terkirim)
+        with self._lock:
+            self._conn.execute("DELETE FROM outbox WHERE id <= ?", (last_id,))
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def _trim(self):
+        self._since_trim = 0
+        cursor = self._conn.execute("DELETE FROM outbox WHERE ts < ?", (time.time() - self.max_age,))
+        self.dropped += max(0, cursor.rowcount)
+        cursor = self._conn.execute(
+            "DELETE FROM outbox WHERE id <= (SELECT id FROM outbox ORDER BY id DESC LIMIT 1 OFFSET ?)",
+            (self.max_rows,),
+        )
+        self.dropped += max(0, cursor.rowcount)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
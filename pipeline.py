@@ -0,0 +1,244 @@
+import itertools
+import threading
+import time
+import weakref
+from collections import deque
+
+from cameras import CameraRegistry
+from detector import DetectionBuffer, detect_people_batch, letterbox_params, scale_people_boxes
+
+# === Pipeline Kamera Bersama per Proses ===
+# Satu pipeline (capture + motion gate + YOLO + tracker) per proses server,
+# dipakai bersama oleh semua session browser. Kamera diidentifikasi dengan
+# URL-nya, jadi dua viewer dengan URL yang sama berbagi satu koneksi ke
+# ESP32-CAM dan satu alur inferensi. Subscriber pertama menyalakan capture,
+# subscriber terakhir yang pergi menghentikannya. Session hanya membaca
+# snapshot terbaru (frame, JPEG, box, hitungan) untuk ditampilkan.
+
+
+class Subscription:
+    # Langganan satu session; dilepas otomatis saat session dibuang
+    def __init__(self, pipeline, sub_id, configs, log):
+        self.pipeline = pipeline
+        self.sub_id = sub_id
+        self.configs = configs  # {camera_id: (url, count_variable, name)} milik session ini
+        self._log = log
+        self._generation = 0
+        self._finalizer = weakref.finalize(self, pipeline._unsubscribe, sub_id)
+
+    def update(self, configs):
+        if configs != self.configs:
+            self.configs = configs
+            self.pipeline._update(self.sub_id, configs)
+
+    def close(self):
+        self._finalizer()
+
+    @property
+    def active(self):
+        return self._finalizer.alive
+
+    def camera(self, camera_id):
+        config = self.configs.get(camera_id)
+        return self.pipeline.registry.get(config[0]) if config else None
+
+    def cameras(self):
+        # [(camera_id, count_variable, name, Camera)] sesuai konfigurasi session ini
+        cameras = []
+        for camera_id, (url, count_variable, name) in self.configs.items():
+            camera = self.pipeline.registry.get(url)
+            if camera is not None:
+                cameras.append((camera_id, count_variable, name, camera))
+        return cameras
+
+    def configure_motion_gate(self, enabled, sensitivity, roi, keepalive):
+        # Pengaturan berlaku untuk kamera ini di semua session (pengaturan terakhir menang)
+        urls = [url for url, _, _ in self.configs.values()]
+        self.pipeline.registry.configure_motion_gate(enabled, sensitivity, roi, keepalive, camera_ids=urls)
+
+    def wait(self, timeout):
+        # Tunggu snapshot baru; kembalikan camera_id session yang diperbarui sejak panggilan terakhir
+        self._generation, updated_urls = self.pipeline.wait_for_update(self._generation, timeout)
+        return [camera_id for camera_id, (url, _, _) in self.configs.items() if url in updated_urls]
+
+    def drain_log(self):
+        messages = []
+        while self._log:
+            messages.append(self._log.popleft())
+        return messages
+
+
+class CameraPipeline:
+    def __init__(self, inference_pool=None, model_lease=None, detection_period=0.5, detection_timeout=5.0):
+        self.registry = CameraRegistry()
+        self.inference_pool = inference_pool
+        self.model_lease = model_lease  # Model lokal jika tidak memakai worker inferensi
+        self.detection_period = detection_period  # Detik antar batch deteksi
+        self.detection_timeout = detection_timeout  # Batas tunggu hasil dari worker inferensi
+        self.motion_report_interval = 300.0
+
+        self._lock = threading.RLock()  # RLock: finalizer subscription bisa jalan di thread mana pun
+        self._subscribers = {}  # sub_id -> (configs, deque log)
+        self._ids = itertools.count(1)
+        self._thread = None
+        self._stop = None
+        self._cond = threading.Condition()
+        self._generation = 0
+        self._updated = {}  # url kamera -> generation snapshot terakhir
+        self._detection_buffer = DetectionBuffer()
+
+    # --- Langganan ---
+    def subscribe(self, configs):
+        log = deque(maxlen=100)
+        with self._lock:
+            sub_id = next(self._ids)
+            self._subscribers[sub_id] = (configs, log)
+        self._sync()
+        return Subscription(self, sub_id, configs, log)
+
+    def _update(self, sub_id, configs):
+        with self._lock:
+            if sub_id in self._subscribers:
+                self._subscribers[sub_id] = (configs, self._subscribers[sub_id][1])
+        self._sync()
+
+    def _unsubscribe(self, sub_id):
+        with self._lock:
+            self._subscribers.pop(sub_id, None)
+        self._sync()
+
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def _sync(self):
+        # Kamera aktif = gabungan kamera semua subscriber, dengan URL sebagai kunci
+        with self._lock:
+            cameras = {}
+            for configs, _ in self._subscribers.values():
+                for url, _, name in configs.values():
+                    cameras.setdefault(url, (url, None, name))
+            self.registry.sync(cameras)
+            if cameras:
+                self.registry.start_all()
+                if self._thread is None or not self._thread.is_alive():
+                    # Event stop baru per thread agar thread lama yang belum selesai tetap berhenti
+                    self._stop = threading.Event()
+                    self._thread = threading.Thread(
+                        target=self._run, args=(self._stop,), name="camera-pipeline", daemon=True
+                    )
+                    self._thread.start()
+            elif self._thread is not None:
+                self._stop.set()
+                self._thread = None
+                self.registry.stop_all()
+
+    def _broadcast(self, messages):
+        if not messages:
+            return
+        with self._lock:
+            logs = [log for _, log in self._subscribers.values()]
+        for log in logs:
+            log.extend(messages)
+
+    # --- Snapshot untuk session ---
+    def wait_for_update(self, generation, timeout):
+        with self._cond:
+            self._cond.wait_for(lambda: self._generation > generation, timeout)
+            updated = {url for url, gen in self._updated.items() if gen > generation}
+            return self._generation, updated
+
+    def _publish(self, cameras, now):
+        if not cameras:
+            return
+        for camera in cameras:
+            camera.publish(now)
+        with self._cond:
+            self._generation += 1
+            for camera in cameras:
+                self._updated[camera.camera_id] = self._generation
+            self._cond.notify_all()
+
+    # --- Thread capture + deteksi ---
+    def _run(self, stop):
+        last_detection_time = 0.0
+        last_motion_report = time.time()
+        inflight_batch = None  # (batch_id, kamera, frame, waktu submit) yang sedang diproses worker
+
+        while not stop.is_set():
+            try:
+                # Pindahkan log dari thread capture ke semua subscriber
+                self._broadcast(self.registry.drain_logs())
+
+                # Ambil frame terbaru tiap kamera tanpa mengantri di belakang frame lama
+                updated = set(self.registry.wait_for_frames(timeout=0.1))
+
+                now = time.time()
+                if inflight_batch is None and now - last_detection_time >= self.detection_period:
+                    inflight_batch, detected = self._detect(now)
+                    updated.update(detected)
+                    last_detection_time = now
+
+                # Ambil hasil batch dari worker inferensi jika sudah selesai (non-blocking)
+                if inflight_batch is not None:
+                    done, detected = self._poll_batch(inflight_batch)
+                    updated.update(detected)
+                    if done:
+                        inflight_batch = None
+
+                self._publish(updated, time.time())
+
+                # Laporkan penghematan motion gate setiap 5 menit
+                if now - last_motion_report > self.motion_report_interval:
+                    gate_checks, gate_skipped = self.registry.motion_gate_stats()
+                    if gate_checks:
+                        self._broadcast([
+                            f"🏃 Motion gate: {gate_skipped} dari {gate_checks} inferensi dilewati ({gate_skipped / gate_checks:.0%})"
+                        ])
+                    last_motion_report = now
+            except Exception as e:
+                self._broadcast([f"❌ Error pipeline kamera: {str(e)}"])
+                stop.wait(0.1)
+
+        if inflight_batch is not None:
+            self.inference_pool.cancel(inflight_batch[0])
+
+    def _detect(self, now):
+        # Motion gate menyaring kamera yang statis sebelum batch YOLO
+        batch = self.registry.pending_detection(now)
+        if not batch:
+            return None, []
+        frames = [camera.take_for_detection() for camera in batch]
+        try:
+            if self.inference_pool is not None:
+                # Kirim batch ke worker inferensi tanpa menunggu hasilnya
+                # (frame di-letterbox langsung ke shared memory worker)
+                batch_id = self.inference_pool.submit(frames)
+                return ((batch_id, batch, frames, now) if batch_id is not None else None), []
+            # Deteksi semua kamera dalam satu panggilan backend
+            batch_boxes = detect_people_batch(self.model_lease.model, frames, self._detection_buffer)
+            for camera, boxes in zip(batch, batch_boxes):
+                camera.update_detection(boxes, now)
+        except Exception as e:
+            self._broadcast([f"⚠️ Detection error: {str(e)[:50]}"])
+            for camera in batch:
+                camera.hold_detection()
+        return None, batch
+
+    def _poll_batch(self, inflight_batch):
+        batch_id, batch, frames, submitted = inflight_batch
+        try:
+            detections = self.inference_pool.poll(batch_id)
+            if detections is not None:
+                for camera, frame, dets in zip(batch, frames, detections):
+                    letterbox = letterbox_params(frame.shape, self.inference_pool.input_size)
+                    camera.update_detection(scale_people_boxes(frame, letterbox, dets), submitted)
+                return True, batch
+            if time.time() - submitted <= self.detection_timeout:
+                return False, []
+            self.inference_pool.cancel(batch_id)
+            self._broadcast(["⚠️ Detection timeout pada worker inferensi"])
+        except Exception as e:
+            self._broadcast([f"⚠️ Detection error: {str(e)[:50]}"])
+        for camera in batch:
+            camera.hold_detection()
+        return True, batch
@@ -0,0 +1,89 @@
+import time
+
+import cv2
+
+# === Preview Kamera dalam JPEG ===
+# Preview dikirim ke browser sebagai byte JPEG supaya Streamlit tidak perlu
+# encode ulang array RGB. Tanpa overlay (tidak ada box/ROI) byte JPEG asli
+# dari stream MJPEG dipakai langsung. Jika perlu encode, kualitas dan lebar
+# gambar disesuaikan dengan laju update yang terukur dan budget byte per
+# detik, sehingga link remote yang lambat tidak tertinggal.
+
+
+class PreviewEncoder:
+    def __init__(self, budget_kbps=250, quality=80, min_quality=35, max_quality=90, min_width=160):
+        self.budget = budget_kbps * 1024   # Byte per detik untuk satu preview
+        self.quality = quality
+        self.min_quality = min_quality
+        self.max_quality = max_quality
+        self.min_width = min_width
+        self.width = None                  # None = lebar frame asli
+
+        self._last_render = None
+
+        # Statistik (EWMA) untuk panel detail
+        self.update_rate = 0.0             # Update preview per detik yang benar-benar terkirim
+        self.frame_bytes = 0.0
+        self.render_ms = 0.0
+        self.frames = 0
+        self.reused = 0
+
+    def frame_budget(self):
+        # Byte maksimal per frame agar update_rate x ukuran frame <= budget
+        return self.budget / max(self.update_rate, 1.0)
+
+    def encode(self, frame, jpeg=None, overlay=None):
+        # overlay: fungsi yang menggambar di salinan frame, None jika tidak ada yang digambar
+        if overlay is None and jpeg is not None and len(jpeg) <= self.frame_budget():
+            self.reused += 1
+            return jpeg
+
+        image = frame.copy() if overlay is not None else frame
+        if overlay is not None:
+            overlay(image)
+        height, width = image.shape[:2]
+        if self.width and self.width < width:
+            size = (self.width, max(1, height * self.width // width))
+            image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            raise RuntimeError("Gagal encode preview JPEG")
+        data = encoded.tobytes()
+        self._adapt(len(data), width)
+        return data
+
+    def show(self, placeholder, frame, jpeg=None, overlay=None, caption=None):
+        start = time.perf_counter()
+        data = self.encode(frame, jpeg, overlay)
+        placeholder.image(data, caption=caption, output_format="JPEG", use_container_width=True)
+        self._record(len(data), time.perf_counter() - start)
+
+    def _adapt(self, size, frame_width):
+        budget = self.frame_budget()
+        if size > budget * 1.1:
+            # Turunkan kualitas dulu, baru ukuran gambar
+            if self.quality > self.min_quality:
+                self.quality = max(self.min_quality, self.quality - 5)
+            else:
+                self.width = max(self.min_width, int((self.width or frame_width) * 0.8))
+        elif size < budget * 0.6:
+            if self.width is not None:
+                self.width = None if self.width * 1.25 >= frame_width else int(self.width * 1.25)
+            elif self.quality < self.max_quality:
+                self.quality = min(self.max_quality, self.quality + 5)
+
+    def _record(self, size, elapsed, alpha=0.2):
+        now = time.time()
+        if self._last_render is not None:
+            rate = 1.0 / max(now - self._last_render, 1e-3)
+            self.update_rate = rate if not self.update_rate else self.update_rate + alpha * (rate - self.update_rate)
+        self._last_render = now
+        self.frame_bytes = size if not self.frames else self.frame_bytes + alpha * (size - self.frame_bytes)
+        self.render_ms = elapsed * 1000 if not self.frames else self.render_ms + alpha * (elapsed * 1000 - self.render_ms)
+        self.frames += 1
+
+    def bytes_per_second(self):
+        return self.frame_bytes * self.update_rate
+
+    def reuse_ratio(self):
+        return self.reused / self.frames if self.frames else 0.0
@@ -0,0 +1,195 @@
+import threading
+import time
+
+import numpy as np
+
+# === Rollup Multi-Resolusi ===
+# Agregat per menit, per jam dan per hari untuk setiap seri time-series,
+# diperbarui setiap kali sampel masuk (listener TimeSeriesStore). Seri
+# diperlakukan sebagai fungsi tangga: nilai bertahan sampai sampel
+# berikutnya, sehingga integral per bucket langsung menjadi waktu nyala
+# (seri power) atau orang-detik (seri people), dan rata-rata adalah rata-rata
+# berbobot waktu. Jeda antar sampel yang lebih panjang dari max_hold (mis.
+# server mati) dianggap tidak diketahui dan tidak dihitung. Grafik dan
+# ringkasan 30 hari cukup membaca baris bucket.
+
+RESOLUTIONS = {"minute": 60, "hour": 3600, "day": 86400}
+# Jumlah bucket yang disimpan per resolusi: 2 hari, 90 hari, 3 tahun
+MAX_BUCKETS = {"minute": 2 * 1440, "hour": 90 * 24, "day": 3 * 365}
+# Nilai paling lama dianggap bertahan tanpa sampel baru (3x keepalive TimeSeriesStore)
+MAX_HOLD = 900.0
+
+BUCKET_DTYPE = np.dtype([
+    ("start", "<f8"),     # Awal bucket (detik epoch)
+    ("covered", "<f8"),   # Detik dalam bucket yang punya nilai
+    ("integral", "<f8"),  # Jumlah nilai x detik
+    ("min", "<f4"),
+    ("max", "<f4"),
+])
+
+
+class Rollup:
+    # Bucket satu seri pada satu resolusi; baris terakhir adalah bucket yang masih terbuka
+    def __init__(self, width, capacity):
+        self.width = width
+        self.capacity = capacity
+        self.rows = np.zeros(capacity * 2, dtype=BUCKET_DTYPE)
+        self.size = 0
+
+    def _bucket(self, start):
+        if self.size and self.rows[self.size - 1]["start"] == start:
+            return self.size - 1
+        if self.size == len(self.rows):
+            # Buang setengah bucket tertua sekaligus (amortized O(1))
+            keep = self.capacity
+            self.rows[:keep] = self.rows[self.size - keep:self.size]
+            self.size = keep
+        row = self.rows[self.size]
+        row["start"], row["covered"], row["integral"] = start, 0.0, 0.0
+        row["min"], row["max"] = np.inf, -np.inf
+        self.size += 1
+        return self.size - 1
+
+    def hold(self, value, t0, t1):
+        # Nilai value bertahan dari t0 sampai t1, dipecah di batas bucket
+        start = t0 - t0 % self.width
+        while True:
+            row = self.rows[self._bucket(start)]  # View ke baris array
+            seconds = max(0.0, min(start + self.width, t1) - max(start, t0))
+            row["covered"] += seconds
+            row["integral"] += value * seconds
+            row["min"] = min(row["min"], value)
+            row["max"] = max(row["max"], value)
+            start += self.width
+            if start >= t1:
+                break
+
+    def load(self, rows):
+        rows = rows[-self.capacity:]
+        self.rows[:len(rows)] = rows
+        self.size = len(rows)
+
+    def view(self, start=None, end=None):
+        rows = self.rows[:self.size]
+        lo = 0 if start is None else np.searchsorted(rows["start"], start, side="left")
+        hi = self.size if end is None else np.searchsorted(rows["start"], end, side="left")
+        return rows[lo:hi].copy()
+
+
+def aggregate(t, v, width, end, max_hold=np.inf):
+    # Bucket dari sampel mentah (vektor, untuk mengisi rollup dari penyimpanan saat start)
+    if not len(t):
+        return np.zeros(0, dtype=BUCKET_DTYPE)
+    # Sampel yang diikuti jeda lebih dari max_hold tidak bertahan sama sekali
+    unknown = np.diff(np.r_[t, end]) > max_hold
+    first = t[0] - t[0] % width
+    boundaries = np.arange(first + width, end, width)
+    # Sisipkan batas bucket ke garis waktu dengan nilai yang sedang berlaku
+    held = v[np.searchsorted(t, boundaries, side="right") - 1]
+    times = np.concatenate([t, boundaries, [end]])
+    values = np.concatenate([v, held, [v[-1]]]).astype(np.float64)
+    order = np.argsort(times, kind="stable")
+    times, values = times[order], values[order]
+    seconds = np.diff(times)
+    gaps = unknown[np.searchsorted(t, times[:-1], side="right") - 1]
+    seconds[gaps] = 0.0
+    values[:-1][gaps] = np.nan  # Tidak ikut min/maks
+    buckets = ((times[:-1] - first) // width).astype(np.int64)
+    count = int(buckets[-1]) + 1
+    rows = np.zeros(count, dtype=BUCKET_DTYPE)
+    rows["start"] = first + np.arange(count) * width
+    rows["covered"] = np.bincount(buckets, weights=seconds, minlength=count)
+    rows["integral"] = np.bincount(buckets, weights=np.where(gaps, 0.0, values[:-1] * seconds), minlength=count)
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    present = buckets[starts]
+    rows["min"], rows["max"] = np.inf, -np.inf
+    rows["min"][present] = np.fmin.reduceat(values[:-1], starts)
+    rows["max"][present] = np.fmax.reduceat(values[:-1], starts)
+    return rows[rows["covered"] > 0]
+
+
+class RollupEngine:
+    def __init__(self, resolutions=RESOLUTIONS, max_buckets=MAX_BUCKETS, max_hold=MAX_HOLD):
+        self.resolutions = dict(resolutions)
+        self.max_buckets = dict(max_buckets)
+        self.max_hold = max_hold  # Jeda antar sampel yang lebih lama dari ini tidak dihitung
+        self._lock = threading.Lock()
+        self._rollups = {}  # (seri, resolusi) -> Rollup
+        self._last = {}     # seri -> (waktu, nilai) sampel terakhir
+        self.updates = 0
+
+    def attach(self, store, backfill_days=None):
+        # Isi dari riwayat yang sudah ada, lalu ikuti sampel baru
+        self.backfill(store, backfill_days)
+        store.add_listener(self.add)
+
+    def backfill(self, store, days=None):
+        now = time.time()
+        days = days if days is not None else store.retention_days
+        for series in store.series():
+            samples = store.query(series, now - days * 86400, now + 1)
+            if not len(samples):
+                continue
+            t, v = samples["t"], samples["v"].astype(np.float64)
+            with self._lock:
+                for name, width in self.resolutions.items():
+                    since = now - self.max_buckets[name] * width
+                    mask = t >= since
+                    if mask.any():
+                        rollup = self._rollup(series, name)
+                        # Bucket terakhir tetap terbuka: diisi sampai sampel terakhir
+                        rollup.load(aggregate(t[mask], v[mask], width, t[-1], self.max_hold))
+                self._last[series] = (float(t[-1]), float(v[-1]))
+
+    def add(self, series, timestamp, value):
+        with self._lock:
+            last = self._last.get(series)
+            self._last[series] = (timestamp, value)
+            if last is None:
+                t0, held = timestamp, value
+            else:
+                t0, held = last
+            for name in self.resolutions:
+                rollup = self._rollup(series, name)
+                if t0 < timestamp <= t0 + self.max_hold:
+                    rollup.hold(held, t0, timestamp)
+                rollup.hold(value, timestamp, timestamp)  # Bucket sampel baru selalu ada
+            self.updates += 1
+
+    def _rollup(self, series, name):
+        key = (series, name)
+        rollup = self._rollups.get(key)
+        if rollup is None:
+            rollup = self._rollups[key] = Rollup(self.resolutions[name], self.max_buckets[name])
+        return rollup
+
+    def buckets(self, series, resolution, start=None, end=None, closed_only=False):
+        # Baris bucket (start, covered, integral, min, max); bucket terbuka diisi sampai sekarang
+        with self._lock:
+            rollup = self._rollups.get((series, resolution))
+            if rollup is None:
+                return np.zeros(0, dtype=BUCKET_DTYPE)
+            rows = rollup.view(start, end)
+            last = self._last.get(series)
+        width = self.resolutions[resolution]
+        now = time.time()
+        if not len(rows) or rows[-1]["start"] + width <= now:
+            return rows
+        if closed_only:
+            return rows[:-1]
+        if last is not None:
+            # Nilai terakhir masih berlaku sampai sekarang
+            open_row = rows[-1]
+            extra = max(0.0, min(now, last[0] + self.max_hold) - max(last[0], open_row["start"]))
+            open_row["covered"] += extra
+            open_row["integral"] += last[1] * extra
+        return rows
+
+    def total(self, series, resolution, start, end):
+        # Integral dan durasi tercakup pada rentang waktu, dari baris bucket (tanpa scan sampel)
+        rows = self.buckets(series, resolution, start, end)
+        return float(rows["integral"].sum()), float(rows["covered"].sum())
+
+    def series(self, prefix=""):
+        with self._lock:
+            return sorted({series for series, _ in self._rollups if series.startswith(prefix)})
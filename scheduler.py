@@ -0,0 +1,271 @@
+import copy
+import datetime
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# === Mesin Jadwal Perangkat ===
+# Setiap jadwal (harian, mingguan, tanggal spesifik, termasuk rentang lewat
+# tengah malam seperti 18:00-06:00) diubah menjadi waktu transisi nyala/mati
+# berikutnya dan disimpan di heap. Thread scheduler tidur sampai transisi
+# terdekat lalu menjalankannya tepat waktu, tidak bergantung pada loop
+# kamera. Biaya per transisi O(log n) untuk n jadwal. Jadwal disimpan ke file
+# JSON sehingga setelah restart dimuat ulang; jika thread terlambat bangun
+# (server sempat berhenti/suspend) hanya transisi terakhir yang terlewat yang
+# dijalankan, selama masih dalam jendela catch-up.
+
+DAY_NAMES = ["Sen", "Sel", "Rab", "Kam", "Jum", "Sab", "Min"]
+
+
+def parse_clock(value):
+    hour, minute = map(int, value.split(":"))
+    return datetime.time(hour=hour, minute=minute)
+
+
+def schedule_ranges(schedule, day):
+    # Rentang (waktu nyala, waktu mati) yang dimulai pada tanggal day, None jika tidak aktif
+    if not schedule.get("enabled"):
+        return None
+    if schedule.get("date_specific"):
+        if day != schedule.get("specific_date"):
+            return None
+    elif schedule.get("days") and DAY_NAMES[day.weekday()] not in schedule["days"]:
+        return None
+    on_time, off_time = parse_clock(schedule["on_time"]), parse_clock(schedule["off_time"])
+    start = datetime.datetime.combine(day, on_time)
+    end = datetime.datetime.combine(day, off_time)
+    if end <= start:
+        end += datetime.timedelta(days=1)  # Rentang lewat tengah malam
+    return start, end
+
+
+def schedule_transitions(schedule, first_day, last_day):
+    # [(datetime, "on"/"off")] untuk rentang yang dimulai antara first_day dan last_day
+    transitions = []
+    day = first_day
+    while day <= last_day:
+        span = schedule_ranges(schedule, day)
+        if span is not None:
+            transitions.append((span[0], "on"))
+            transitions.append((span[1], "off"))
+        day += datetime.timedelta(days=1)
+    return transitions
+
+
+def _transition_days(schedule, first_day, last_day):
+    # Jadwal tanggal spesifik dihitung langsung dari tanggalnya, berapa pun jauhnya
+    if schedule.get("date_specific") and schedule.get("specific_date"):
+        return schedule["specific_date"], schedule["specific_date"]
+    return first_day, last_day
+
+
+def next_transition(schedule, after):
+    # Transisi pertama setelah after; rentang kemarin ikut dihitung untuk jadwal lewat tengah malam
+    today = after.date()
+    days = _transition_days(schedule, today - datetime.timedelta(days=1), today + datetime.timedelta(days=7))
+    candidates = [t for t in schedule_transitions(schedule, *days) if t[0] > after]
+    return min(candidates) if candidates else None
+
+
+def previous_transition(schedule, at):
+    today = at.date()
+    days = _transition_days(schedule, today - datetime.timedelta(days=8), today)
+    candidates = [t for t in schedule_transitions(schedule, *days) if t[0] <= at]
+    return max(candidates) if candidates else None
+
+
+class ScheduleEngine:
+    def __init__(self, fire, catch_up=6 * 3600, late_grace=2.0, path=None):
+        self.fire = fire                # fire(key, action, values, waktu_jadwal) dipanggil dari thread scheduler
+        self.catch_up = catch_up        # Transisi terlewat lebih lama dari ini tidak dijalankan lagi
+        self.late_grace = late_grace    # Keterlambatan bangun yang masih dianggap tepat waktu
+        self.path = path                # File JSON jadwal (None = hanya di memori)
+
+        self._cond = threading.Condition()
+        self._heap = []                 # (timestamp, urutan, key, versi, aksi)
+        self._order = itertools.count()
+        self._schedules = {}            # key -> (schedule, payloads, versi)
+        self._versions = itertools.count(1)
+        self._revision = 0              # Naik setiap jadwal diubah/dihapus (session menyegarkan salinannya)
+        self._last_fired = {}           # key -> timestamp transisi terakhir yang dijalankan
+        self._events = deque(maxlen=200)  # (seq, key, aksi, timestamp, terlambat)
+        self._seq = 0
+        self._thread = None
+        self._stop = False
+
+        # Statistik untuk panel detail
+        self.fired = 0
+        self.caught_up = 0
+        self.skipped = 0
+        self.errors = 0
+        self.last_error = None
+
+    # --- Konfigurasi jadwal ---
+    def restore(self, keys=None):
+        # Muat jadwal dari file (mis. setelah restart); transisi terakhir yang terlewat ikut dijalankan
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError) as e:
+            self.last_error = f"Gagal memuat jadwal: {e}"
+            return
+        for key, schedule in stored.items():
+            if keys is not None and key not in keys:
+                continue
+            if schedule.get("specific_date"):
+                schedule["specific_date"] = datetime.date.fromisoformat(schedule["specific_date"])
+            self.set(key, schedule, save=False)
+
+    def set(self, key, schedule, payloads=None, save=True):
+        # payloads: {"on": {variabel: nilai}, "off": {...}} yang diteruskan ke fire saat transisi.
+        # Mengembalikan revisi jadwal setelah perubahan.
+        schedule = copy.deepcopy(schedule)
+        with self._cond:
+            current = self._schedules.get(key)
+            if current is not None and current[0] == schedule and current[1] == payloads:
+                return self._revision
+            version = next(self._versions)
+            self._schedules[key] = (schedule, payloads, version)
+            self._revision += 1
+            revision = self._revision
+            now = datetime.datetime.now()
+            missed = previous_transition(schedule, now) if current is None else None
+            if missed is not None and now.timestamp() - missed[0].timestamp() <= self.catch_up:
+                # Pertama kali terdaftar (mis. dimuat dari file setelah restart): jalankan dulu
+                # transisi terakhir yang terlewat, transisi berikutnya dijadwalkan setelahnya
+                self._push(missed[0].timestamp(), key, version, missed[1])
+            else:
+                self._push_next(key, schedule, version, now)
+            self._cond.notify()
+        self._ensure_thread()
+        if save:
+            self._save()
+        return revision
+
+    def remove(self, key):
+        with self._cond:
+            if self._schedules.pop(key, None) is None:  # Entri heap lama dilewati karena versinya tidak cocok
+                return
+            self._revision += 1
+            self._cond.notify()
+        self._save()
+
+    def schedules(self):
+        with self._cond:
+            return {key: copy.deepcopy(schedule) for key, (schedule, _, _) in self._schedules.items()}
+
+    def revision(self):
+        with self._cond:
+            return self._revision
+
+    def _save(self):
+        # Tulis ke file sementara lalu ganti, supaya file tidak pernah setengah tertulis
+        if not self.path:
+            return
+        stored = {key: schedule for key, schedule in self.schedules().items()}
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            temp = f"{self.path}.tmp"
+            with open(temp, "w", encoding="utf-8") as f:
+                json.dump(stored, f, indent=2, default=lambda value: value.isoformat())
+            os.replace(temp, self.path)
+        except OSError as e:
+            self.last_error = f"Gagal menyimpan jadwal: {e}"
+
+    def next_fire(self, key):
+        with self._cond:
+            entry = self._schedules.get(key)
+            if entry is None:
+                return None
+            return next_transition(entry[0], datetime.datetime.now())
+
+    # --- Event untuk session ---
+    def current_seq(self):
+        with self._cond:
+            return self._seq
+
+    def events_since(self, seq):
+        with self._cond:
+            return self._seq, [event for event in self._events if event[0] > seq]
+
+    # --- Thread scheduler ---
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+
+    def _ensure_thread(self):
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop = False
+                self._thread = threading.Thread(target=self._run, name="schedule-engine", daemon=True)
+                self._thread.start()
+
+    def _push(self, timestamp, key, version, action):
+        heapq.heappush(self._heap, (timestamp, next(self._order), key, version, action))
+
+    def _push_next(self, key, schedule, version, after):
+        upcoming = next_transition(schedule, after)
+        if upcoming is not None:
+            self._push(upcoming[0].timestamp(), key, version, upcoming[1])
+
+    def _pop_due(self):
+        # Tunggu sampai entri teratas jatuh tempo; kembalikan None jika diminta berhenti
+        with self._cond:
+            while not self._stop:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                timestamp, _, key, version, action = self._heap[0]
+                entry = self._schedules.get(key)
+                if entry is None or entry[2] != version:
+                    heapq.heappop(self._heap)  # Jadwal sudah diubah/dihapus
+                    continue
+                delay = timestamp - time.time()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+                return self._resolve(key, entry, timestamp, action)
+            return None
+
+    def _resolve(self, key, entry, timestamp, action):
+        schedule, payloads, version = entry
+        now = datetime.datetime.now()
+        late = time.time() - timestamp > self.late_grace
+        if late:
+            # Terlambat bangun: transisi yang berlaku sekarang menggantikan yang terlewat
+            latest = previous_transition(schedule, now)
+            if latest is not None:
+                timestamp, action = latest[0].timestamp(), latest[1]
+        self._push_next(key, schedule, version, now if late else datetime.datetime.fromtimestamp(timestamp))
+        if timestamp <= self._last_fired.get(key, 0.0) or time.time() - timestamp > self.catch_up:
+            self.skipped += 1
+            return False
+        self._last_fired[key] = timestamp
+        self._seq += 1
+        self._events.append((self._seq, key, action, timestamp, late))
+        if late:
+            self.caught_up += 1
+        return key, action, dict((payloads or {}).get(action, {})), timestamp
+
+    def _run(self):
+        while True:
+            due = self._pop_due()
+            if due is None:
+                return
+            if due is False:
+                continue
+            key, action, values, timestamp = due
+            try:
+                self.fire(key, action, values, timestamp)
+                self.fired += 1
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e)
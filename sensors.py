@@ -0,0 +1,126 @@
+import threading
+import time
+
+import requests
+
+# === Cache Nilai Sensor (push MQTT + fallback HTTP) ===
+# Nilai sensor dari ESP32 (mis. suhu DHT11) diterima lewat subscription MQTT
+# pada link bersama, sehingga membaca suhu di loop kamera hanya membaca
+# cache tanpa I/O jaringan. Thread poller hanya memanggil REST API Ubidots
+# saat MQTT terputus atau belum pernah menerima nilai, dengan timeout ketat
+# dan request kondisional (ETag/Last-Modified) supaya poll yang tidak
+# berubah murah.
+
+UBIDOTS_VALUES_URL = "https://industrial.api.ubidots.com/api/v1.6/devices/{device}/{variable}/values/"
+UBIDOTS_VARIABLE_TOPIC = "/v2.0/devices/{device}/{variable}"
+
+
+def variable_topic(device_label, variable):
+    return UBIDOTS_VARIABLE_TOPIC.format(device=device_label, variable=variable)
+
+
+class SensorCache:
+    def __init__(self, link, device_label, token, variables, poll_interval=30.0, http_timeout=(3.05, 5.0)):
+        self.link = link                    # MqttLink yang sudah subscribe ke topic variabel
+        self.device_label = device_label
+        self.token = token
+        self.variables = list(variables)
+        self.poll_interval = poll_interval  # Jeda poll HTTP saat MQTT tidak tersedia
+        self.http_timeout = http_timeout
+
+        self._lock = threading.Lock()
+        self._polled = {}                   # variabel -> (nilai, timestamp)
+        self._validators = {}               # variabel -> header kondisional dari respons terakhir
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._session = None
+
+        # Statistik untuk panel detail
+        self.polls = 0
+        self.not_modified = 0
+        self.errors = 0
+        self.last_error = None
+
+    def topics(self):
+        return [variable_topic(self.device_label, var) for var in self.variables]
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sensor-poller", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def refresh(self):
+        # Minta poll HTTP segera (tombol Refresh); tidak menunggu hasilnya
+        self._wakeup.set()
+
+    def get(self, variable):
+        # (nilai, timestamp, sumber) terbaru dari MQTT atau poll HTTP, None jika belum ada
+        candidates = []
+        seq, payload, received = self.link.latest(variable_topic(self.device_label, variable))
+        if seq and isinstance(payload, dict) and "value" in payload:
+            timestamp = payload.get("timestamp")
+            candidates.append((payload["value"], timestamp / 1000 if timestamp else received, "mqtt"))
+        with self._lock:
+            polled = self._polled.get(variable)
+        if polled is not None:
+            candidates.append((polled[0], polled[1], "http"))
+        return max(candidates, key=lambda c: c[1]) if candidates else None
+
+    def _needs_poll(self, variable):
+        if not self.link.is_connected():
+            return True
+        seq, _, _ = self.link.latest(variable_topic(self.device_label, variable))
+        return not seq
+
+    # --- Thread poller ---
+    def _run(self):
+        forced = True  # Poll sekali saat start supaya cache langsung terisi
+        while not self._stop.is_set():
+            for variable in self.variables:
+                if forced or self._needs_poll(variable):
+                    self._poll(variable)
+            forced = self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _poll(self, variable):
+        url = UBIDOTS_VALUES_URL.format(device=self.device_label, variable=variable)
+        headers = self._validators.get(variable, {})
+        self.polls += 1
+        try:
+            response = self._http_session().get(
+                url, params={"page_size": 1}, headers=headers, timeout=self.http_timeout
+            )
+            if response.status_code == 304:
+                self.not_modified += 1
+                return
+            if response.status_code != 200:
+                raise RuntimeError(f"HTTP {response.status_code}")
+            validators = {}
+            if response.headers.get("ETag"):
+                validators["If-None-Match"] = response.headers["ETag"]
+            if response.headers.get("Last-Modified"):
+                validators["If-Modified-Since"] = response.headers["Last-Modified"]
+            self._validators[variable] = validators
+            results = response.json().get("results") or []
+            if results:
+                timestamp = results[0].get("timestamp")
+                with self._lock:
+                    self._polled[variable] = (results[0]["value"], timestamp / 1000 if timestamp else time.time())
+            self.last_error = None
+        except Exception as e:
+            self.errors += 1
+            self.last_error = str(e)
+
+    def _http_session(self):
+        if self._session is None:
+            session = requests.Session()
+            session.headers.update({"X-Auth-Token": self.token})
+            self._session = session
+        return self._session
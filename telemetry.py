@@ -0,0 +1,244 @@
+import json
+import threading
+import time
+
+import requests
+
+# === Format Telemetry Ubidots ===
+# Beberapa variabel dikirim sebagai satu dokumen JSON ke topic/endpoint
+# device, sehingga satu siklus telemetry hanya butuh satu publish MQTT atau
+# satu POST HTTP.
+
+UBIDOTS_HTTP_URL = "https://industrial.api.ubidots.com/api/v1.6/devices/{device}"
+UBIDOTS_MQTT_TOPIC = "/v2.0/devices/{device}"
+
+
+def device_topic(device_label):
+    return UBIDOTS_MQTT_TOPIC.format(device=device_label)
+
+
+def device_url(device_label):
+    return UBIDOTS_HTTP_URL.format(device=device_label)
+
+
+def entries_payload(entries):
+    # entries: {variabel: (nilai, timestamp detik)} -> dokumen Ubidots dengan timestamp per variabel
+    return json.dumps(
+        {var: {"value": val, "timestamp": int(ts * 1000)} for var, (val, ts) in entries.items()},
+        separators=(",", ":"),
+    )
+
+
+def rows_payload(rows):
+    # rows dari journal: [(id, variabel, nilai, timestamp)] -> beberapa dot per variabel dalam satu dokumen
+    document = {}
+    for _, var, val, ts in rows:
+        document.setdefault(var, []).append({"value": val, "timestamp": int(ts * 1000)})
+    return json.dumps(document, separators=(",", ":"))
+
+
+def format_values(values):
+    return ", ".join(f"{var}={val}" for var, val in values.items())
+
+
+# === Dispatcher Telemetry di Background ===
+# Loop kamera hanya memasukkan nilai ke antrian (tanpa I/O jaringan). Nilai
+# untuk variabel yang sama digabung (nilai terakhir menang), nilai yang tidak
+# berubah melebihi dead-band dibuang, lalu thread dispatcher mengirim semua
+# yang tertunda dalam satu batch lewat MQTT atau HTTP (session keep-alive
+# dengan timeout ketat). Batch yang gagal terkirim disimpan di journal dan
+# dikirim ulang bertahap setelah koneksi kembali.
+
+
+class TelemetryDispatcher:
+    def __init__(self, device_label, token, deadband=0.0, deadbands=None, heartbeat=300.0,
+                 min_interval=1.0, retry_interval=5.0, max_pending=256, http_timeout=(3.05, 5.0),
+                 link=None, journal=None, replay_batch=200, replay_interval=2.0):
+        self.device_label = device_label
+        self.token = token
+        self.deadband = deadband              # Perubahan numerik minimal agar nilai dikirim
+        self.deadbands = deadbands or {}      # Dead-band khusus per variabel
+        self.heartbeat = heartbeat            # Nilai yang tidak berubah tetap dikirim ulang setelah N detik
+        self.min_interval = min_interval      # Jeda minimal antar batch (menggabungkan burst)
+        self.retry_interval = retry_interval  # Jeda sebelum mengirim ulang batch yang gagal
+        self.max_pending = max_pending
+        self.http_timeout = http_timeout
+        self.link = link                      # MqttLink; jika tidak terhubung, dikirim lewat HTTP
+        self.journal = journal                # TelemetryJournal untuk store-and-forward (opsional)
+        self.replay_batch = replay_batch      # Baris journal per batch kirim ulang
+        self.replay_interval = replay_interval  # Jeda antar batch kirim ulang
+
+        self._lock = threading.Lock()
+        self._pending = {}                    # variabel -> (nilai, timestamp)
+        self._last_accepted = {}              # variabel -> (nilai, timestamp) untuk dead-band
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._session = None
+        self._backlog = journal.count() if journal is not None else 0
+        if link is not None:
+            # Koneksi kembali: bangunkan dispatcher untuk mengirim ulang journal
+            link.add_listener(lambda connected: connected and self._wake())
+
+        # Statistik untuk panel detail
+        self.submitted = 0
+        self.coalesced = 0
+        self.filtered = 0
+        self.overflow = 0
+        self.batches_sent = 0
+        self.values_sent = 0
+        self.errors = 0
+        self.last_error = None
+        self.last_sent = 0.0
+        self.last_latency = 0.0
+        self.journaled = 0
+        self.replayed = 0
+
+    # --- API untuk loop utama (tidak pernah menunggu jaringan) ---
+    def submit(self, values, timestamp=None, force=False):
+        # Kembalikan nilai yang benar-benar masuk antrian setelah filter dead-band.
+        # force: perintah eksplisit (pengguna, jadwal, aktuator) selalu dikirim; dead-band
+        # hanya untuk pengukuran, karena nilai di dashboard bisa diubah dari luar aplikasi.
+        now = timestamp if timestamp is not None else time.time()
+        accepted = {}
+        with self._lock:
+            for var, val in values.items():
+                self.submitted += 1
+                if not force and not self._should_send(var, val, now):
+                    self.filtered += 1
+                    continue
+                if var in self._pending:
+                    self.coalesced += 1
+                elif len(self._pending) >= self.max_pending:
+                    self.overflow += 1
+                    continue
+                self._pending[var] = (val, now)
+                self._last_accepted[var] = (val, now)
+                accepted[var] = val
+        if accepted:
+            self._wake()
+        return accepted
+
+    def _wake(self):
+        self._ensure_thread()
+        self._wakeup.set()
+
+    def backlog(self):
+        return self._backlog
+
+    def _should_send(self, var, val, now):
+        last = self._last_accepted.get(var)
+        if last is None or now - last[1] >= self.heartbeat:
+            return True
+        last_val = last[0]
+        if isinstance(val, (int, float)) and isinstance(last_val, (int, float)):
+            deadband = self.deadbands.get(var, self.deadband)
+            return abs(val - last_val) > deadband if deadband else val != last_val
+        return val != last_val
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self, timeout=5.0):
+        # Untuk shutdown: tunggu antrian kosong
+        self._wakeup.set()
+        deadline = time.time() + timeout
+        while self.pending() and time.time() < deadline:
+            time.sleep(0.05)
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+
+    # --- Thread dispatcher ---
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="telemetry-dispatcher", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            # Selama journal belum kosong, bangun berkala untuk kirim ulang bertahap
+            self._wakeup.wait(self.replay_interval if self._backlog else None)
+            self._wakeup.clear()
+            # Tunggu sisa min_interval supaya update beruntun tergabung dalam satu batch
+            remaining = self.min_interval - (time.time() - self.last_sent)
+            if remaining > 0 and self._stop.wait(remaining):
+                break
+            with self._lock:
+                entries, self._pending = self._pending, {}
+            if entries and not self._deliver(entries_payload(entries), len(entries)):
+                self._store(entries)
+                if self.journal is None:
+                    if self._stop.wait(self.retry_interval):
+                        break
+                    self._wakeup.set()
+                continue
+            if self._backlog and not self._replay() and self._stop.wait(self.retry_interval):
+                break
+
+    def _store(self, entries):
+        if self.journal is None:
+            self._requeue(entries)
+            return
+        # Simpan ke disk dengan timestamp asli, dikirim ulang setelah koneksi kembali
+        try:
+            self.journal.append(entries)
+            self.journaled += len(entries)
+            self._backlog = self.journal.count()  # Journal bisa memangkas baris lama
+        except Exception as e:
+            self.last_error = f"journal: {e}"
+            self._requeue(entries)
+
+    def _requeue(self, entries):
+        # Nilai yang gagal dikirim kembali ke antrian, kecuali sudah ada nilai lebih baru
+        with self._lock:
+            for var, entry in entries.items():
+                if var not in self._pending and len(self._pending) < self.max_pending:
+                    self._pending[var] = entry
+
+    def _replay(self):
+        rows = self.journal.peek(self.replay_batch)
+        if not rows:
+            self._backlog = 0
+            return True
+        if not self._deliver(rows_payload(rows), len(rows)):
+            return False
+        self.journal.delete_through(rows[-1][0])
+        self.replayed += len(rows)
+        self._backlog = self.journal.count()
+        return True
+
+    def _deliver(self, payload, count):
+        start = time.time()
+        try:
+            if self.link is None or not self.link.publish(device_topic(self.device_label), payload):
+                response = self._http_session().post(
+                    device_url(self.device_label), data=payload, timeout=self.http_timeout
+                )
+                if response.status_code not in (200, 201):
+                    raise RuntimeError(f"HTTP {response.status_code}: {response.text[:80]}")
+            self.batches_sent += 1
+            self.values_sent += count
+            self.last_error = None
+            return True
+        except Exception as e:
+            self.errors += 1
+            self.last_error = str(e)
+            return False
+        finally:
+            self.last_sent = time.time()
+            self.last_latency = self.last_sent - start
+
+    def _http_session(self):
+        if self._session is None:
+            session = requests.Session()
+            session.headers.update({"X-Auth-Token": self.token, "Content-Type": "application/json"})
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=2, max_retries=0)
+            session.mount("https://", adapter)
+            self._session = session
+        return self._session
@@ -0,0 +1,191 @@
+import datetime
+import os
+import shutil
+import threading
+import time
+from urllib.parse import quote, unquote
+
+import numpy as np
+
+# === Penyimpanan Time-Series ===
+# Sampel (waktu, nilai) per seri, mis. "people/Ruang Utama" atau
+# "power/ac", dikumpulkan di memori lalu ditulis bertahap oleh thread
+# background sebagai array biner append-only: satu file per seri per hari
+# (data/timeseries/2026-10-18/people%2FRuang%20Utama.bin). Query rentang
+# waktu membuka file harian dengan memmap dan memotongnya dengan
+# searchsorted, sehingga data berbulan-bulan tidak dimuat ke list Python.
+# Direktori hari yang melewati masa retensi dihapus utuh. Seri state yang
+# jarang berubah (mis. power perangkat) dicatat ulang secara berkala, jadi
+# jeda panjang tanpa sampel berarti server mati, bukan nilai yang bertahan.
+
+SAMPLE_DTYPE = np.dtype([("t", "<f8"), ("v", "<f4")])
+
+
+def day_key(timestamp):
+    return datetime.date.fromtimestamp(timestamp).isoformat()
+
+
+class TimeSeriesStore:
+    def __init__(self, root, retention_days=90, flush_interval=5.0, resolution=1.0, keepalive=300.0):
+        self.root = root
+        self.retention_days = retention_days
+        self.flush_interval = flush_interval  # Detik antar penulisan batch ke disk
+        self.resolution = resolution          # Nilai sama dalam jeda ini tidak disimpan ulang (1 Hz)
+        self.keepalive = keepalive            # Seri state dicatat ulang jika tidak ada sampel selama ini
+
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._pending = {}                    # seri -> [(waktu, nilai)]
+        self._last = {}                       # seri -> (waktu, nilai) sampel terakhir yang diterima
+        self._listeners = []                  # Dipanggil (seri, waktu, nilai) untuk setiap sampel yang disimpan
+        self._kept = set()                    # Seri state yang dicatat ulang setiap keepalive
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_retention = 0.0
+
+        # Statistik untuk panel detail
+        self.samples = 0
+        self.skipped = 0
+        self.flushes = 0
+        self.bytes_written = 0
+        self.last_flush_ms = 0.0
+        self.last_error = None
+
+    # --- Penulisan (hot path: hanya menambah ke list di memori) ---
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def record(self, series, value, timestamp=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        value = float(value)
+        with self._lock:
+            last = self._last.get(series)
+            if last is not None and (timestamp < last[0] or (value == last[1] and timestamp - last[0] < self.resolution)):
+                self.skipped += 1
+                return False
+            self._last[series] = (timestamp, value)
+            self._pending.setdefault(series, []).append((timestamp, value))
+            self.samples += 1
+        for callback in self._listeners:
+            callback(series, timestamp, value)
+        self._ensure_thread()
+        return True
+
+    def record_many(self, values, timestamp=None):
+        # values: {seri: nilai} dengan waktu yang sama
+        timestamp = time.time() if timestamp is None else timestamp
+        for series, value in values.items():
+            self.record(series, value, timestamp)
+
+    def keep(self, series):
+        # Nilai terakhir seri ini tetap berlaku selama server hidup: catat ulang secara berkala
+        with self._lock:
+            self._kept.add(series)
+
+    def last(self, series):
+        with self._lock:
+            return self._last.get(series)
+
+    # --- Query ---
+    def series(self):
+        names = set(self._pending)
+        for day in self._days():
+            names.update(self._decode(name) for name in os.listdir(os.path.join(self.root, day)))
+        return sorted(names)
+
+    def query(self, series, start, end):
+        # Array (waktu, nilai) dengan start <= waktu < end, termasuk sampel yang belum ditulis
+        parts = []
+        first, last = day_key(start), day_key(end)
+        for day in self._days():
+            if day < first or day > last:
+                continue
+            path = self._path(day, series)
+            if not os.path.exists(path) or os.path.getsize(path) < SAMPLE_DTYPE.itemsize:
+                continue
+            samples = np.memmap(path, dtype=SAMPLE_DTYPE, mode="r")
+            lo, hi = np.searchsorted(samples["t"], [start, end])
+            if hi > lo:
+                parts.append(samples[lo:hi])  # Masih view memmap; disalin sekali saat digabung
+        with self._lock:
+            pending = [sample for sample in self._pending.get(series, ()) if start <= sample[0] < end]
+        if pending:
+            parts.append(np.array(pending, dtype=SAMPLE_DTYPE))
+        if not parts:
+            return np.empty(0, dtype=SAMPLE_DTYPE)
+        return np.concatenate(parts).view(np.ndarray)
+
+    # --- Thread penulis ---
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        start = time.perf_counter()
+        try:
+            for series, samples in pending.items():
+                array = np.array(samples, dtype=SAMPLE_DTYPE)
+                # Kelompokkan per hari; sampel satu seri selalu urut waktu
+                first, last = day_key(array["t"][0]), day_key(array["t"][-1])
+                if first == last:
+                    self._append(first, series, array)
+                else:
+                    keys = np.array([day_key(t) for t in array["t"]])
+                    for day in np.unique(keys):
+                        self._append(day, series, array[keys == day])
+            self.flushes += 1
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+        self.last_flush_ms = (time.perf_counter() - start) * 1000
+        if time.time() - self._last_retention > 3600:
+            self._apply_retention()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+        self.flush()
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="timeseries-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self._refresh_kept()
+            self.flush()
+
+    def _refresh_kept(self):
+        now = time.time()
+        with self._lock:
+            stale = [(series, self._last[series][1]) for series in self._kept
+                     if series in self._last and now - self._last[series][0] >= self.keepalive]
+        for series, value in stale:
+            self.record(series, value, now)
+
+    def _append(self, day, series, array):
+        path = self._path(day, series)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "ab") as f:
+            f.write(array.tobytes())
+        self.bytes_written += array.nbytes
+
+    def _apply_retention(self):
+        self._last_retention = time.time()
+        cutoff = day_key(time.time() - self.retention_days * 86400)
+        for day in self._days():
+            if day < cutoff:
+                shutil.rmtree(os.path.join(self.root, day), ignore_errors=True)
+
+    def _days(self):
+        return sorted(name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name)))
+
+    def _path(self, day, series):
+        return os.path.join(self.root, day, quote(series, safe="") + ".bin")
+
+    @staticmethod
+    def _decode(filename):
+        return unquote(filename[:-len(".bin")])
@@ -0,0 +1,178 @@
+import itertools
+
+import numpy as np
+from numpy.lib.recfunctions import structured_to_unstructured
+
+from detector import BOX_FIELDS, people_array
+
+# === Multi-Object Tracker Ringan (gaya SORT, hanya NumPy) ===
+# Setiap orang punya track dengan Kalman filter [cx, cy, s, r, vx, vy, vs]
+# (s = luas, r = rasio aspek). Deteksi YOLO dicocokkan ke track dengan IoU,
+# di antara deteksi box diprediksi berdasarkan waktu, sehingga YOLO bisa
+# berjalan jauh lebih jarang tanpa hitungan dan box yang berkedip.
+
+STATE_DIM = 7
+MEASURE_DIM = 4
+_MEASURE = np.eye(MEASURE_DIM, STATE_DIM)
+
+
+def iou_matrix(a, b):
+    # a: (N, 4), b: (M, 4) dalam format x1, y1, x2, y2
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def greedy_match(iou, threshold):
+    # Pasangan dengan IoU tertinggi lebih dulu; cukup untuk jumlah orang per kamera yang kecil
+    matches = []
+    if iou.size == 0:
+        return matches
+    order = np.dstack(np.unravel_index(np.argsort(-iou, axis=None), iou.shape))[0]
+    used_tracks = set()
+    used_dets = set()
+    for t, d in order:
+        if iou[t, d] < threshold:
+            break
+        if t in used_tracks or d in used_dets:
+            continue
+        matches.append((t, d))
+        used_tracks.add(t)
+        used_dets.add(d)
+    return matches
+
+
+def box_to_measurement(box):
+    x1, y1, x2, y2 = box[:4]
+    w = max(x2 - x1, 1.0)
+    h = max(y2 - y1, 1.0)
+    return np.array([x1 + w / 2, y1 + h / 2, w * h, w / h], dtype=np.float64)
+
+
+def state_to_box(state):
+    cx, cy, s, r = state[:4]
+    w = np.sqrt(max(s * r, 1.0))
+    h = max(s, 1.0) / w
+    return np.array([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2])
+
+
+class Track:
+    def __init__(self, track_id, box, score, now):
+        self.track_id = track_id
+        self.x = np.zeros(STATE_DIM)
+        self.x[:4] = box_to_measurement(box)
+        self.P = np.diag([10.0, 10.0, 10.0, 10.0, 1e4, 1e4, 1e4])
+        self.score = score
+        self.time = now
+        self.first_seen = now
+        self.last_seen = now
+        self.hits = 1
+        self.misses = 0  # Deteksi berturut-turut yang tidak cocok dengan track ini
+
+    def predict(self, now, velocity_decay=0.5):
+        dt = now - self.time
+        if dt <= 0:
+            return
+        F = np.eye(STATE_DIM)
+        F[0, 4] = F[1, 5] = F[2, 6] = dt
+        if self.x[2] + self.x[6] * dt <= 0:
+            self.x[6] = 0.0
+        self.x = F @ self.x
+        Q = np.diag([1.0, 1.0, 10.0, 0.01, 25.0, 25.0, 100.0]) * dt
+        self.P = F @ self.P @ F.T + Q
+        # Redam kecepatan agar prediksi tidak "terbang" saat YOLO lama tidak jalan
+        self.x[4:] *= velocity_decay ** dt
+        self.time = now
+
+    def update(self, box, score, now):
+        z = box_to_measurement(box)
+        R = np.diag([1.0, 1.0, 10.0, 0.01])
+        y = z - _MEASURE @ self.x
+        S = _MEASURE @ self.P @ _MEASURE.T + R
+        K = self.P @ _MEASURE.T @ np.linalg.inv(S)
+        self.x = self.x + K @ y
+        self.P = (np.eye(STATE_DIM) - K @ _MEASURE) @ self.P
+        self.score = score
+        self.last_seen = now
+        self.hits += 1
+        self.misses = 0
+
+    def box(self):
+        return state_to_box(self.x)
+
+
+class PeopleTracker:
+    def __init__(self, iou_threshold=0.2, max_misses=3, min_hits=2, new_track_conf=0.5):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses          # Track dihapus setelah N deteksi tanpa kecocokan
+        self.min_hits = min_hits              # Track baru dihitung setelah N kecocokan...
+        self.new_track_conf = new_track_conf  # ...kecuali confidence deteksi pertama tinggi
+        self.tracks = []
+        self._ids = itertools.count(1)
+        self.empty_since = None   # Waktu ruangan menjadi kosong (track terakhir hilang)
+        self.occupied_since = None
+
+    def reset(self):
+        self.tracks = []
+        self.empty_since = None
+        self.occupied_since = None
+
+    def predict(self, now):
+        for track in self.tracks:
+            track.predict(now)
+
+    def update(self, detections, now):
+        # detections: structured array PEOPLE_DTYPE dari satu frame (koordinat frame display)
+        self.predict(now)
+        dets = structured_to_unstructured(detections[BOX_FIELDS + ["conf"]], dtype=np.float64).reshape(-1, 5)
+        track_boxes = np.array([track.box() for track in self.tracks]).reshape(-1, 4)
+        matches = greedy_match(iou_matrix(track_boxes, dets[:, :4]), self.iou_threshold)
+
+        matched_tracks = set()
+        matched_dets = set()
+        for t, d in matches:
+            self.tracks[t].update(dets[d], float(dets[d, 4]), now)
+            matched_tracks.add(t)
+            matched_dets.add(d)
+
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.misses += 1
+        self.tracks = [track for track in self.tracks if track.misses < self.max_misses]
+
+        for d in range(len(dets)):
+            if d not in matched_dets:
+                self.tracks.append(Track(next(self._ids), dets[d], float(dets[d, 4]), now))
+
+        # Catat transisi kosong/terisi berdasarkan masa hidup track
+        occupied = self.count() > 0
+        if occupied and self.occupied_since is None:
+            self.occupied_since = now
+            self.empty_since = None
+        elif not occupied and self.empty_since is None:
+            self.empty_since = now
+            self.occupied_since = None
+
+    def confirmed(self):
+        return [
+            track for track in self.tracks
+            if track.hits >= self.min_hits or (track.hits == 1 and track.score >= self.new_track_conf)
+        ]
+
+    def count(self):
+        return len(self.confirmed())
+
+    def boxes(self):
+        # Structured array PEOPLE_DTYPE untuk track yang sudah terkonfirmasi
+        tracks = self.confirmed()
+        boxes = np.array([track.box() for track in tracks]).reshape(-1, 4)
+        return people_array(
+            boxes.astype(np.int32),
+            [track.score for track in tracks],
+            [track.track_id for track in tracks],
+        )